@@ -1,150 +1,119 @@
-import os
-import asyncio
-import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Tuple
-
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from fastapi.responses import JSONResponse
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-
-from app.services.parser_factory import ParserFactory
-from app.services.file_service import save_upload_to_temp
-from app.models import FileResponse
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse as FileDownloadResponse, PlainTextResponse, StreamingResponse
+
 from app.config import settings
+from app.services.batch_service import collect_batch_items, stream_batch
+from app.services.conversion_service import convert_document
+from app.services.profiler import PROFILE_ID_HEADER, is_admin, profile_request_for, profile_store
+from app.models import FileResponse
 from app.utils.logger import setup_logger
-from app.utils.pdf_utils import decide_should_ocr_file
+from app.utils.metrics import CONTENT_TYPE_LATEST, UPLOAD_READ_SECONDS, render_latest, timed
+from app.utils.json_response import FastJSONResponse
+from app.utils.page_selection import parse_page_ranges
 
 
 router = APIRouter()
 logger = setup_logger(__name__)
 
-# --- CONFIGURATION ---
+@router.get("/", summary="Health Check")
+def health_check():
+    return {"status": "ok"}
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
 
-HEAVY_EXTENSIONS = settings.heavy_extensions or {'pdf'}
+@router.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_latest(), media_type=CONTENT_TYPE_LATEST)
 
-# Cấu hình giới hạn Semaphore
-LIMIT_HEAVY = settings.max_concurrent_parser_heavy or 2  
-LIMIT_LIGHT = settings.max_concurrent_parser_light or 10 
 
-MAX_FILE_SIZE = settings.max_file_size * 1024 * 1024
-PARSE_TIMEOUT = settings.timeout or 300 
+def _require_admin(request: Request) -> None:
+    # ADMIN_TOKEN chưa cấu hình: endpoint admin coi như không tồn tại
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Sai hoặc thiếu X-Admin-Token")
 
-sem_heavy = asyncio.Semaphore(LIMIT_HEAVY)
-sem_light = asyncio.Semaphore(LIMIT_LIGHT)
 
-executor = ThreadPoolExecutor(max_workers=LIMIT_HEAVY + LIMIT_LIGHT + 4)
+@router.get("/admin/profiles", summary="Danh sách profile parse", include_in_schema=False)
+def list_profiles(request: Request):
+    _require_admin(request)
+    return FastJSONResponse(profile_store.list())
 
 
-@router.get("/", summary="Health Check")
-@limiter.limit(settings.rate_limit)
-def health_check(request: Request):
-    return {"status": "ok"}
+@router.get("/admin/profiles/{profile_id}", summary="Top-N hàm nóng của 1 profile", include_in_schema=False)
+def profile_summary(profile_id: str, request: Request, top: int = settings.profile_top_n):
+    _require_admin(request)
+    summary = profile_store.summary(profile_id, max(1, top))
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return FastJSONResponse(summary)
+
+
+@router.get("/admin/profiles/{profile_id}/download", summary="Tải profile (pstats)", include_in_schema=False)
+def download_profile(profile_id: str, request: Request):
+    _require_admin(request)
+    path = profile_store.stats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return FileDownloadResponse(path, media_type="application/octet-stream", filename=path.name)
+
 
+@router.post("/sdlc/convert-document", response_model=FileResponse, response_class=FastJSONResponse)
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    allow_partial: bool = Form(False, description="Hết time budget thì trả các trang đã xử lý xong thay vì 408"),
+    time_budget: Optional[float] = Form(None, gt=0, description="Thời gian tối đa (giây) cho request này"),
+    pages: Optional[str] = Form(None, description="Các trang PDF cần trích xuất (1-based), vd '1-3,7'"),
+    first_pages: Optional[int] = Form(None, gt=0, description="Chỉ trích xuất N trang PDF đầu tiên"),
+    output_format: Literal["markdown", "chunks"] = Form(
+        "markdown", description="'chunks': trả thêm danh sách chunk có cấu trúc (trang/slide/sheet, heading, offset)"
+    ),
+    chunk_max_tokens: Optional[int] = Form(None, gt=0, description="Số token tối đa mỗi chunk (ước lượng)"),
+):
+    logger.info("📤 Đã nhận file upload: filename=%s content_type=%s", file.filename, file.content_type)
 
-@router.post("/sdlc/convert-document", response_model=FileResponse)
-@limiter.limit(settings.rate_limit)
-async def upload_file(request: Request, file: UploadFile = File(...)):
-    temp_path = None
-    file_id = None
-    config = dict()
-    start_time = time.time()
     try:
-        logger.info("📤 Đã nhận file upload: filename=%s content_type=%s", file.filename, file.content_type)
+        page_list = parse_page_ranges(pages) if pages else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-        # 1. Đọc nội dung file
+    # Đọc nội dung file
+    with timed(UPLOAD_READ_SECONDS):
         content = await file.read()
-        file_size = len(content)
-
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Kích thước file vượt quá giới hạn {MAX_FILE_SIZE / (1024*1024):.2f}MB"
-            )
-
-        # 2. Lưu file tạm
-        file_id, temp_path = await save_upload_to_temp(file.filename, content)
-        logger.debug("🗂️ File tạm lưu tại: %s", temp_path)
-
-        # 3. Xác định loại file và chọn Semaphore phù hợp
-        file_ext = file.filename.split(".")[-1].lower() if "." in file.filename else ""
-        
-        parser = ParserFactory.get_parser(file_ext)
-        if parser is None:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}")
-
-        # Logic chọn lane (Phân luồng)
-        if file_ext in HEAVY_EXTENSIONS:
-            if file_ext == "pdf":
-                is_scan = decide_should_ocr_file(temp_path)["should_ocr_file"]
-                if is_scan:
-                    target_semaphore = sem_heavy
-                    lane_name = "HEAVY (OCR/PDF)"
-                    config["is_pdf_scan"] = True
-                else:
-                    target_semaphore = sem_light
-                    lane_name = "LIGHT (Text/Doc/PDF native)"
-                    config["is_pdf_scan"] = False
-        else:
-            target_semaphore = sem_light
-            lane_name = "LIGHT (Text/Doc/PDF native)"
-            config["is_pdf_scan"] = False
-
-        # 4. Fail-fast: Nếu lane đang quá tải, reject ngay để client không chờ
-        if target_semaphore.locked():
-            logger.warning("⚠️ %s Lane quá tải (%s request), từ chối: %s", 
-                           lane_name, 
-                           LIMIT_HEAVY if lane_name.startswith("HEAVY") else LIMIT_LIGHT,
-                           file.filename)
-            # Trả về 429 để client biết server bận, có thể retry sau
-            raise HTTPException(status_code=429, detail=f"Server đang bận xử lý nhiều file {lane_name}, vui lòng thử lại sau.")
-
-        loop = asyncio.get_running_loop()
-        
-        # 5. Xử lý Parse
-        try:
-            async with target_semaphore:
-                logger.info("🚀 Bắt đầu parse (%s): %s", lane_name, file.filename)
-                
-                # Chạy blocking code trong ThreadPoolExecutor
-                # Dùng asyncio.wait_for để set timeout cứng, tránh treo vĩnh viễn
-                parsed_result = await asyncio.wait_for(
-                    loop.run_in_executor(executor, lambda: parser.parse(temp_path, config)),
-                    timeout=PARSE_TIMEOUT
-                )
-                
-        except asyncio.TimeoutError:
-            logger.error("⏰ Parse timeout (%ss): %s", PARSE_TIMEOUT, file.filename)
-            raise HTTPException(status_code=408, detail="File xử lý quá lâu (Timeout), vui lòng kiểm tra lại file.")
-
-        if not parsed_result.is_success:
-            raise HTTPException(status_code=400, detail=parsed_result.failed_reason)
-
-        elapsed_time = time.time() - start_time
-        logger.info(f"✅ {elapsed_time}s Parsed thành công: id={file_id} ext={file_ext} lane={lane_name}")
-
-        return FileResponse(
-            id=file_id,
-            file_name=file.filename,
-            file_size=file_size,
-            file_type=file.content_type,
-            extracted_content=parsed_result.content
-        )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("❌ Failed to process upload: filename=%s error=%s", file.filename, str(e))
-        raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý file: {str(e)}")
-    finally:
-        # 6. Cleanup
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.debug("🧹 Đã xoá file tạm: %s", temp_path)
-            except Exception as cleanup_err:
-                logger.warning("⚠️ Không thể xoá file tạm %s: %s", temp_path, cleanup_err)
\ No newline at end of file
+    profile = profile_request_for(request.headers)
+    result = await convert_document(
+        file.filename, file.content_type, content, allow_partial=allow_partial, time_budget=time_budget,
+        pages=page_list, first_pages=first_pages, output_format=output_format, chunk_max_tokens=chunk_max_tokens,
+        profile=profile
+    )
+    # Trả thẳng Response: FileResponse chỉ được serialize 1 lần (orjson), không qua jsonable_encoder
+    # Cache hit không chạy parse -> không có profile
+    headers = {PROFILE_ID_HEADER: profile.id} if profile is not None and profile.saved else None
+    return FastJSONResponse(result, headers=headers)
+
+
+@router.post("/sdlc/convert-documents", summary="Batch convert (NDJSON stream)")
+async def upload_files(request: Request, files: List[UploadFile] = File(...)):
+    """Convert nhiều file (multipart nhiều part hoặc file .zip) trong một request.
+
+    Kết quả trả về dạng NDJSON theo thứ tự hoàn thành, mỗi dòng một file
+    (``index``, ``file_name``, ``status_code``, ``result``, ``error``); dòng cuối là ``summary``.
+    Lỗi của một file không làm fail cả batch. Batch được profile thì dòng của mỗi file đã được
+    parse (và lưu profile) có thêm ``profile_id``.
+    """
+    uploads = []
+    for upload in files:
+        with timed(UPLOAD_READ_SECONDS):
+            uploads.append((upload.filename or "", upload.content_type, await upload.read()))
+        await upload.close()
+
+    items = collect_batch_items(uploads)
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch không có file nào")
+
+    logger.info("📦 Đã nhận batch: %s file", len(items))
+    # Header gửi trước khi file nào được parse -> id profile nằm trong từng dòng NDJSON
+    profile = profile_request_for(request.headers)
+    return StreamingResponse(stream_batch(items, profile), media_type="application/x-ndjson")
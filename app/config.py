@@ -6,23 +6,101 @@ class Settings(BaseSettings):
     app_name: str = "File Parsing API"
     version: str = "1.0.0"
     debug: bool = True
+    # Root của scratch space (thư mục riêng cho từng request, có thể mount tmpfs)
     upload_dir: str = "/tmp/uploads"
+    scratch_quota_mb: int = 2048  # 0 = không giới hạn
+    scratch_min_free_mb: int = 256
+    scratch_orphan_minutes: int = 120
+    scratch_sweep_interval: int = 300
     rate_limit: str = "50/minute"
     ocr_lang: str = "vie+eng+osd"
     log_level: str = "DEBUG"
+    log_console_level: str = "INFO"
+    log_format: str = "text"  # "text" hoặc "json" (structured, kèm request_id)
+    log_queue_size: int = 10000
+    log_debug_max_per_second: int = 20
     timeout: int = 300
+    health_timeout: int = 5
+    batch_timeout: int = 3600
     max_file_size: int = 10 * 1024 * 1024
+    # File nhỏ hơn ngưỡng (KB) được parse thẳng từ RAM, không ghi file tạm (0 = luôn ghi file tạm)
+    in_memory_parse_max_kb: int = 1024
     max_page_limit: int = 150
+    # Ước lượng chi phí trước khi parse (chỉ đọc metadata) để từ chối sớm: dung lượng giải nén (MB) và
+    # tỉ lệ nén tối đa của file OOXML/zip, số ô XLSX theo <dimension>, số trang DOCX / slide PPTX.
+    # Tài liệu Office giải nén lớn hơn heavy_office_mb chạy lane HEAVY
+    max_uncompressed_mb: int = 512
+    max_compression_ratio: int = 200
+    max_xlsx_cells: int = 2_000_000
+    max_office_pages: int = 2000
+    heavy_office_mb: int = 64
     tesseract_config_cmd: str = r'--oem 3 --psm 3'
     tesseract_config_dpi: int = 2000
-    max_concurrent_parser_light: int = 10
-    max_concurrent_parser_heavy: int = 10
+    # Số request đồng thời mỗi lane (0 = tự tính theo CPU/RAM của container)
+    max_concurrent_parser_light: int = 0
+    max_concurrent_parser_heavy: int = 0
     tesseract_config_thread_image_convert: int = 4
     tesseract_config_max_worker: int = 4
     tesseract_config_batch_size: int = 20
+    # Scheduler tài nguyên: CPU token / RAM cho mỗi process (0 = đo theo cgroup, chia cho WORKERS),
+    # tỉ lệ RAM được đặt chỗ và thời gian tối đa (giây) request đơn lẻ chờ tài nguyên trước khi 429
+    scheduler_cpu_tokens: int = 0
+    scheduler_memory_mb: int = 0
+    scheduler_memory_fraction: float = 0.8
+    scheduler_max_wait: float = 10.0
+    # Fair-share theo client: API key -> tên ("key1=portal,key2=importer"), trọng số WFQ theo định danh
+    # ("key:portal=4,id:bulk=0.5", mặc định 1) và quota theo chi phí mỗi client (chuỗi limits, rỗng = tắt)
+    client_api_keys: str = ""
+    # X-Client-Id chỉ được tin khi kết nối tới từ gateway/proxy trong danh sách (IP/CIDR, rỗng = bỏ qua header)
+    client_id_trusted_proxies: str = ""
+    client_weights: str = ""
+    client_quota_ocr_pages: str = ""
+    client_quota_cpu_seconds: str = ""
+    # OCR: tìm bảng kẻ ô trên trang scan (OpenCV) và dựng lại bảng Markdown
+    ocr_table_layout: bool = True
+    # OCR: OSD trên vài trang mẫu để xoay trang và chọn tập ngôn ngữ nhỏ nhất cho cả tài liệu
+    ocr_osd: bool = True
+    ocr_osd_sample_pages: int = 3
+    ocr_osd_min_confidence: float = 10.0
+    # OCR ảnh nhúng trong DOCX/PPTX (screenshot, trang scan dán vào tài liệu); ảnh nhỏ hơn ngưỡng (KB) bị bỏ qua
+    ocr_embedded_images: bool = False
+    ocr_embedded_min_kb: int = 8
     page_break_str: str = "\n\n--- Page Break ---\n\n"
     max_inspect_pages: int = 10
+    # output_format=chunks: số token (ước lượng) tối đa mỗi chunk nếu request không chỉ định
+    chunk_max_tokens: int = 512
+    # Native PDF: số process trích xuất song song (0 = CPU / WORKERS, 1 = tắt) và số trang tối thiểu mỗi shard
+    pdf_native_shard_workers: int = 0
+    pdf_native_shard_min_pages: int = 16
+    batch_max_files: int = 500
+    batch_max_concurrency: int = 8
     heavy_extensions: set[str] | str = {"pdf"}
+    # Danh sách extension cần preload parser khi khởi động ("pdf,docx" hoặc "*")
+    preload_parsers: set[str] | str = set()
+    # Nén response (gzip/zstd theo Accept-Encoding); body nhỏ hơn ngưỡng (byte) gửi nguyên, 0 = tắt
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_zstd_level: int = 3
+    # Chế độ production nhiều process: python -m app.serve (workers=0 -> theo số CPU)
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: int = 0
+    # Lane slot / rate-limit / result cache dùng chung giữa các worker (tự bật bởi app.serve)
+    shared_state: bool = False
+    shared_state_path: str = "/tmp/genai_parser/state.db"
+    result_cache_max_mb: int = 256
+    # Cache text OCR theo trang (hash pixel trang + lang + config Tesseract), 0 = tắt
+    ocr_cache_path: str = "/tmp/genai_parser/ocr_cache.db"
+    ocr_cache_max_mb: int = 512
+    # Cache Markdown theo phần (sheet XLSX / thân DOCX) khi upload lại bản sửa, 0 = tắt
+    part_cache_max_mb: int = 256
+    # Profiling parse (cProfile): header X-Profile: 1 kèm X-Admin-Token = admin_token (rỗng = tắt, cũng khoá
+    # /admin/*) hoặc lấy mẫu profile_sample_rate (0..1) request; giữ profile_max_stored profile mới nhất
+    admin_token: str = ""
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "/tmp/genai_parser/profiles"
+    profile_max_stored: int = 100
+    profile_top_n: int = 30
 
     @field_validator("heavy_extensions", mode="before")
     def split_set(cls, v):
@@ -32,6 +110,14 @@ class Settings(BaseSettings):
             return set(v)
         return {"pdf"}
 
+    @field_validator("preload_parsers", mode="before")
+    def split_preload(cls, v):
+        if isinstance(v, str):
+            return {x.strip().lower() for x in v.split(",") if x.strip()}
+        if isinstance(v, (list, set)):
+            return set(v)
+        return set()
+
     class Config:
         env_file = ".env"
 
@@ -1,19 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi.errors import RateLimitExceeded
-from slowapi import _rate_limit_exceeded_handler
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.middleware import SlowAPIMiddleware
 import logging
 
+from app.middlewares.compression import CompressionMiddleware
 from app.middlewares.timeout import TimeoutMiddleware
+from app.middlewares.rate_limit import RateLimitMiddleware
+from app.middlewares.request_id import RequestIdMiddleware
 from app.api import endpoints
 from app.config import settings
+from app.services.parser_factory import ParserFactory
+from app.services.scratch import scratch
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up: preload parser nặng (fitz, pandas, ...) trước khi nhận request đầu tiên
+    if settings.preload_parsers:
+        loaded = ParserFactory.warm_up(settings.preload_parsers)
+        logger.info("🔥 Đã warm-up parser: %s", ", ".join(sorted(loaded)) or "(none)")
 
+    # Dọn file tạm mồ côi của lần chạy trước (crash, LibreOffice timeout...) rồi sweep định kỳ
+    await asyncio.to_thread(scratch.sweep)
+    sweeper = asyncio.create_task(scratch.run_sweeper(settings.scratch_sweep_interval))
+    try:
+        yield
+    finally:
+        sweeper.cancel()
 
-app = FastAPI(title=settings.app_name, version=settings.version, debug=settings.debug)
+
+app = FastAPI(title=settings.app_name, version=settings.version, debug=settings.debug, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,19 +44,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Attach limiter middleware for proper request context
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-
-app.add_middleware(TimeoutMiddleware)  
-app.add_middleware(SlowAPIMiddleware) 
-
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_handler(request, exc):
-    return JSONResponse(
-        status_code=429,
-        content={"detail": "Rate limit exceeded. Vui lòng thử lại sau."}
-    )
+# Pure ASGI middleware (không qua BaseHTTPMiddleware): RequestId -> Compression -> RateLimit -> Timeout -> CORS
+app.add_middleware(TimeoutMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 # Configure root logging level
 logging.basicConfig(level=getattr(logging, settings.log_level.upper(), logging.INFO))
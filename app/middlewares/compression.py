@@ -0,0 +1,164 @@
+import asyncio
+import zlib
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+try:
+    import zstandard
+except ImportError:  # zstd là tuỳ chọn, không có thì chỉ hỗ trợ gzip
+    zstandard = None
+
+logger = setup_logger(__name__)
+
+# Kích thước mỗi lần nén/gửi: body lớn được nén và gửi dần, không giữ bản nén đầy đủ trong RAM
+SLICE_SIZE = 256 * 1024
+# Body lớn hơn ngưỡng này được nén trong thread (zlib/zstd nhả GIL) để không chặn event loop
+THREAD_THRESHOLD = 1024 * 1024
+
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"text/")
+
+
+def _parse_accept_encoding(value: str) -> dict:
+    """``"gzip, zstd;q=0.5, br;q=0"`` -> ``{"gzip": 1.0, "zstd": 0.5, "br": 0.0}``."""
+    encodings = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Encoding tốt nhất client chấp nhận: zstd (nếu có thư viện) rồi tới gzip; "" nếu không nén."""
+    encodings = _parse_accept_encoding(accept_encoding)
+    candidates = (["zstd"] if zstandard is not None else []) + ["gzip"]
+    best, best_quality = "", 0.0
+    for name in candidates:
+        quality = encodings.get(name, encodings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+            self._sync_flag = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            self._finish_flag = zstandard.COMPRESSOBJ_FLUSH_FINISH
+        else:
+            # wbits=31: định dạng gzip
+            self._obj = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+            self._sync_flag = zlib.Z_SYNC_FLUSH
+            self._finish_flag = zlib.Z_FINISH
+
+    def compress(self, data: bytes, more_body: bool) -> bytes:
+        out = self._obj.compress(data)
+        # Stream (NDJSON): flush mỗi chunk để client nhận được dòng ngay
+        return out + self._obj.flush(self._sync_flag if more_body else self._finish_flag)
+
+    def compress_slice(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+
+class CompressionMiddleware:
+    """Pure ASGI: nén response theo ``Accept-Encoding`` (zstd/gzip), nén và gửi theo từng phần.
+
+    Response nhỏ hơn ``settings.compression_min_size``, không phải JSON/NDJSON/text, hoặc đã có
+    ``Content-Encoding`` được gửi nguyên.
+    """
+
+    def __init__(self, app, min_size: int = None):
+        self.app = app
+        self.min_size = settings.compression_min_size if min_size is None else min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.min_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"")
+                already_encoded = any(k.lower() == b"content-encoding" for k, _ in headers)
+                if already_encoded or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                    return
+                # Chờ body đầu tiên để biết kích thước trước khi quyết định nén
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding", b"vary")
+                ]
+                vary = [v for k, v in start_message.get("headers", []) if k.lower() == b"vary"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                start_message["headers"] = headers
+                await send(start_message)
+
+            await self._send_body(send, compressor, body, more_body)
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    async def _send_body(send, compressor: _Compressor, body: bytes, more_body: bool) -> None:
+        offload = len(body) >= THREAD_THRESHOLD
+        view = memoryview(body)
+        # Body lớn: nén và gửi từng lát, lát cuối kèm flush
+        starts = range(0, len(body), SLICE_SIZE) if body else [0]
+        for i, start in enumerate(starts):
+            piece = view[start:start + SLICE_SIZE]
+            if i < len(starts) - 1:
+                data = await asyncio.to_thread(compressor.compress_slice, piece) if offload \
+                    else compressor.compress_slice(piece)
+                if data:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+                continue
+            data = await asyncio.to_thread(compressor.compress, piece, more_body) if offload \
+                else compressor.compress(piece, more_body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,65 @@
+import asyncio
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.services.rate_limiter import RATE_LIMIT_BLOCKING, parse_limit, rate_limiter
+from app.utils.client_identity import client_id_var, identify
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Giới hạn theo route; route không có trong bảng (vd /metrics) không bị giới hạn
+ROUTE_LIMITS = {
+    "/": parse_limit(settings.rate_limit),
+    "/sdlc/convert-document": parse_limit(settings.rate_limit),
+    "/sdlc/convert-documents": parse_limit(settings.rate_limit),
+}
+
+
+class RateLimitMiddleware:
+    """Pure ASGI: xác định client (API key / X-Client-Id / IP) và rate limit theo client, trước khi đọc body upload."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_id = identify(scope.get("headers", []), client[0] if client else None)
+        token = client_id_var.set(client_id)
+        try:
+            await self._handle(scope, receive, send, client_id)
+        finally:
+            client_id_var.reset(token)
+
+    async def _handle(self, scope, receive, send, client_id: str):
+        path = scope["path"]
+        item = ROUTE_LIMITS.get(path)
+        if item is None:
+            await self.app(scope, receive, send)
+            return
+
+        if RATE_LIMIT_BLOCKING:
+            allowed = await asyncio.to_thread(rate_limiter.hit, item, path, client_id)
+        else:
+            allowed = rate_limiter.hit(item, path, client_id)
+
+        if not allowed:
+            reset_time = rate_limiter.get_window_stats(item, path, client_id).reset_time
+            retry_after = max(1, math.ceil(reset_time - time.time()))
+            logger.warning("⚠️ Rate limit %s vượt quá (%s): %s", item, client_id, path)
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Rate limit exceeded. Vui lòng thử lại sau."},
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -1,35 +1,60 @@
 import asyncio
-from starlette.middleware.base import BaseHTTPMiddleware
+import time
+
 from starlette.responses import JSONResponse
-from app.utils.logger import setup_logger
 
 from app.config import settings
+from app.utils.deadline import deadline_var
+from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 API_TIMEOUT = settings.timeout or 300
 
-class TimeoutMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response_future = asyncio.Future()
-        
-        async def process_request():
-            try:
-                response = await call_next(request)
-                if not response_future.done():
-                    response_future.set_result(response)
-            except Exception as e:
-                if not response_future.done():
-                    response_future.set_exception(e)
-        
-        task = asyncio.create_task(process_request())
-        
+# Timeout theo route (giây); route khác dùng API_TIMEOUT
+ROUTE_TIMEOUTS = {
+    "/": settings.health_timeout,
+    "/metrics": settings.health_timeout,
+    "/sdlc/convert-documents": settings.batch_timeout,
+}
+
+
+class TimeoutMiddleware:
+    """Pure ASGI: giới hạn thời gian xử lý theo route, cancel task khi quá hạn.
+
+    Deadline (monotonic) được đặt vào ``deadline_var`` để tầng parse biết thời gian còn lại.
+    Nếu response chưa bắt đầu gửi -> trả 504; nếu đang stream thì chỉ cắt kết nối.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        timeout = ROUTE_TIMEOUTS.get(path, API_TIMEOUT)
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        token = deadline_var.set(time.monotonic() + timeout)
         try:
-            response = await asyncio.wait_for(response_future, timeout=API_TIMEOUT)
-            return response
+            # wait_for cancel task bên trong khi hết giờ (CancelledError lan xuống endpoint)
+            await asyncio.wait_for(self.app(scope, receive, send_wrapper), timeout=timeout)
         except asyncio.TimeoutError:
-            logger.error(f"⏱️ Request timeout sau {API_TIMEOUT} giây: {request.url.path}")
-            return JSONResponse(
-                status_code=504,
-                content={"detail": f"Xử lý request vượt quá thời gian cho phép ({API_TIMEOUT} giây)"}
-            )
\ No newline at end of file
+            logger.error("⏱️ Request timeout sau %s giây: %s", timeout, path)
+            if not response_started:
+                response = JSONResponse(
+                    status_code=504,
+                    content={"detail": f"Xử lý request vượt quá thời gian cho phép ({timeout} giây)"}
+                )
+                await response(scope, receive, send)
+        finally:
+            deadline_var.reset(token)
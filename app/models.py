@@ -1,14 +1,29 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 import uuid
 
 
+class Chunk(BaseModel):
+    index: int
+    text: str
+    element_type: str = Field(..., description="Loại block: paragraph / table / list")
+    page: Optional[int] = Field(None, description="Trang PDF (1-based)")
+    slide: Optional[int] = Field(None, description="Slide PPTX (1-based)")
+    sheet: Optional[str] = Field(None, description="Tên sheet XLSX")
+    heading_path: List[str] = Field(default_factory=list, description="Các heading cha, từ ngoài vào trong")
+    char_start: int = Field(..., description="Offset bắt đầu trong extracted_content")
+    char_end: int = Field(..., description="Offset kết thúc (không bao gồm) trong extracted_content")
+
+
 class FileResponse(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), description="Unique file ID")
     file_name: str
     file_size: int
     file_type: str
     extracted_content: str
+    is_partial: bool = Field(False, description="True nếu hết time budget và chỉ trả về các trang đã xử lý xong")
+    missing_pages: List[int] = Field(default_factory=list, description="Các trang (1-based) chưa được trích xuất")
+    chunks: Optional[List[Chunk]] = Field(None, description="Chỉ có khi output_format=chunks")
 
     class Config:
         json_schema_extra = {
@@ -25,4 +40,9 @@ class FileResponse(BaseModel):
 class ParsedResult(BaseModel):
     is_success: bool
     content: Optional[str]
-    failed_reason: Optional[str] = "No reason"
\ No newline at end of file
+    failed_reason: Optional[str] = "No reason"
+    # Hết deadline giữa chừng: content chỉ gồm các trang đã xong
+    is_partial: bool = False
+    missing_pages: List[int] = []
+    # output_format=chunks: chunk có cấu trúc, offset trỏ vào content
+    chunks: Optional[List[Chunk]] = None
\ No newline at end of file
@@ -1,12 +1,21 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 from app.models import ParsedResult
+from app.utils.parse_source import ParseSource
 
 class BaseParser(ABC):
     """Interface for all parsers."""
 
     @abstractmethod
-    def parse(self, file_path: str) -> ParsedResult:
-        """Return file content as Markdown string."""
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
+        """Return file content as Markdown string.
+
+        ``file_path`` là đường dẫn file tạm, hoặc ``BytesIO`` với file nhỏ parse trong RAM
+        (đọc qua ``app.utils.parse_source``).
+
+        ``config`` chứa các tuỳ chọn do API layer quyết định (vd: ``is_pdf_scan``,
+        ``file_name``, ``deadline`` - mốc ``time.monotonic()`` mà parser nên dừng trước đó).
+        """
         raise NotImplementedError
 
 
@@ -2,31 +2,59 @@ import shutil
 import subprocess
 import tempfile
 import os
+import posixpath
 import uuid
 from lxml import etree
 import zipfile
 
 from pathlib import Path
 from docx import Document
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Optional
 from zipfile import ZipFile
 import xml.etree.ElementTree as ET
+from app.config import settings
 from app.parsers.base_parser import BaseParser
+from app.services.ocr_service import EmbeddedImageOCR, image_placeholder
+from app.services.part_cache import part_cache
+from app.utils.chunking import builder_from_config
+from app.utils.deadline import time_left
 from app.utils.logger import setup_logger
+from app.utils.metrics import LIBREOFFICE_SECONDS, PART_CACHE_TOTAL, timed, timed_stage
 from app.models import ParsedResult
+from app.utils.parse_source import ParseSource, as_file, is_in_memory, source_name
+
+
+# Thời gian tối đa (giây) cho 1 lần gọi LibreOffice
+LIBREOFFICE_TIMEOUT = 300
+
+# Ảnh nhúng (w:drawing / VML) -> placeholder theo relationship id, OCR rồi chèn vào đúng vị trí
+OCR_EMBEDDED_IMAGES = settings.ocr_embedded_images
+IMAGE_NS = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'v': 'urn:schemas-microsoft-com:vml',
+}
+IMAGE_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
 
 
 class DocParser(BaseParser):
     def __init__(self):
         self.logger = setup_logger(__name__)
 
-    def _convert_doc_to_docx(self, doc_path: Path) -> Path:
-        """Convert file .doc sang .docx bằng LibreOffice (CLI)."""
-        temp_dir = tempfile.mkdtemp()
+    def _convert_doc_to_docx(
+        self, doc_path: Path, scratch_dir: Optional[str] = None, timeout: float = LIBREOFFICE_TIMEOUT
+    ) -> Path:
+        """Convert file .doc sang .docx bằng LibreOffice (CLI).
+
+        Output và profile LibreOffice nằm trong ``scratch_dir`` của request (nếu có) để được
+        dọn cùng request kể cả khi convert lỗi/timeout.
+        """
+        temp_dir = tempfile.mkdtemp(dir=scratch_dir)
         output_path = Path(temp_dir) / (doc_path.stem + ".docx")
         
         # Tạo thư mục profile riêng
-        profile_dir = Path(f"/tmp/lo_profile_{uuid.uuid4().hex}")
+        profile_dir = Path(scratch_dir or tempfile.gettempdir()) / f"lo_profile_{uuid.uuid4().hex}"
         profile_dir.mkdir(parents=True, exist_ok=True)
         
         try:
@@ -66,13 +94,14 @@ class DocParser(BaseParser):
                 try:
                     self.logger.info(f"Đang thử phương pháp chuyển đổi {i+1}/{len(conversion_methods)}")
                     
-                    result = subprocess.run(
-                        cmd,
-                        check=False,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        timeout=300
-                    )
+                    with timed(LIBREOFFICE_SECONDS):
+                        result = subprocess.run(
+                            cmd,
+                            check=False,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            timeout=timeout
+                        )
                     
                     # Kiểm tra kết quả và đảm bảo file tồn tại
                     if result.returncode == 0:
@@ -167,6 +196,10 @@ class DocParser(BaseParser):
                     if font_size_val:
                         font_size = int(font_size_val) / 2  # Chuyển đổi từ half-points sang points
                 
+                if OCR_EMBEDDED_IMAGES:
+                    for rel_id in node.xpath('.//a:blip/@r:embed | .//v:imagedata/@r:id', namespaces=IMAGE_NS):
+                        para_text_parts.append(image_placeholder(rel_id))
+
                 text_nodes = node.xpath('.//w:t', namespaces=ns)
                 run_text = ''.join(t.text for t in text_nodes if t.text is not None)
 
@@ -329,7 +362,7 @@ class DocParser(BaseParser):
         return "\n" + "\n".join(table_markdown_lines) + "\n"
 
 
-    def _parse_docx(self, file_path: Path) -> Tuple[List[str], int]:
+    def _parse_docx(self, file_path: ParseSource) -> Tuple[List[str], int]:
         """
         Phân tích tài liệu DOCX và trả về danh sách các đoạn văn và vị trí của TOC.
         """
@@ -338,7 +371,7 @@ class DocParser(BaseParser):
             toc_position = -1
             toc_found = False
             
-            with zipfile.ZipFile(file_path, 'r') as docx_zip:
+            with zipfile.ZipFile(as_file(file_path), 'r') as docx_zip:
                 xml_content = docx_zip.read('word/document.xml')
                 root = etree.fromstring(xml_content)
                 ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
@@ -407,19 +440,20 @@ class DocParser(BaseParser):
         text_lower = text.lower().strip()
         return any(keyword in text_lower for keyword in toc_keywords)
 
-    def extract_toc(self, file_path: Path) -> List[dict]:
+    def extract_toc(self, file_path: ParseSource) -> List[dict]:
         """Trích xuất mục lục (Table of Contents) từ tài liệu Word."""
         try:
-            self.logger.info(f"📑 Đang trích xuất mục lục từ: {file_path.name}")
+            self.logger.info(f"📑 Đang trích xuất mục lục từ: {source_name(file_path)}")
             toc_entries = []
             
-            # Đảm bảo file là .docx
+            # Đảm bảo file là .docx (BytesIO luôn là .docx)
             docx_path = file_path
-            if file_path.suffix.lower() == '.doc':
-                docx_path = self._convert_doc_to_docx(file_path)
+            is_doc = not is_in_memory(file_path) and Path(file_path).suffix.lower() == '.doc'
+            if is_doc:
+                docx_path = self._convert_doc_to_docx(Path(file_path))
             
             # Mở file docx như một zip archive
-            with ZipFile(docx_path, 'r') as docx_zip:
+            with ZipFile(as_file(docx_path), 'r') as docx_zip:
                 # Đọc document.xml
                 doc_xml = docx_zip.read('word/document.xml')
                 
@@ -502,7 +536,7 @@ class DocParser(BaseParser):
             # Nếu vẫn không tìm thấy TOC, thử phương pháp cuối cùng: tìm các heading
             if not toc_entries:
                 self.logger.info("Không tìm thấy TOC, đang trích xuất từ các heading...")
-                doc = Document(docx_path)
+                doc = Document(as_file(docx_path))
                 
                 for para in doc.paragraphs:
                     if para.style and para.style.name.startswith('Heading'):
@@ -519,7 +553,7 @@ class DocParser(BaseParser):
                             })
             
             # Nếu file là .doc, xóa file tạm sau khi xử lý xong
-            if file_path.suffix.lower() == '.doc' and docx_path != file_path:
+            if is_doc and docx_path != file_path:
                 try:
                     os.remove(docx_path)
                     os.rmdir(docx_path.parent)
@@ -546,33 +580,123 @@ class DocParser(BaseParser):
         
         return "\n".join(markdown_lines)
 
-    def parse(self, file_path: str) -> ParsedResult:
+    def _part_key(self, docx_path: ParseSource) -> Optional[str]:
+        """Key cache của phần thân: CRC/size của ``word/document.xml`` và ``styles.xml``.
+
+        Sửa header/footer, comment, ảnh hay metadata (``docProps`` đổi ở mỗi lần lưu) không làm
+        mất cache; ``None`` nếu cache tắt hoặc không đọc được ZIP directory.
+        """
+        if not part_cache.enabled:
+            return None
+        try:
+            with ZipFile(as_file(docx_path), 'r') as docx_zip:
+                names = set(docx_zip.namelist())
+                members = [docx_zip.getinfo(n) for n in ('word/document.xml', 'word/styles.xml') if n in names]
+        except (zipfile.BadZipFile, OSError):
+            return None
+        if not members or members[0].filename != 'word/document.xml':
+            return None
+        # Phần thân có placeholder ảnh hay không tuỳ OCR_EMBEDDED_IMAGES
+        return part_cache.make_key("docx.body", *members, extra="img" if OCR_EMBEDDED_IMAGES else "")
+
+    @staticmethod
+    def _image_targets(docx_zip: ZipFile) -> Dict[str, str]:
+        """relationship id -> đường dẫn ảnh trong zip, theo ``word/_rels/document.xml.rels``."""
+        try:
+            rels = etree.fromstring(docx_zip.read('word/_rels/document.xml.rels'))
+        except KeyError:
+            return {}
+        targets = {}
+        for rel in rels.iter(f'{RELS_NS}Relationship'):
+            if rel.get('Type') != IMAGE_REL_TYPE or rel.get('TargetMode') == 'External':
+                continue
+            target = rel.get('Target', '')
+            targets[rel.get('Id')] = target.lstrip('/') if target.startswith('/') \
+                else posixpath.normpath(posixpath.join('word', target))
+        return targets
+
+    def _start_image_ocr(
+        self, docx_path: ParseSource, config: dict
+    ) -> Tuple[EmbeddedImageOCR, Dict[str, Tuple[str, str]]]:
+        """Đưa ảnh nhúng vào OCR trước khi trích xuất text (chạy song song); trả về (OCR, rId -> (key, tên))."""
+        ocr = EmbeddedImageOCR(config.get("cpu_tokens"), config.get("deadline"), stage="docx")
+        images = {}
+        try:
+            with ZipFile(as_file(docx_path), 'r') as docx_zip:
+                names = set(docx_zip.namelist())
+                for rel_id, target in self._image_targets(docx_zip).items():
+                    if target not in names:
+                        continue
+                    key = ocr.submit(docx_zip.read(target))
+                    if key is not None:
+                        images[rel_id] = (key, posixpath.basename(target))
+        except (zipfile.BadZipFile, etree.XMLSyntaxError, OSError) as e:
+            self.logger.warning(f"⚠️ Không đọc được ảnh nhúng: {e}")
+        return ocr, images
+
+    def _markdown_body(self, docx_path: ParseSource) -> List[str]:
+        """Các đoạn Markdown của phần thân (có TOC), lấy từ part cache nếu phần thân không đổi."""
+        # Phần thân không đổi so với revision trước (chỉ sửa header, ảnh, metadata...) lấy từ cache
+        part_key = self._part_key(docx_path)
+        markdown_paragraphs = part_cache.get_json(part_key) if part_key else None
+        if part_key:
+            PART_CACHE_TOTAL.labels(parser="docx", result="hit" if markdown_paragraphs is not None else "miss").inc()
+        if markdown_paragraphs is not None:
+            return markdown_paragraphs
+
+        # Phân tích tài liệu và xác định vị trí TOC
+        with timed_stage("docx.parse_body"):
+            markdown_paragraphs, toc_position = self._parse_docx(docx_path)
+        # Trích xuất TOC
+        with timed_stage("docx.extract_toc"):
+            toc_entries = self.extract_toc(docx_path)
+        toc_markdown = self.toc_to_markdown(toc_entries)
+
+        # Nếu tìm thấy vị trí TOC, chèn TOC vào đúng vị trí đó
+        if toc_position >= 0 and toc_markdown:
+            # Xóa các đoạn văn TOC gốc (thường là 1 đoạn tiêu đề)
+            markdown_paragraphs[toc_position] = toc_markdown
+        elif toc_markdown:  # Nếu không tìm thấy vị trí TOC nhưng có TOC
+            # Thêm TOC vào đầu tài liệu
+            markdown_paragraphs.insert(0, toc_markdown)
+        if part_key and markdown_paragraphs:
+            part_cache.put_json(part_key, markdown_paragraphs)
+        return markdown_paragraphs
+
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
         """Parse tài liệu Word và giữ TOC ở đúng vị trí của nó."""
-        file_path = Path(file_path)
-        ext = file_path.suffix.lower()
-        self.logger.info(f"📄 Đang xử lý file Word: {file_path.name}")
+        name = source_name(file_path, config)
+        if is_in_memory(file_path):
+            # Parse trong RAM: loại file lấy từ kết quả sniff (LibreOffice cần file .doc trên disk)
+            ext = "." + (config or {}).get("file_ext", "docx")
+        else:
+            file_path = Path(file_path)
+            ext = file_path.suffix.lower()
+        self.logger.info(f"📄 Đang xử lý file Word: {name}")
 
         try:
             docx_path = file_path
+            if ext == ".doc" and is_in_memory(file_path):
+                return ParsedResult(is_success=False, content="", failed_reason="File .doc cần được lưu ra disk để convert")
             if ext == ".doc":
-                docx_path = self._convert_doc_to_docx(file_path)
+                # LibreOffice bị kill khi hết thời gian còn lại của request
+                remaining = time_left((config or {}).get("deadline"))
+                timeout = LIBREOFFICE_TIMEOUT if remaining is None else max(1.0, min(LIBREOFFICE_TIMEOUT, remaining))
+                docx_path = self._convert_doc_to_docx(file_path, (config or {}).get("scratch_dir"), timeout)
             elif ext != ".docx":
                 self.logger.warning(f"⚠️ Định dạng không hỗ trợ: {ext}")
                 return ParsedResult(is_success=False, content="", failed_reason=f"Định dạng không hỗ trợ: {ext}")
             
-            # Phân tích tài liệu và xác định vị trí TOC
-            markdown_paragraphs, toc_position = self._parse_docx(docx_path)
-            # Trích xuất TOC
-            toc_entries = self.extract_toc(docx_path)
-            toc_markdown = self.toc_to_markdown(toc_entries)
-            
-            # Nếu tìm thấy vị trí TOC, chèn TOC vào đúng vị trí đó
-            if toc_position >= 0 and toc_markdown:
-                # Xóa các đoạn văn TOC gốc (thường là 1 đoạn tiêu đề)
-                markdown_paragraphs[toc_position] = toc_markdown
-            elif toc_markdown:  # Nếu không tìm thấy vị trí TOC nhưng có TOC
-                # Thêm TOC vào đầu tài liệu
-                markdown_paragraphs.insert(0, toc_markdown)
+            # Ảnh nhúng được OCR trên pool riêng trong lúc trích xuất text phần thân
+            image_ocr, images = self._start_image_ocr(docx_path, config or {}) if OCR_EMBEDDED_IMAGES else (None, {})
+            try:
+                markdown_paragraphs = self._markdown_body(docx_path)
+                if image_ocr is not None:
+                    with timed_stage("docx.embedded_images"):
+                        markdown_paragraphs = image_ocr.fill(markdown_paragraphs, images)
+            finally:
+                if image_ocr is not None:
+                    image_ocr.close()
             
             # Xóa file tạm nếu là .doc
             if ext == ".doc" and docx_path != file_path:
@@ -583,8 +707,17 @@ class DocParser(BaseParser):
                 except Exception as cleanup_err:
                     self.logger.warning(f"⚠️ Không xoá được file tạm: {cleanup_err}")
             
-            return ParsedResult(is_success=True, content="\n\n".join(markdown_paragraphs))
+            content = "\n\n".join(markdown_paragraphs)
+            builder = builder_from_config(config)
+            if builder is not None:
+                for paragraph in markdown_paragraphs:
+                    builder.add_section(paragraph)
+            return ParsedResult(
+                is_success=True,
+                content=content,
+                chunks=builder.build(content) if builder is not None else None
+            )
 
         except Exception as e:
-            self.logger.critical(f"🔥 Lỗi nghiêm trọng khi xử lý {file_path.name}: {e}")
+            self.logger.critical(f"🔥 Lỗi nghiêm trọng khi xử lý {name}: {e}")
             return ParsedResult(is_success=False, content="", failed_reason="Lỗi khi xử lý file")
@@ -1,28 +1,31 @@
+from typing import Optional
 from app.parsers.base_parser import BaseParser
 from app.utils.logger import setup_logger
 from app.models import ParsedResult
+from app.utils.parse_source import ParseSource, read_bytes, source_name
 
 
 class MdParser(BaseParser):
     def __init__(self):
         self.logger = setup_logger(__name__)
 
-    def parse(self, file_path: str) -> ParsedResult:
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
         """Phân tích file Markdown và trích xuất toàn bộ nội dung."""
-        self.logger.info(f"📊 Bắt đầu parsing Markdown: {file_path}")
+        name = source_name(file_path, config)
+        self.logger.info(f"📊 Bắt đầu parsing Markdown: {name}")
 
         res = None
+        data = b''
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                res = ParsedResult(is_success=True, content=content)
-                self.logger.info(f"📝 Đã đọc {len(content)} ký tự từ file Markdown")
+            data = read_bytes(file_path)
+            content = data.decode('utf-8')
+            res = ParsedResult(is_success=True, content=content)
+            self.logger.info(f"📝 Đã đọc {len(content)} ký tự từ file Markdown")
         except UnicodeDecodeError:
             try:
-                with open(file_path, 'r', encoding='latin-1') as file:
-                    content = file.read()
-                    res = ParsedResult(is_success=True, content=content)
-                    self.logger.info(f"📝 Đã đọc {len(content)} ký tự từ file Markdown (latin-1)")
+                content = data.decode('latin-1')
+                res = ParsedResult(is_success=True, content=content)
+                self.logger.info(f"📝 Đã đọc {len(content)} ký tự từ file Markdown (latin-1)")
             except Exception as e:
                 msg = f"Lỗi khi đọc file Markdown (latin-1): {str(e)}"
                 self.logger.error(f"❌ {msg}")
@@ -32,5 +35,5 @@ class MdParser(BaseParser):
             self.logger.error(f"❌ {msg}")
             res = ParsedResult(is_success=False, content='', failed_reason=msg)
 
-        self.logger.info(f"✅ Hoàn tất parsing Markdown: {file_path}")
+        self.logger.info(f"✅ Hoàn tất parsing Markdown: {name}")
         return res
@@ -1,110 +1,207 @@
-import gc
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import fitz  # PyMuPDF
+import numpy as np
 import pymupdf4llm
-import pytesseract
-from PIL import Image, ImageEnhance, ImageOps, ImageFilter  # Added ImageFilter
 
 from app.config import settings
 from app.models import ParsedResult
 from app.parsers.base_parser import BaseParser
+from app.parsers.pdf_shards import default_pool_size, extract_sharded, plan_shards
+from app.services.ocr_service import ocr_image
+from app.utils.chunking import ChunkBuilder, builder_from_config
+from app.utils.deadline import is_expired, time_left
 from app.utils.logger import setup_logger
+from app.utils.metrics import OCR_PAGES_PER_SECOND, timed_stage
+from app.utils.ocr_image import pixmap_to_array
+from app.utils.ocr_osd import (
+    OcrPlan, default_plan, detect_osd, page_rotation, plan_from_samples, rotate_image, sample_indices
+)
+from app.utils.page_selection import select_pages
+from app.utils.parse_source import ParseSource, is_in_memory, source_name
+from app.utils.pdf_utils import open_pdf
 
 # =========================
 # CONFIG CONSTANTS
 # =========================
-# --oem 3: Default engine
-# --psm 3: Auto segmentation (Tốt cho bảng có Header)
-# preserve_interword_spaces=1: Giữ khoảng cách cột
-# tessedit_char_whitelist: KHÔNG NÊN DÙNG nếu file có cả Tiếng Việt và Số hỗn hợp
-TESSERACT_CONFIG_CMD = r'--oem 3 --psm 3 -c preserve_interword_spaces=1'
-
 TESSERACT_CONFIG_MAX_WORKER = settings.tesseract_config_max_worker
 TESSERACT_CONFIG_BATCH_SIZE = settings.tesseract_config_batch_size
 PAGE_BREAK_STR = settings.page_break_str
+PAGE_JOINER = f"\n\n{PAGE_BREAK_STR}\n\n"
+
+# Chế độ allow_partial: native PDF được trích xuất theo từng cụm trang để kiểm tra deadline
+NATIVE_PARTIAL_CHUNK_PAGES = 10
+
+# Native PDF nhiều trang: chia shard chạy song song trên process pool (1 = tắt)
+NATIVE_SHARD_POOL_SIZE = settings.pdf_native_shard_workers or default_pool_size()
+NATIVE_SHARD_MIN_PAGES = settings.pdf_native_shard_min_pages
 
 
 class PDFParser(BaseParser):
     def __init__(self):
         self.logger = setup_logger(__name__)
-        if os.path.exists("/usr/bin/tesseract"):
-            pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
 
     # =====================================================
     # NATIVE PDF (TEXT-BASED)
     # =====================================================
-    def _extract_text_native(self, file_path: str) -> str:
+    def _extract_text_native(
+        self, source: ParseSource, page_indices: Optional[List[int]] = None, deadline: Optional[float] = None,
+        concurrent_jobs: int = 1, name: str = "", builder: Optional[ChunkBuilder] = None
+    ) -> Tuple[str, List[int]]:
+        """Trả về (markdown, các trang chưa trích xuất).
+
+        ``page_indices`` (0-based) giới hạn các trang cần trích xuất; có ``deadline`` thì
+        trích xuất theo cụm trang và dừng khi hết thời gian. Không có deadline thì tài liệu
+        đủ lớn được chia shard song song (số shard theo số trang và ``concurrent_jobs`` của lane);
+        process con cần mở lại file nên PDF parse trong RAM luôn chạy 1 thread.
+        """
         try:
-            self.logger.info(f"🚀 Converting native PDF: {Path(file_path).name}")
-            md_pages = pymupdf4llm.to_markdown(
-                file_path,
-                page_chunks=True,
-                write_images=False
-            )
-            pages_text = [page.get("text", "") for page in md_pages]
-            return f"\n\n{PAGE_BREAK_STR}\n\n".join(pages_text)
+            self.logger.info(f"🚀 Converting native PDF: {name or source_name(source)}")
+            with open_pdf(source) as doc:
+                indices = list(range(doc.page_count)) if page_indices is None else page_indices
+                # Header level tính 1 lần trên các trang được chọn (toàn bộ tài liệu nếu không chọn),
+                # dùng chung cho mọi cụm trang -> output giống hệt khi gọi 1 lần
+                hdr_info = pymupdf4llm.IdentifyHeaders(doc, pages=page_indices)
+
+                if deadline is None:
+                    shards = [indices] if is_in_memory(source) else plan_shards(
+                        indices, NATIVE_SHARD_POOL_SIZE, NATIVE_SHARD_MIN_PAGES, concurrent_jobs
+                    )
+                    with timed_stage("pdf.native_to_markdown"):
+                        if len(shards) > 1:
+                            try:
+                                self.logger.info(f"⚡ Native PDF: {len(indices)} trang chia {len(shards)} shard")
+                                pages_text = extract_sharded(str(source), shards, hdr_info, NATIVE_SHARD_POOL_SIZE)
+                                return self._join_pages(indices, pages_text, builder), []
+                            except Exception as e:
+                                self.logger.warning(f"⚠️ Shard extraction lỗi, chạy lại 1 thread: {e}")
+
+                        md_pages = pymupdf4llm.to_markdown(
+                            doc,
+                            pages=indices,
+                            hdr_info=hdr_info,
+                            page_chunks=True,
+                            write_images=False
+                        )
+                    pages_text = [page.get("text", "") for page in md_pages]
+                    return self._join_pages(indices, pages_text, builder), []
+
+                pages_text: List[str] = []
+                started_at = time.perf_counter()
+                while len(pages_text) < len(indices):
+                    # Cụm đầu 1 trang để đo tốc độ; sau đó chỉ nhận số trang kịp xong trước deadline
+                    chunk_size = NATIVE_PARTIAL_CHUNK_PAGES if pages_text else 1
+                    remaining = time_left(deadline)
+                    if pages_text:
+                        seconds_per_page = (time.perf_counter() - started_at) / len(pages_text)
+                        chunk_size = min(chunk_size, int(remaining / seconds_per_page) if seconds_per_page else chunk_size)
+                    if remaining <= 0 or chunk_size < 1:
+                        self.logger.warning(
+                            f"⏰ Hết deadline, dừng tại trang {indices[len(pages_text)] + 1} "
+                            f"({len(pages_text)}/{len(indices)} trang đã xong)"
+                        )
+                        break
+
+                    start = len(pages_text)
+                    with timed_stage("pdf.native_to_markdown"):
+                        md_pages = pymupdf4llm.to_markdown(
+                            doc,
+                            pages=indices[start:start + chunk_size],
+                            hdr_info=hdr_info,
+                            page_chunks=True,
+                            write_images=False
+                        )
+                    pages_text.extend(page.get("text", "") for page in md_pages)
+
+            missing_pages = [i + 1 for i in indices[len(pages_text):]]
+            return self._join_pages(indices, pages_text, builder), missing_pages
         except Exception as e:
             self.logger.error(f"❌ Native extraction failed: {e}")
-            return ""
+            return "", []
 
     # =====================================================
-    # IMAGE ENHANCEMENT (FIX LỖI 8 -> 0 & Binarization)
-    # =====================================================
-    # Thay thế hàm _enhance_image trong code của bạn bằng hàm này
-    def _enhance_image(self, img: Image.Image) -> Image.Image:
-        try:
-            # 1. Chuyển về ảnh xám
-            img = img.convert('L')
-
-            # 2. Thêm lề trắng (Padding)
-            img = ImageOps.expand(img, border=30, fill=255)
-
-            # 3. LÀM SẮC NÉT (Hero Step - Đã chứng minh hiệu quả nhất)
-            # Giúp biên dạng số rõ ràng mà không gây dính nét
-            enhancer_sharp = ImageEnhance.Sharpness(img)
-            img = enhancer_sharp.enhance(2.0)
-
-            # 4. Tăng tương phản nhẹ (Lọc nền)
-            enhancer_con = ImageEnhance.Contrast(img)
-            img = enhancer_con.enhance(1.2)
-
-            # KHÔNG DÙNG MinFilter
-            # KHÔNG DÙNG Resize/Upscale
-            # KHÔNG DÙNG Brightness reduction
-
-            return img
-        except Exception:
-            return img
-    # =====================================================
     # OCR WORKER
     # =====================================================
-    def _ocr_single_image_worker(self, image: Image.Image, index: int) -> Tuple[int, str]:
-        try:
-            # Xử lý ảnh trước khi đưa vào Tesseract
-            processed_img = self._enhance_image(image)
-
-            # Debug: Có thể lưu ảnh ra disk để kiểm tra xem ảnh sau xử lý trông thế nào
-            # processed_img.save(f"debug_page_{index}.png")
+    def _ocr_single_image_worker(
+        self, image: np.ndarray, index: int, deadline: Optional[float] = None, plan: Optional[OcrPlan] = None
+    ) -> Tuple[int, Optional[str]]:
+        """OCR 1 trang; trả text ``None`` nếu hết deadline trước/trong khi OCR (trang bị thiếu)."""
+        # Tesseract bị kill khi hết thời gian còn lại (0 = không giới hạn)
+        remaining = time_left(deadline)
+        if remaining is not None and remaining <= 0:
+            return index, None
+
+        # Góc xoay + ngôn ngữ quyết định 1 lần cho cả tài liệu (xem _plan_ocr)
+        plan = plan or default_plan()
+        rotate = page_rotation(detect_osd(image)) if plan.per_page_osd else plan.rotate
+        if rotate:
+            image = rotate_image(image, rotate)
 
-            text = pytesseract.image_to_string(
-                processed_img,
-                lang=settings.ocr_lang, # Đảm bảo lang bao gồm 'vie' hoặc 'eng'
-                config=TESSERACT_CONFIG_CMD
-            )
-            return index, text.strip()
+        try:
+            # Cache -> phân tích bảng -> Tesseract (xem ocr_service)
+            return index, ocr_image(image, plan.lang, deadline)
+        except RuntimeError as e:
+            if remaining is not None and "timeout" in str(e).lower():
+                self.logger.warning(f"⏰ OCR timeout tại trang {index} (hết deadline)")
+                return index, None
+            self.logger.warning(f"⚠️ OCR error at page {index}: {e}")
+            return index, ""
         except Exception as e:
             self.logger.warning(f"⚠️ OCR error at page {index}: {e}")
             return index, ""
 
+    def _plan_ocr(
+        self, doc: fitz.Document, indices: List[int], mat: fitz.Matrix, executor: ThreadPoolExecutor,
+        deadline: Optional[float] = None
+    ) -> OcrPlan:
+        """OSD trên vài trang mẫu -> góc xoay + tập ngôn ngữ dùng cho mọi trang của tài liệu."""
+        sample = sample_indices(indices, settings.ocr_osd_sample_pages)
+        if not settings.ocr_osd or not sample or is_expired(deadline):
+            return default_plan()
+
+        try:
+            with timed_stage("pdf.ocr_osd"):
+                # Render ở thread này (PyMuPDF không thread-safe), OSD song song; giữ pixmap tới khi xong
+                pixmaps = [
+                    doc.load_page(i).get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY) for i in sample
+                ]
+                results = list(executor.map(detect_osd, [pixmap_to_array(pix) for pix in pixmaps]))
+            del pixmaps
+        except Exception as e:
+            self.logger.warning(f"⚠️ OSD lỗi, OCR với ocr_lang mặc định: {e}")
+            return default_plan()
+
+        plan = plan_from_samples(results)
+        self.logger.info(
+            f"🧭 OSD {len(sample)} trang mẫu: lang={plan.lang}, "
+            f"rotate={'từng trang' if plan.per_page_osd else plan.rotate}"
+        )
+        return plan
+
+    @staticmethod
+    def _join_pages(indices: List[int], pages_text: List[str], builder: Optional[ChunkBuilder] = None) -> str:
+        """Ghép markdown các trang; mỗi trang là 1 section của ``builder`` (nếu có)."""
+        if builder is not None:
+            for i, text in zip(indices, pages_text):
+                builder.add_section(text, page=i + 1)
+        return PAGE_JOINER.join(pages_text)
+
     # =====================================================
     # OCR PDF (SCANNED PDF)
     # =====================================================
-    def _extract_text_ocr(self, file_path: str) -> str:
-        text_results: Dict[int, str] = {}
+    def _extract_text_ocr(
+        self, source: ParseSource, page_indices: Optional[List[int]] = None, deadline: Optional[float] = None,
+        builder: Optional[ChunkBuilder] = None, max_workers: Optional[int] = None
+    ) -> Tuple[str, List[int]]:
+        """Trả về (text, các trang chưa OCR xong). Chỉ OCR ``page_indices`` (0-based) nếu có;
+        dừng render/OCR trang mới khi hết ``deadline``. ``max_workers``: số CPU token scheduler
+        cấp cho job (mặc định ``TESSERACT_CONFIG_MAX_WORKER``)."""
+        workers = max(1, min(max_workers or TESSERACT_CONFIG_MAX_WORKER, TESSERACT_CONFIG_MAX_WORKER))
+        text_results: Dict[int, Optional[str]] = {}
         os.environ["OMP_THREAD_LIMIT"] = "1"
 
         # Zoom 2.0 hoặc 2.2 là tối ưu nhất.
@@ -113,100 +210,147 @@ class PDFParser(BaseParser):
         mat = fitz.Matrix(zoom, zoom)
 
         try:
-            doc = fitz.open(file_path)
-            total_pages = doc.page_count
+            ocr_started_at = time.perf_counter()
+            doc = open_pdf(source)
+            indices = list(range(doc.page_count)) if page_indices is None else page_indices
+            page_numbers = [i + 1 for i in indices]
+            total_pages = len(indices)
+
+            # Số trang đã render đang chờ/đang OCR. Pixmap được giữ tới khi OCR xong trang đó
+            # (worker đọc thẳng bộ nhớ pixmap), nên bộ nhớ tỉ lệ với số worker chứ không phải batch.
+            max_in_flight = max(1, min(TESSERACT_CONFIG_BATCH_SIZE, workers * 2))
 
             self.logger.info(
-                f"🖼 OCR PDF Processing: {total_pages} pages (Zoom={zoom}, Mode=Binary Threshold)"
+                f"🖼 OCR PDF Processing: {total_pages} pages (Zoom={zoom}, Workers={workers}, "
+                f"InFlight={max_in_flight})"
             )
 
-            batch_size = TESSERACT_CONFIG_BATCH_SIZE
-
-            for batch_start in range(0, total_pages, batch_size):
-                batch_end = min(batch_start + batch_size, total_pages)
-                batch_images = []
-
-                for i in range(batch_start, batch_end):
-                    page = doc.load_page(i)
-
-                    # Lấy pixmap, KHÔNG dùng alpha (trong suốt), dùng Grayscale để nhẹ
-                    pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY)
-                    
-                    # Convert bytes sang PIL Image
-                    img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
-
-                    batch_images.append((i + 1, img))
-
-                with ThreadPoolExecutor(max_workers=TESSERACT_CONFIG_MAX_WORKER) as executor:
-                    futures = {
-                        executor.submit(self._ocr_single_image_worker, img, idx): idx
-                        for idx, img in batch_images
-                    }
-
-                    for future in as_completed(futures):
-                        idx = futures[future]
-                        try:
-                            page_idx, text = future.result()
-                            text_results[page_idx] = text
-                        except Exception:
-                            text_results[idx] = ""
-
-                # Giải phóng bộ nhớ
-                for _, img in batch_images:
-                    img.close()
-                del batch_images
-                gc.collect()
+            in_flight: Dict[Future, Tuple[int, fitz.Pixmap]] = {}
+
+            def collect(done_futures):
+                for future in done_futures:
+                    idx, pix = in_flight.pop(future)
+                    try:
+                        _, text = future.result()
+                        text_results[idx] = text
+                    except Exception:
+                        # Future bị cancel khi hết deadline -> trang thiếu
+                        text_results[idx] = None
+                    # Giải phóng pixmap ngay khi trang OCR xong
+                    del pix
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                plan = self._plan_ocr(doc, indices, mat, executor, deadline)
+                for position, i in enumerate(indices):
+                    # Hết thời gian của request: không render/OCR thêm trang
+                    if is_expired(deadline):
+                        self.logger.warning(
+                            f"⏰ Hết deadline, dừng OCR tại trang {i + 1} ({position}/{total_pages} trang đã render)"
+                        )
+                        for future in in_flight:
+                            future.cancel()
+                        break
+
+                    if len(in_flight) >= max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+                    # Render chỉ ở thread này (PyMuPDF không thread-safe)
+                    with timed_stage("pdf.ocr_render_page"):
+                        page = doc.load_page(i)
+                        # Lấy pixmap, KHÔNG dùng alpha (trong suốt), dùng Grayscale để nhẹ
+                        pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY)
+
+                    # View NumPy trên bộ nhớ pixmap, không copy sang bytes/PIL
+                    future = executor.submit(
+                        self._ocr_single_image_worker, pixmap_to_array(pix), i + 1, deadline, plan
+                    )
+                    in_flight[future] = (i + 1, pix)
+
+                collect(list(in_flight))
 
             doc.close()
 
-            ordered_text = [text_results.get(i, "") for i in range(1, total_pages + 1)]
-            return f"\n\n{PAGE_BREAK_STR}\n\n".join(ordered_text)
+            missing_pages = [n for n in page_numbers if text_results.get(n) is None]
+            done_pages = total_pages - len(missing_pages)
+            ocr_elapsed = time.perf_counter() - ocr_started_at
+            if done_pages and ocr_elapsed > 0:
+                OCR_PAGES_PER_SECOND.observe(done_pages / ocr_elapsed)
+
+            # Giữ vị trí trang (page break) tới trang cuối cùng đã xong; trang thiếu ở giữa để trống
+            last_done = max((n for n, text in text_results.items() if text is not None), default=0)
+            done_numbers = [n for n in page_numbers if n <= last_done]
+            ordered_text = [text_results.get(n) or "" for n in done_numbers]
+            return self._join_pages([n - 1 for n in done_numbers], ordered_text, builder), missing_pages
 
         except Exception as e:
             self.logger.error(f"❌ OCR processing failed: {e}")
-            return ""
+            return "", []
 
-    # ... (Các phần check_page_limit và parse giữ nguyên)
-    def _check_page_limit(self, file_path: str, max_pages: int) -> bool:
-        try:
-            with fitz.open(file_path) as doc:
-                return doc.page_count <= max_pages
-        except Exception:
-            return False
-
-    def parse(self, file_path: str, config: dict) -> ParsedResult:
-        file_path = str(Path(file_path))
-        file_name = Path(file_path).name
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
+        config = config or {}
+        source = file_path if is_in_memory(file_path) else str(Path(file_path))
+        file_name = source_name(source, config)
 
         try:
-            with fitz.open(file_path) as doc:
-                if doc.page_count == 0:
-                    raise ValueError("PDF has 0 pages")
-
-            if not self._check_page_limit(file_path, settings.max_page_limit):
+            with open_pdf(source) as doc:
+                total_pages = doc.page_count
+            if total_pages == 0:
+                raise ValueError("PDF has 0 pages")
+
+            # Chọn trang theo request (pages / first_pages); giới hạn số trang áp dụng trên các trang được chọn
+            page_indices = select_pages(total_pages, config.get("pages"), config.get("first_pages"))
+            if not page_indices:
+                return ParsedResult(
+                    is_success=False,
+                    content="",
+                    failed_reason=f"Không có trang nào trong phạm vi yêu cầu (tài liệu có {total_pages} trang)"
+                )
+            if len(page_indices) > settings.max_page_limit:
                 return ParsedResult(
                     is_success=False,
                     content="",
-                    failed_reason=f"Page limit exceeded (> {settings.max_page_limit})"
+                    failed_reason=f"Page limit exceeded (> {settings.max_page_limit}), "
+                                  f"hãy giới hạn bằng tham số pages/first_pages"
                 )
+            if len(page_indices) == total_pages:
+                page_indices = None
 
             is_scan = config.get("is_pdf_scan", False)
+            deadline = config.get("deadline")
+            builder = builder_from_config(config)
 
             if is_scan:
-                content = self._extract_text_ocr(file_path)
+                content, missing_pages = self._extract_text_ocr(
+                    source, page_indices, deadline, builder, max_workers=config.get("cpu_tokens")
+                )
             else:
-                content = self._extract_text_native(file_path)
+                # Native thường nhanh: chỉ chia cụm trang để kiểm tra deadline khi client chấp nhận kết quả một phần
+                content, missing_pages = self._extract_text_native(
+                    source, page_indices, deadline if config.get("allow_partial") else None,
+                    concurrent_jobs=config.get("lane_in_use", 1), name=file_name, builder=builder
+                )
 
             if not content.strip():
                 return ParsedResult(
                     is_success=False,
                     content="",
-                    failed_reason="No content extracted"
+                    failed_reason="Hết thời gian trước khi trích xuất xong trang nào" if missing_pages
+                    else "No content extracted",
+                    is_partial=bool(missing_pages),
+                    missing_pages=missing_pages
                 )
 
+            if missing_pages:
+                self.logger.warning(f"⏰ Kết quả một phần {file_name}: thiếu {len(missing_pages)} trang")
+
+            content = content.strip()
             return ParsedResult(
                 is_success=True,
-                content=content.strip()
+                content=content,
+                is_partial=bool(missing_pages),
+                missing_pages=missing_pages,
+                chunks=builder.build(content) if builder is not None else None
             )
 
         except Exception as e:
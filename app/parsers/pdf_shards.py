@@ -0,0 +1,103 @@
+"""Trích xuất PDF native song song theo shard trang trên process pool.
+
+Mỗi process mở tài liệu độc lập và chạy ``pymupdf4llm.to_markdown`` cho một dải trang liên
+tiếp; header level (``IdentifyHeaders``) được tính 1 lần ở process gọi và gửi kèm cho mọi
+shard, nên ghép các shard theo thứ tự cho kết quả giống hệt khi chạy 1 thread.
+
+Module này chỉ import fitz/pymupdf4llm để process con (spawn) khởi động nhẹ.
+"""
+import atexit
+import math
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+from app.utils.resources import available_cpus, worker_count
+
+# Pool dùng chung cho mọi request của process hiện tại và số shard đang chạy trên đó
+_pool: Optional[ProcessPoolExecutor] = None
+_active_shards = 0
+_lock = threading.Lock()
+
+
+def _extract_shard(file_path: str, page_indices: List[int], hdr_info) -> List[str]:
+    """Chạy trong process con: markdown của từng trang trong ``page_indices``."""
+    import fitz
+    import pymupdf4llm
+
+    with fitz.open(file_path) as doc:
+        md_pages = pymupdf4llm.to_markdown(
+            doc,
+            pages=page_indices,
+            hdr_info=hdr_info,
+            page_chunks=True,
+            write_images=False
+        )
+    return [page.get("text", "") for page in md_pages]
+
+
+def default_pool_size() -> int:
+    """CPU (theo cgroup) chia đều cho các worker uvicorn (``WORKERS``); 1 nghĩa là không shard."""
+    return max(1, available_cpus() // worker_count())
+
+
+def _get_pool(size: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: không fork process đang có thread (event loop, executor, logging)
+        _pool = ProcessPoolExecutor(max_workers=size, mp_context=mp.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def plan_shards(page_indices: List[int], pool_size: int, min_pages_per_shard: int,
+                concurrent_jobs: int = 1) -> List[List[int]]:
+    """Chia ``page_indices`` thành các dải liên tiếp.
+
+    Số shard tăng theo số trang (mỗi shard ít nhất ``min_pages_per_shard`` trang), không vượt quá
+    phần pool còn rảnh và phần chia đều cho các job đang chạy trong lane (``concurrent_jobs``).
+    Tối đa 2 shard / process để cân tải khi các trang nặng nhẹ khác nhau.
+    """
+    with _lock:
+        free = pool_size - _active_shards
+    per_job = max(1, pool_size // max(1, concurrent_jobs))
+    workers = max(0, min(free, per_job))
+    if workers < 2 or len(page_indices) < 2 * min_pages_per_shard:
+        return [page_indices]
+
+    shard_count = min(workers * 2, len(page_indices) // min_pages_per_shard)
+    shard_size = math.ceil(len(page_indices) / shard_count)
+    return [page_indices[i:i + shard_size] for i in range(0, len(page_indices), shard_size)]
+
+
+def extract_sharded(file_path: str, shards: List[List[int]], hdr_info, pool_size: int) -> List[str]:
+    """Chạy các shard trên process pool, trả về markdown từng trang theo đúng thứ tự."""
+    global _active_shards
+    with _lock:
+        pool = _get_pool(pool_size)
+        _active_shards += len(shards)
+    try:
+        futures = [pool.submit(_extract_shard, file_path, shard, hdr_info) for shard in shards]
+        pages_text: List[str] = []
+        for future in futures:
+            pages_text.extend(future.result())
+        return pages_text
+    except BrokenProcessPool:
+        # Process con chết (OOM, segfault...): bỏ pool hỏng, lần sau tạo lại
+        shutdown_pool()
+        raise
+    finally:
+        with _lock:
+            _active_shards -= len(shards)
@@ -1,19 +1,40 @@
+from typing import Dict, Optional, Tuple
+
 from pptx import Presentation
+from app.config import settings
 from app.parsers.base_parser import BaseParser
+from app.services.ocr_service import EmbeddedImageOCR, image_placeholder
+from app.utils.chunking import builder_from_config
 from app.utils.markdown_utils import to_markdown
 from app.utils.logger import setup_logger
+from app.utils.metrics import timed_stage
 from app.models import ParsedResult
+from app.utils.parse_source import ParseSource, as_file, source_name
+
+# Ảnh trong slide (screenshot, trang scan) -> placeholder theo vị trí, OCR theo hash ảnh rồi chèn vào đúng vị trí
+OCR_EMBEDDED_IMAGES = settings.ocr_embedded_images
+
 
 class PPTParser(BaseParser):
     def __init__(self):
         self.logger = setup_logger(__name__)
 
-    def _extract_slide_text(self, slide, slide_index: int) -> str:
-        """Trích xuất toàn bộ text trong 1 slide."""
+    def _extract_slide_text(
+        self, slide, slide_index: int, image_ocr: Optional[EmbeddedImageOCR] = None,
+        images: Optional[Dict[str, Tuple[str, str]]] = None
+    ) -> str:
+        """Trích xuất toàn bộ text trong 1 slide; ảnh được đưa vào ``image_ocr`` và để lại placeholder."""
         texts = []
         for shape_index, shape in enumerate(slide.shapes, start=1):
             try:
-                if hasattr(shape, "text") and shape.text.strip():
+                if image_ocr is not None and hasattr(shape, "image"):
+                    key = image_ocr.submit(shape.image.blob)
+                    if key is not None:
+                        # Placeholder theo từng vị trí (ảnh trùng vẫn OCR 1 lần theo key) để giữ đúng tên/slide
+                        placeholder_id = f"{key}:{slide_index}:{shape_index}"
+                        images[placeholder_id] = (key, f"{shape.name} (slide {slide_index})")
+                        texts.append(image_placeholder(placeholder_id))
+                elif hasattr(shape, "text") and shape.text.strip():
                     texts.append(shape.text.strip())
                     self.logger.debug(f"📝 Slide {slide_index} - Shape {shape_index}: {shape.text.strip()[:60]}...")
             except Exception as e:
@@ -21,24 +42,44 @@ class PPTParser(BaseParser):
         return "\n".join(texts)
 
 
-    def parse(self, file_path: str) -> ParsedResult:
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
         """Phân tích file PowerPoint (PPTX) và trích xuất toàn bộ nội dung dạng Markdown."""
-        self.logger.info(f"📊 Bắt đầu parsing PPTX: {file_path}")
+        name = source_name(file_path, config)
+        self.logger.info(f"📊 Bắt đầu parsing PPTX: {name}")
 
-        prs = Presentation(file_path)
+        with timed_stage("pptx.load"):
+            prs = Presentation(as_file(file_path))
         total_slides = len(prs.slides)
         self.logger.info(f"🔍 Tệp có {total_slides} slide.")
 
+        config = config or {}
+        builder = builder_from_config(config)
         slides_content = []
-        for i, slide in enumerate(prs.slides, start=1):
-            self.logger.debug(f"➡️ Đang xử lý slide {i}/{total_slides}")
-            slide_text = self._extract_slide_text(slide, i)
-            if not slide_text.strip():
-                self.logger.debug(f"⚪ Slide {i} trống hoặc không chứa text.")
-            slides_content.append(f"## Slide {i}\n{slide_text}")
+        # Ảnh được OCR trên pool riêng trong lúc trích xuất text các slide sau
+        image_ocr = EmbeddedImageOCR(config.get("cpu_tokens"), config.get("deadline"), stage="pptx") \
+            if OCR_EMBEDDED_IMAGES else None
+        images: Dict[str, Tuple[str, str]] = {}
+        try:
+            for i, slide in enumerate(prs.slides, start=1):
+                self.logger.debug(f"➡️ Đang xử lý slide {i}/{total_slides}")
+                with timed_stage("pptx.slide"):
+                    slide_text = self._extract_slide_text(slide, i, image_ocr, images)
+                if not slide_text.strip():
+                    self.logger.debug(f"⚪ Slide {i} trống hoặc không chứa text.")
+                slides_content.append(f"## Slide {i}\n{slide_text}")
+            if image_ocr is not None:
+                with timed_stage("pptx.embedded_images"):
+                    slides_content = image_ocr.fill(slides_content, images)
+        finally:
+            if image_ocr is not None:
+                image_ocr.close()
+
+        if builder is not None:
+            for i, slide_content in enumerate(slides_content, start=1):
+                builder.add_section(to_markdown(slide_content), slide=i)
 
         full_text = "\n\n".join(slides_content)
         md = to_markdown(full_text)
 
-        self.logger.info(f"✅ Hoàn tất parsing PPTX: {file_path}")
-        return ParsedResult(is_success=True, content=md)
+        self.logger.info(f"✅ Hoàn tất parsing PPTX: {name}")
+        return ParsedResult(is_success=True, content=md, chunks=builder.build(md) if builder is not None else None)
@@ -1,11 +1,27 @@
+import hashlib
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
 import pandas as pd
 import re
 import numpy as np
 from pathlib import Path
+from typing import Dict, List, Optional
 from app.parsers.base_parser import BaseParser
+from app.services.part_cache import part_cache
 from app.utils.logger import setup_logger
+from app.utils.metrics import PART_CACHE_TOTAL, timed_stage
+from app.utils.chunking import builder_from_config
 from app.utils.markdown_utils import to_markdown
 from app.models import ParsedResult
+from app.utils.parse_source import ParseSource, as_file, is_in_memory, source_name
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+# Ô kiểu shared string: <c r="A1" t="s"><v>12</v></c>, có thể có prefix namespace (<x:c>...<x:v>, OpenXML SDK)
+_SHARED_REF_RE = re.compile(rb'<(?:\w+:)?c\b[^>]*\bt="s"[^>]*>\s*<(?:\w+:)?v>(\d+)</(?:\w+:)?v>')
+_SHARED_CELL_MARK = b't="s"'
 
 
 class XLSXParser(BaseParser):
@@ -110,45 +126,147 @@ class XLSXParser(BaseParser):
         
         return '\n'.join(processed_lines)
 
-    def parse(self, file_path: str) -> ParsedResult:
+    @staticmethod
+    def _shared_strings(zf: zipfile.ZipFile) -> List[str]:
+        root = ET.fromstring(zf.read("xl/sharedStrings.xml"))
+        return ["".join(t.text or "" for t in si.iter(f"{_NS_MAIN}t")) for si in root.iter(f"{_NS_MAIN}si")]
+
+    def _shared_digest(self, zf: zipfile.ZipFile, member: str, shared: List[str]) -> str:
+        """Digest các shared string mà sheet tham chiếu (theo thứ tự xuất hiện)."""
+        data = zf.read(member)
+        refs = _SHARED_REF_RE.findall(data)
+        digest = hashlib.blake2b(digest_size=16)
+        if not refs and _SHARED_CELL_MARK in data:
+            # Có ô shared string mà regex không nhận ra: dùng toàn bộ bảng chuỗi, thà mất cache còn hơn trả bản cũ
+            for text in shared:
+                digest.update(text.encode("utf-8") + b"\0")
+        for ref in refs:
+            digest.update(shared[int(ref)].encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def _sheet_part_keys(self, file_path: ParseSource) -> Dict[str, str]:
+        """Key cache cho từng worksheet (theo thứ tự workbook).
+
+        Key gồm CRC/size của ``sheetN.xml`` và ``styles.xml`` cùng digest các shared string mà
+        sheet tham chiếu: sửa 1 sheet thêm chuỗi mới vào ``sharedStrings.xml`` không làm mất
+        cache của các sheet khác. Digest được memo theo CRC/size của (sheet, ``sharedStrings.xml``):
+        chỉ khi một trong hai đổi mới phải giải nén sheet và parse bảng chuỗi, upload lại bản không
+        đổi chỉ đọc central directory, ``workbook.xml`` và rels. Trả về ``{}`` nếu không đọc được cấu
+        trúc (coi như cache miss).
+        """
+        if not part_cache.enabled:
+            return {}
+        try:
+            with zipfile.ZipFile(as_file(file_path)) as zf:
+                names = set(zf.namelist())
+                workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+                rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+                targets = {
+                    rel.get("Id"): rel.get("Target", "")
+                    for rel in rels.iter(f"{_NS_REL}Relationship")
+                    if rel.get("Type", "").endswith("/worksheet")
+                }
+                styles = [zf.getinfo("xl/styles.xml")] if "xl/styles.xml" in names else []
+                shared_info = zf.getinfo("xl/sharedStrings.xml") if "xl/sharedStrings.xml" in names else None
+                shared = None  # Chỉ parse khi có digest chưa memo
+                props = workbook.find(f"{_NS_MAIN}workbookPr")
+                date1904 = props.get("date1904", "0") if props is not None else "0"
+
+                keys = {}
+                for sheet in workbook.iter(f"{_NS_MAIN}sheet"):
+                    target = targets.get(sheet.get(_REL_ID))
+                    if target is None:
+                        continue  # chartsheet / dialogsheet: pandas không đọc
+                    if target.startswith("/"):
+                        member = target.lstrip("/")
+                    else:
+                        member = posixpath.normpath(posixpath.join("xl", target))
+                    digest = ""
+                    if shared_info is not None:
+                        digest_key = part_cache.make_key("xlsx.shared_refs", zf.getinfo(member), shared_info)
+                        digest = part_cache.get_json(digest_key)
+                        if digest is None:
+                            if shared is None:
+                                shared = self._shared_strings(zf)
+                            digest = self._shared_digest(zf, member, shared)
+                            part_cache.put_json(digest_key, digest)
+                    name = sheet.get("name")
+                    keys[name] = part_cache.make_key(
+                        "xlsx.sheet", zf.getinfo(member), *styles,
+                        extra=f"{name}:{date1904}:{digest}"
+                    )
+                return keys
+        except (zipfile.BadZipFile, KeyError, IndexError, ValueError, ET.ParseError) as e:
+            self.logger.debug(f"⚪ Không tạo được key cache theo sheet: {e}")
+            return {}
+
+    def parse(self, file_path: ParseSource, config: Optional[dict] = None) -> ParsedResult:
         """Phân tích file Excel và chuyển toàn bộ nội dung sang Markdown."""
-        file_path = Path(file_path)
-        self.logger.info(f"📊 Bắt đầu parsing Excel: {file_path.name}")
+        name = source_name(file_path, config)
+        self.logger.info(f"📊 Bắt đầu parsing Excel: {name}")
 
         try:
-            # Thêm xử lý kiểm tra file tồn tại
-            if not file_path.exists():
-                self.logger.error(f"❌ File không tồn tại: {file_path}")
-                return ParsedResult(is_success=False, content="", error="File không tồn tại")
-                
+            if is_in_memory(file_path):
+                file_size = file_path.getbuffer().nbytes
+            else:
+                file_path = Path(file_path)
+                # Thêm xử lý kiểm tra file tồn tại
+                if not file_path.exists():
+                    self.logger.error(f"❌ File không tồn tại: {file_path}")
+                    return ParsedResult(is_success=False, content="", failed_reason="File không tồn tại")
+                file_size = file_path.stat().st_size
+
             # Thêm xử lý kiểm tra kích thước file
-            file_size = file_path.stat().st_size
             if file_size == 0:
-                self.logger.error(f"❌ File rỗng: {file_path}")
-                return ParsedResult(is_success=False, content="", error="File rỗng")
-                
-            # Đọc file Excel
-            xls = pd.ExcelFile(file_path)
-            sheet_names = xls.sheet_names
-            self.logger.info(f"📑 File '{file_path.name}' có {len(sheet_names)} sheet: {', '.join(sheet_names)}")
+                self.logger.error(f"❌ File rỗng: {name}")
+                return ParsedResult(is_success=False, content="", failed_reason="File rỗng")
+
+            # Sheet không đổi so với revision trước lấy từ cache, chỉ parse lại sheet đã sửa
+            keys = self._sheet_part_keys(file_path)
+            cached = {sheet: part_cache.get_json(key) for sheet, key in keys.items()}
 
+            # Đọc file Excel (bỏ qua hẳn nếu mọi sheet đều có trong cache)
+            xls = None
+            if not keys or any(md is None for md in cached.values()):
+                with timed_stage("xlsx.load_workbook"):
+                    xls = pd.ExcelFile(as_file(file_path))
+                if keys and list(keys) != xls.sheet_names:
+                    self.logger.warning(f"⚠️ Danh sách sheet trong workbook.xml khác pandas, bỏ qua cache: {name}")
+                    keys, cached = {}, {}
+            sheet_names = xls.sheet_names if xls is not None else list(keys)
+            self.logger.info(f"📑 File '{name}' có {len(sheet_names)} sheet: {', '.join(sheet_names)}")
+
+            builder = builder_from_config(config)
             md_parts = []
             for sheet in sheet_names:
-                md_content = self._parse_sheet(xls, sheet)
-                # Tối ưu hóa bảng Markdown
-                if "*(Sheet" not in md_content:  # Chỉ tối ưu nếu không phải thông báo lỗi
-                    sheet_header = md_content.split('\n\n')[0]
-                    table_content = '\n\n'.join(md_content.split('\n\n')[1:])
-                    optimized_table = self._optimize_markdown_table(table_content)
-                    md_content = f"{sheet_header}\n\n{optimized_table}"
+                md_content = cached.get(sheet)
+                if keys:
+                    PART_CACHE_TOTAL.labels(parser="xlsx", result="hit" if md_content is not None else "miss").inc()
+                if md_content is None:
+                    with timed_stage("xlsx.sheet"):
+                        md_content = self._parse_sheet(xls, sheet)
+                    # Tối ưu hóa bảng Markdown
+                    if "*(Sheet" not in md_content:  # Chỉ tối ưu nếu không phải thông báo lỗi
+                        sheet_header = md_content.split('\n\n')[0]
+                        table_content = '\n\n'.join(md_content.split('\n\n')[1:])
+                        optimized_table = self._optimize_markdown_table(table_content)
+                        md_content = f"{sheet_header}\n\n{optimized_table}"
+                    if sheet in keys and "*(Không thể đọc" not in md_content:
+                        part_cache.put_json(keys[sheet], md_content)
                 md_parts.append(md_content)
+                if builder is not None:
+                    builder.add_section(to_markdown(md_content), sheet=sheet)
 
             result = "\n\n--- Sheet Break ---\n\n".join(md_parts)
             markdown_text = to_markdown(result.strip())
 
-            self.logger.info(f"✅ Hoàn tất parsing Excel: {file_path.name}")
-            return ParsedResult(is_success=True, content=markdown_text)
+            self.logger.info(f"✅ Hoàn tất parsing Excel: {name}")
+            return ParsedResult(
+                is_success=True,
+                content=markdown_text,
+                chunks=builder.build(markdown_text) if builder is not None else None
+            )
 
         except Exception as e:
-            self.logger.critical(f"🔥 Lỗi nghiêm trọng khi xử lý Excel '{file_path.name}': {e}")
-            return ParsedResult(is_success=False, content="", error=str(e))
+            self.logger.critical(f"🔥 Lỗi nghiêm trọng khi xử lý Excel '{name}': {e}")
+            return ParsedResult(is_success=False, content="", failed_reason=str(e))
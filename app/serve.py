@@ -0,0 +1,46 @@
+"""Chế độ production: N worker process uvicorn với trạng thái dùng chung.
+
+    python -m app.serve                 # workers = số CPU (theo cgroup nếu chạy trong container)
+    WORKERS=4 python -m app.serve
+
+Các worker dùng chung (SQLite tại ``SHARED_STATE_PATH``): slot lane HEAVY/LIGHT, bộ đếm
+rate-limit và result cache, nên giới hạn concurrency là giới hạn toàn cục, không nhân theo
+số worker. Dev/debug vẫn chạy ``uvicorn app.main:app --reload`` (1 process).
+"""
+import os
+
+import uvicorn
+
+from app.config import settings
+from app.utils.logger import setup_logger
+from app.utils.resources import available_cpus
+
+logger = setup_logger(__name__)
+
+
+def main() -> None:
+    workers = settings.workers or available_cpus()
+
+    # Worker được spawn và đọc lại Settings từ env -> bật shared state cho tất cả
+    os.environ["SHARED_STATE"] = "true"
+    os.environ["WORKERS"] = str(workers)
+    os.environ["SHARED_STATE_PATH"] = settings.shared_state_path
+
+    from app.services.shared_state import SharedStateStore
+
+    # Slot lane của lần chạy trước (nếu process bị kill) không còn giá trị
+    SharedStateStore(settings.shared_state_path).reset_lane_slots()
+
+    logger.info("🚀 Khởi động %s worker tại %s:%s (shared state: %s)",
+                workers, settings.host, settings.port, settings.shared_state_path)
+    uvicorn.run(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import mimetypes
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.conversion_service import MAX_FILE_SIZE, convert_document
+from app.services.cost_estimator import DocumentRejected, check_zip
+from app.services.profiler import ProfileRequest
+from app.utils.file_sniffer import ZIP_MAGIC, sniff_file_type
+from app.utils.json_response import dumps
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+BATCH_MAX_FILES = settings.batch_max_files
+BATCH_MAX_CONCURRENCY = settings.batch_max_concurrency
+
+
+@dataclass
+class BatchItem:
+    index: int
+    file_name: str
+    content_type: Optional[str]
+    content: Optional[bytes]
+    error: Optional[str] = None
+    status_code: int = 200
+
+
+def _guess_content_type(file_name: str) -> str:
+    return mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+
+def is_zip_archive(content: bytes, file_name: str) -> bool:
+    """Zip thường (không phải docx/pptx/xlsx) được coi là archive chứa nhiều file."""
+    return content.startswith(ZIP_MAGIC) and sniff_file_type(content, file_name) is None
+
+
+def expand_archive(archive_name: str, content: bytes) -> List[BatchItem]:
+    """Giải nén archive thành danh sách file, bỏ qua thư mục và file ẩn của macOS (archive giống zip bomb bị từ chối)."""
+    items = []
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            check_zip(zf.infolist())
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or name.rsplit("/", 1)[-1].startswith("."):
+                    continue
+                # Kiểm tra kích thước khai báo trước khi giải nén (tránh zip bomb)
+                if info.file_size > MAX_FILE_SIZE:
+                    items.append(BatchItem(
+                        index=-1, file_name=name, content_type=None, content=None, status_code=413,
+                        error=f"Kích thước file vượt quá giới hạn {MAX_FILE_SIZE / (1024*1024):.2f}MB",
+                    ))
+                    continue
+                items.append(BatchItem(
+                    index=-1, file_name=name, content_type=_guess_content_type(name),
+                    content=zf.read(info),
+                ))
+    except zipfile.BadZipFile as e:
+        items.append(BatchItem(
+            index=-1, file_name=archive_name, content_type=None, content=None,
+            status_code=400, error=f"Archive không hợp lệ: {e}",
+        ))
+    except DocumentRejected as e:
+        items.append(BatchItem(
+            index=-1, file_name=archive_name, content_type=None, content=None,
+            status_code=e.status_code, error=e.detail,
+        ))
+    return items
+
+
+def collect_batch_items(uploads: List[tuple]) -> List[BatchItem]:
+    """Chuẩn hoá danh sách (file_name, content_type, content) thành BatchItem, giải nén zip archive."""
+    items: List[BatchItem] = []
+    for file_name, content_type, content in uploads:
+        if is_zip_archive(content, file_name):
+            items.extend(expand_archive(file_name, content))
+        else:
+            items.append(BatchItem(
+                index=-1, file_name=file_name,
+                content_type=content_type or _guess_content_type(file_name),
+                content=content,
+            ))
+
+    if len(items) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch vượt quá giới hạn {BATCH_MAX_FILES} file ({len(items)} file)"
+        )
+
+    for i, item in enumerate(items):
+        item.index = i
+    return items
+
+
+async def _convert_item(item: BatchItem, batch_semaphore: asyncio.Semaphore,
+                        profile: Optional[ProfileRequest] = None) -> dict:
+    record = {"index": item.index, "file_name": item.file_name}
+    if item.error:
+        record.update(status_code=item.status_code, error=item.error, result=None)
+        return record
+
+    item_profile = profile.child(str(item.index)) if profile is not None else None
+    async with batch_semaphore:
+        try:
+            # Batch chờ slot trong lane HEAVY/LIGHT thay vì fail-fast như request đơn lẻ
+            result = await convert_document(
+                item.file_name, item.content_type, item.content, wait_for_slot=True, profile=item_profile
+            )
+            record.update(status_code=200, error=None, result=result)
+        except HTTPException as e:
+            record.update(status_code=e.status_code, error=e.detail, result=None)
+        except Exception as e:
+            logger.exception("❌ Batch item lỗi: %s", item.file_name)
+            record.update(status_code=500, error=str(e), result=None)
+        finally:
+            # Giải phóng nội dung file ngay khi xử lý xong
+            item.content = None
+    # Chỉ file thực sự được parse (không cache hit / lỗi trước khi parse) mới có profile
+    if item_profile is not None and item_profile.saved:
+        record["profile_id"] = item_profile.id
+    return record
+
+
+async def stream_batch(items: List[BatchItem], profile: Optional[ProfileRequest] = None) -> AsyncIterator[bytes]:
+    """Xử lý batch với concurrency giới hạn, trả kết quả (NDJSON) theo thứ tự hoàn thành.
+
+    ``profile``: profile từng file, lưu với id ``<profile.id>-<index>``; dòng của file có profile đã
+    lưu kèm ``profile_id``.
+    """
+    batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    tasks = [asyncio.create_task(_convert_item(item, batch_semaphore, profile)) for item in items]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            record = await next_done
+            if record["status_code"] == 200:
+                succeeded += 1
+            yield dumps(record) + b"\n"
+
+        summary = {"summary": {"total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}}
+        logger.info("📦 Hoàn tất batch: %s/%s file thành công", succeeded, len(items))
+        yield dumps(summary) + b"\n"
+    finally:
+        # Client ngắt kết nối giữa chừng -> huỷ các file chưa xử lý
+        for task in tasks:
+            if not task.done():
+                task.cancel()
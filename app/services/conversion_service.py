@@ -0,0 +1,413 @@
+import asyncio
+import contextvars
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.models import Chunk, FileResponse
+from app.services import quotas
+from app.services.cost_estimator import DocumentEstimate, DocumentRejected, estimate_document
+from app.services.file_service import save_upload_to_temp
+from app.services.lanes import LaneBusyError, LocalLane, create_lane
+from app.services.parser_factory import ParserFactory
+from app.services.profiler import ProfileRequest, profiled
+from app.services.result_cache import result_cache
+from app.services.scheduler import ResourceBusyError, lane_limits, scheduler
+from app.services.scratch import ScratchQuotaExceeded, scratch
+from app.utils.chunking import builder_from_config
+from app.utils.client_identity import client_weight, get_client_id
+from app.utils.deadline import get_deadline, time_left
+from app.utils.file_sniffer import sniff_file_type
+from app.utils.logger import setup_logger
+from app.utils.page_selection import select_pages
+from app.utils.parse_source import ParseSource
+from app.utils.metrics import (
+    ESTIMATE_SECONDS,
+    EXECUTOR_QUEUE_DEPTH,
+    LANE_IN_USE,
+    LANE_LIMIT,
+    OCR_CLASSIFICATION_SECONDS,
+    OUTPUT_CHARS,
+    PARSE_SECONDS,
+    PARSE_SOURCE_TOTAL,
+    PARTIAL_RESULTS_TOTAL,
+    QUEUE_WAIT_SECONDS,
+    REQUESTS_TOTAL,
+    RESULT_CACHE_TOTAL,
+    TEMP_WRITE_SECONDS,
+    timed,
+)
+
+logger = setup_logger(__name__)
+
+# --- CONFIGURATION ---
+
+HEAVY_EXTENSIONS = settings.heavy_extensions or {'pdf'}
+
+# Cấu hình giới hạn Semaphore (0 = tự tính theo CPU/RAM của container)
+AUTO_LIMIT_HEAVY, AUTO_LIMIT_LIGHT = lane_limits()
+LIMIT_HEAVY = settings.max_concurrent_parser_heavy or AUTO_LIMIT_HEAVY
+LIMIT_LIGHT = settings.max_concurrent_parser_light or AUTO_LIMIT_LIGHT
+
+MAX_FILE_SIZE = settings.max_file_size * 1024 * 1024
+HEAVY_OFFICE_BYTES = settings.heavy_office_mb * 1024 * 1024
+PARSE_TIMEOUT = settings.timeout or 300
+# File nhỏ parse từ BytesIO; .doc luôn cần file trên disk cho LibreOffice
+IN_MEMORY_MAX_BYTES = settings.in_memory_parse_max_kb * 1024
+FILE_ONLY_EXTENSIONS = {"doc"}
+# Parse phải dừng trước deadline của request một chút để trả 408 thay vì middleware cắt 504
+DEADLINE_MARGIN_SECONDS = 1.0
+# allow_partial: chờ thêm sau deadline để parser gom các trang đã xong (< DEADLINE_MARGIN_SECONDS)
+PARTIAL_GRACE_SECONDS = 0.75
+
+# Batch luôn chừa số slot này của lane cho request interactive (lane chỉ có 1 slot thì không chừa)
+BATCH_LANE_RESERVE = 1
+
+HEAVY_LANE_NAME = "HEAVY (OCR/PDF)"
+LIGHT_LANE_NAME = "LIGHT (Text/Doc/PDF native)"
+
+# Lane cục bộ theo process, hoặc dùng chung giữa các worker khi bật shared state
+lane_heavy = create_lane("heavy", HEAVY_LANE_NAME, LIMIT_HEAVY)
+lane_light = create_lane("light", LIGHT_LANE_NAME, LIMIT_LIGHT)
+
+executor = ThreadPoolExecutor(max_workers=LIMIT_HEAVY + LIMIT_LIGHT + 4)
+
+# Gauge được tính tại thời điểm scrape /metrics
+LANE_LIMIT.labels(lane="heavy").set(LIMIT_HEAVY)
+LANE_LIMIT.labels(lane="light").set(LIMIT_LIGHT)
+LANE_IN_USE.labels(lane="heavy").set_function(lane_heavy.in_use)
+LANE_IN_USE.labels(lane="light").set_function(lane_light.in_use)
+EXECUTOR_QUEUE_DEPTH.set_function(lambda: executor._work_queue.qsize())
+
+
+def _select_lane(file_ext: str, source: ParseSource, config: dict, estimate: DocumentEstimate) -> LocalLane:
+    """Logic chọn lane (Phân luồng): PDF scan / Office rất lớn hoặc có ảnh cần OCR -> HEAVY, còn lại -> LIGHT."""
+    config["is_pdf_scan"] = False
+    if file_ext not in HEAVY_EXTENSIONS:
+        # Workbook/tài liệu giải nén hàng trăm MB không chiếm lane LIGHT của các file nhỏ
+        if (estimate.uncompressed_bytes or 0) > HEAVY_OFFICE_BYTES or estimate.images:
+            return lane_heavy
+        return lane_light
+
+    if file_ext != "pdf":
+        return lane_heavy
+
+    config["page_count"] = estimate.pages
+    if estimate.text_free:
+        # Các trang được chọn không có text layer: phân loại chắc chắn ra OCR, bỏ qua bước render trang
+        config["is_pdf_scan"] = True
+        return lane_heavy
+
+    # Import lazy: pdf_utils kéo theo fitz/pymupdf4llm
+    from app.utils.pdf_utils import decide_should_ocr_file
+
+    # Phân loại trên chính các trang được chọn: bìa scan không làm các trang text phía sau bị OCR
+    page_indices = None
+    if estimate.pages and (config.get("pages") or config.get("first_pages")):
+        page_indices = select_pages(estimate.pages, config.get("pages"), config.get("first_pages"))
+    with timed(OCR_CLASSIFICATION_SECONDS):
+        decision = decide_should_ocr_file(source, page_indices)
+    is_scan = decision["should_ocr_file"]
+    config["page_count"] = decision.get("page_count")
+    if is_scan:
+        config["is_pdf_scan"] = True
+        return lane_heavy
+    return lane_light
+
+
+async def convert_document(
+    file_name: str,
+    content_type: Optional[str],
+    content: bytes,
+    *,
+    wait_for_slot: bool = False,
+    allow_partial: bool = False,
+    time_budget: Optional[float] = None,
+    pages: Optional[List[int]] = None,
+    first_pages: Optional[int] = None,
+    output_format: str = "markdown",
+    chunk_max_tokens: Optional[int] = None,
+    profile: Optional[ProfileRequest] = None,
+) -> FileResponse:
+    """Pipeline chung: sniff -> cache -> lưu file tạm (file lớn) -> chọn lane -> parse -> FileResponse.
+
+    Dùng cho cả ``/sdlc/convert-document`` và batch endpoint. Lỗi được raise dưới dạng
+    ``HTTPException``. Nếu ``wait_for_slot`` là False, lane quá tải sẽ bị reject ngay
+    (429); batch dùng True để xếp hàng chờ slot, chừa slot và nhường tài nguyên cho request đơn.
+    Thứ tự cấp tài nguyên và quota chi phí tính theo client của request (``client_identity``).
+
+    ``time_budget`` (giây, tính từ lúc nhận request) rút ngắn deadline của parse. Với
+    ``allow_partial``, hết deadline thì trả các trang đã xong (``is_partial``/``missing_pages``)
+    thay vì 408. ``pages`` (1-based) / ``first_pages`` giới hạn các trang PDF cần trích xuất.
+    ``output_format="chunks"`` trả thêm ``chunks`` (tối đa ``chunk_max_tokens`` token mỗi chunk).
+    ``profile``: đo CPU profile của parse, ``profile.saved`` cho biết đã lưu (xem ``profiler``).
+    """
+    received_at = time.monotonic()
+    scratch_dir = None
+    parse_future = None
+    grant = None
+    file_id = None
+    config = dict()
+    # Tuỳ chọn ảnh hưởng tới nội dung trả về -> truyền cho parser và là một phần của cache key
+    parse_options = {
+        key: value for key, value in (("pages", pages), ("first_pages", first_pages)) if value is not None
+    }
+    if output_format == "chunks":
+        parse_options["output_format"] = output_format
+        parse_options["chunk_max_tokens"] = chunk_max_tokens or settings.chunk_max_tokens
+    config.update(parse_options)
+    start_time = time.time()
+    file_size = len(content)
+    parser_label = "unknown"
+    lane_label = "none"
+    status_code = 500
+    try:
+        if file_size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Kích thước file vượt quá giới hạn {MAX_FILE_SIZE / (1024*1024):.2f}MB"
+            )
+
+        # 1. Xác định loại file theo nội dung (magic bytes), reject trước khi ghi file tạm
+        file_ext = sniff_file_type(content, file_name)
+        if file_ext is None:
+            claimed_ext = file_name.split(".")[-1].lower() if "." in file_name else ""
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {claimed_ext or 'unknown'}")
+
+        try:
+            parser = ParserFactory.get_parser(file_ext)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}")
+        parser_label = type(parser).__name__
+
+        # Cache kết quả: cùng nội dung + tuỳ chọn -> trả luôn, không chiếm slot lane
+        cache_key = None
+        if result_cache.enabled:
+            cache_key = result_cache.make_key(content, file_ext, parse_options)
+            cached_content = await asyncio.to_thread(result_cache.get, cache_key)
+            RESULT_CACHE_TOTAL.labels(result="hit" if cached_content is not None else "miss").inc()
+            if cached_content is not None:
+                lane_label = "cache"
+                status_code = 200
+                logger.info("♻️ Cache hit: %s (ext=%s)", file_name, file_ext)
+                cached_chunks = None
+                if output_format == "chunks":
+                    payload = json.loads(cached_content)
+                    cached_content = payload["content"]
+                    cached_chunks = [Chunk(**chunk) for chunk in payload["chunks"]]
+                return FileResponse(
+                    id=str(uuid.uuid4()),
+                    file_name=file_name,
+                    file_size=file_size,
+                    file_type=content_type,
+                    extracted_content=cached_content,
+                    chunks=cached_chunks
+                )
+
+        # Ước lượng chi phí từ metadata: từ chối sớm file quá lớn / zip bomb trước khi ghi file tạm và chiếm lane
+        try:
+            with timed(ESTIMATE_SECONDS):
+                # Mở PDF (fitz, get_text) / đọc member zip: chạy trong thread, không chặn event loop
+                estimate = await asyncio.to_thread(estimate_document, content, file_ext, pages, first_pages)
+        except DocumentRejected as e:
+            logger.warning("⚠️ Từ chối trước khi parse (%s): %s - %s", e.reason, file_name, e.detail)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+        # 2. File nhỏ parse thẳng từ RAM; file lớn lưu vào scratch dir riêng của request
+        # (đuôi theo loại đã nhận diện). Sau đó chọn Semaphore phù hợp
+        if file_size <= IN_MEMORY_MAX_BYTES and file_ext not in FILE_ONLY_EXTENSIONS:
+            file_id = str(uuid.uuid4())
+            source = BytesIO(content)
+            PARSE_SOURCE_TOTAL.labels(source="memory").inc()
+            logger.debug("🧠 Parse trong RAM: %s (type=%s, %s bytes)", file_name, file_ext, file_size)
+        else:
+            try:
+                # Có thể quét lại dung lượng scratch (os.walk) -> không chạy trên event loop
+                await asyncio.to_thread(scratch.check_quota, file_size)
+            except ScratchQuotaExceeded as e:
+                logger.warning("⚠️ %s, từ chối: %s", e.reason, file_name)
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"{e.reason}, vui lòng thử lại sau.",
+                    headers={"Retry-After": "30"}
+                )
+            scratch_dir = scratch.create()
+            config["scratch_dir"] = str(scratch_dir)
+            with timed(TEMP_WRITE_SECONDS):
+                file_id, temp_path = await save_upload_to_temp(file_name, content, file_ext, str(scratch_dir))
+            source = temp_path
+            PARSE_SOURCE_TOTAL.labels(source="disk").inc()
+            logger.debug("🗂️ File tạm lưu tại: %s (type=%s)", temp_path, file_ext)
+        config["file_name"] = file_name
+        config["file_ext"] = file_ext
+
+        # Phân loại PDF render vài trang -> chạy trong thread, không chặn event loop
+        lane = await asyncio.to_thread(_select_lane, file_ext, source, config, estimate)
+        lane_name = lane.name
+        lane_label = lane.key
+
+        # Deadline của request (TimeoutMiddleware) và time budget của client -> parser biết còn bao nhiêu thời gian
+        deadlines = []
+        if get_deadline() is not None:
+            deadlines.append(get_deadline() - DEADLINE_MARGIN_SECONDS)
+        if time_budget:
+            deadlines.append(received_at + time_budget)
+        if deadlines:
+            config["deadline"] = min(deadlines)
+        config["allow_partial"] = allow_partial
+
+        queued_at = time.perf_counter()
+
+        # Chi phí ước lượng của job: CPU token (số thread OCR) + RAM đặt chỗ
+        job_pages = config.get("page_count")
+        if job_pages and (pages or first_pages):
+            job_pages = min(job_pages, len(pages) if pages else first_pages)
+        cost = scheduler.estimate(file_ext, file_size, job_pages, config["is_pdf_scan"], estimate)
+        ocr_pages = int(cost.units) if cost.kind == "ocr" else 0
+
+        client = get_client_id()
+        tier = "batch" if wait_for_slot else "interactive"
+        if quotas.enabled():
+            try:
+                await asyncio.to_thread(quotas.check, client, ocr_pages)
+            except quotas.QuotaExceeded as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Client đã dùng hết quota {e.resource} ({e.limit}), vui lòng thử lại sau.",
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+
+        def run_parse():
+            # Queue wait = chờ slot lane + chờ thread rảnh trong executor
+            started_at = time.perf_counter()
+            QUEUE_WAIT_SECONDS.labels(lane=lane_label).observe(started_at - queued_at)
+            # Trừ quota OCR chỉ khi job thực sự chạy: 429 vì lane/tài nguyên bận không tốn quota
+            quotas.consume_ocr_pages(client, ocr_pages)
+            try:
+                with profiled(profile, {"file_name": file_name, "parser": parser_label, "lane": lane_label,
+                                           "file_size": file_size, "client": client}):
+                    return parser.parse(source, config)
+            finally:
+                elapsed = time.perf_counter() - started_at
+                PARSE_SECONDS.labels(parser=parser_label, lane=lane_label).observe(elapsed)
+                quotas.charge(client, tier, elapsed * config.get("cpu_tokens", 1), ocr_pages)
+
+        # 3-4. Giữ slot lane, chờ tài nguyên và Parse
+        # Fail-fast: Nếu lane đang quá tải (và không chờ slot), reject ngay để client không chờ
+        try:
+            reserve = BATCH_LANE_RESERVE if wait_for_slot and lane.limit > BATCH_LANE_RESERVE else 0
+            async with lane.slot(wait=wait_for_slot, reserve=reserve):
+                # Request đơn lẻ chỉ chờ tài nguyên tối đa SCHEDULER_MAX_WAIT (và không quá deadline)
+                wait_timeout = None
+                if not wait_for_slot:
+                    remaining = time_left(config.get("deadline"))
+                    wait_timeout = settings.scheduler_max_wait if remaining is None \
+                        else min(settings.scheduler_max_wait, remaining)
+                grant = await scheduler.acquire(
+                    cost, wait_timeout, client=client, weight=client_weight(client), interactive=not wait_for_slot
+                )
+                config["cpu_tokens"] = cost.cpu
+
+                # Thời gian chờ slot đã trừ vào deadline
+                parse_timeout = PARSE_TIMEOUT
+                remaining = time_left(config.get("deadline"))
+                if remaining is not None:
+                    grace = PARTIAL_GRACE_SECONDS if allow_partial else 0.0
+                    parse_timeout = max(0.0, min(parse_timeout, remaining + grace))
+                # Số job đang chạy trong lane (kể cả job này) -> parser tự giảm mức song song khi lane bận
+                config["lane_in_use"] = max(1, await lane.count_in_use())
+                logger.info("🚀 Bắt đầu parse (%s, client=%s): %s", lane_name, client, file_name)
+
+                # Chạy blocking code trong ThreadPoolExecutor
+                # Dùng asyncio.wait_for để set timeout cứng, tránh treo vĩnh viễn
+                # copy_context: giữ request_id (log) khi chạy trong thread của executor
+                parse_future = executor.submit(contextvars.copy_context().run, run_parse)
+                parsed_result = await asyncio.wait_for(asyncio.wrap_future(parse_future), timeout=parse_timeout)
+
+        except LaneBusyError:
+            logger.warning("⚠️ %s Lane quá tải (%s request), từ chối: %s", lane_name, lane.limit, file_name)
+            # Trả về 429 để client biết server bận, có thể retry sau
+            raise HTTPException(status_code=429, detail=f"Server đang bận xử lý nhiều file {lane_name}, vui lòng thử lại sau.")
+        except ResourceBusyError:
+            logger.warning(
+                "⚠️ Không đủ tài nguyên (cần %s CPU, %.0fMB), từ chối: %s", cost.cpu, cost.memory / 2**20, file_name
+            )
+            raise HTTPException(
+                status_code=429,
+                detail="Server đang bận (hết CPU/RAM dành cho parse), vui lòng thử lại sau.",
+                headers={"Retry-After": "5"}
+            )
+        except asyncio.TimeoutError:
+            logger.error("⏰ Parse timeout (%.1fs): %s", parse_timeout, file_name)
+            raise HTTPException(status_code=408, detail="File xử lý quá lâu (Timeout), vui lòng kiểm tra lại file.")
+
+        # Hết deadline giữa chừng: chỉ trả kết quả một phần nếu client cho phép
+        if parsed_result.is_partial and (not allow_partial or not parsed_result.is_success):
+            logger.error("⏰ Hết time budget, thiếu %s trang: %s", len(parsed_result.missing_pages), file_name)
+            raise HTTPException(status_code=408, detail="File xử lý quá lâu (Timeout), vui lòng kiểm tra lại file.")
+
+        if not parsed_result.is_success:
+            raise HTTPException(status_code=400, detail=parsed_result.failed_reason)
+
+        # Parser không tự chia chunk (txt/md/json): chia trên toàn bộ nội dung Markdown
+        chunks = parsed_result.chunks
+        if output_format == "chunks" and chunks is None:
+            builder = builder_from_config(config)
+            builder.add_section(parsed_result.content)
+            chunks = builder.build(parsed_result.content)
+
+        elapsed_time = time.time() - start_time
+        status_code = 200
+        OUTPUT_CHARS.labels(parser=parser_label).observe(len(parsed_result.content))
+        if parsed_result.is_partial:
+            PARTIAL_RESULTS_TOTAL.labels(parser=parser_label).inc()
+        elif cache_key is not None:
+            cache_value = parsed_result.content
+            if chunks is not None:
+                cache_value = json.dumps(
+                    {"content": parsed_result.content, "chunks": [chunk.model_dump() for chunk in chunks]},
+                    ensure_ascii=False
+                )
+            await asyncio.to_thread(result_cache.put, cache_key, cache_value)
+        logger.info(f"✅ {elapsed_time}s Parsed thành công: id={file_id} ext={file_ext} lane={lane_name}")
+
+        return FileResponse(
+            id=file_id,
+            file_name=file_name,
+            file_size=file_size,
+            file_type=content_type,
+            extracted_content=parsed_result.content,
+            is_partial=parsed_result.is_partial,
+            missing_pages=parsed_result.missing_pages,
+            chunks=chunks
+        )
+
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    except Exception as e:
+        logger.exception("❌ Failed to process upload: filename=%s error=%s", file_name, str(e))
+        raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý file: {str(e)}")
+    finally:
+        REQUESTS_TOTAL.labels(parser=parser_label, lane=lane_label, status=status_code).inc()
+
+        # 5. Cleanup: parse còn chạy trong thread (timeout) thì chỉ trả tài nguyên / xoá scratch dir khi thread xong
+        if grant is not None:
+            if parse_future is None:
+                scheduler.release(grant, observe=False)
+            elif not parse_future.done():
+                parse_future.add_done_callback(lambda _: scheduler.release(grant))
+            else:
+                scheduler.release(grant)
+        if scratch_dir is not None:
+            if parse_future is not None and not parse_future.done():
+                logger.debug("⏳ Parse còn chạy, hoãn xoá scratch dir: %s", scratch_dir)
+                parse_future.add_done_callback(lambda _: scratch.release(scratch_dir))
+            else:
+                scratch.release(scratch_dir)
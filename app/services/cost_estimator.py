@@ -0,0 +1,180 @@
+"""Ước lượng chi phí tài liệu trước khi parse, chỉ đọc metadata (vài ms).
+
+- PDF: số trang (page tree) và các trang được chọn (tối đa ``max_inspect_pages``) có text layer hay không;
+- XLSX: số ô theo ``<dimension ref>`` ở đầu mỗi sheet (chỉ giải nén vài KB đầu);
+- DOCX: số trang / số từ trong ``docProps/app.xml``;
+- PPTX: số slide trong zip;
+- DOCX/PPTX: số ảnh nhúng cần OCR (khi bật ``OCR_EMBEDDED_IMAGES``);
+- mọi file zip (OOXML, archive của batch): tổng dung lượng giải nén và tỉ lệ nén (zip bomb).
+
+Kết quả dùng để từ chối sớm (413 quá lớn, 422 hỏng / zip bomb) trước khi ghi file tạm hay chiếm
+slot lane, để chọn lane và làm chi phí xếp hàng cho scheduler. Giới hạn bên trong parser vẫn giữ.
+"""
+import io
+import re
+import zipfile
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.config import settings
+from app.utils.logger import setup_logger
+from app.utils.metrics import PREPARSE_REJECTED_TOTAL
+from app.utils.page_selection import select_pages
+
+logger = setup_logger(__name__)
+
+MB = 1024 * 1024
+MAX_UNCOMPRESSED_BYTES = settings.max_uncompressed_mb * MB
+# Tỉ lệ nén chỉ xét khi dung lượng giải nén đủ lớn: XML nhỏ lặp nhiều nén rất tốt mà vô hại
+RATIO_MIN_UNCOMPRESSED_BYTES = 16 * MB
+# <dimension> nằm ngay sau <sheetPr>/<sheetViews>... ở đầu sheet XML
+DIMENSION_HEAD_BYTES = 4096
+APP_PROPS_MAX_BYTES = 1 * MB
+
+_SHEET_RE = re.compile(r"^xl/worksheets/[^/]+\.xml$")
+_SLIDE_RE = re.compile(r"^ppt/slides/slide\d+\.xml$")
+_MEDIA_PREFIXES = {"docx": "word/media/", "pptx": "ppt/media/"}
+_DIMENSION_RE = re.compile(rb'<(?:\w+:)?dimension\s+ref="([^"]+)"')
+_CELL_RE = re.compile(r"^\$?([A-Z]+)\$?(\d+)$")
+_PAGES_RE = re.compile(rb"<Pages>(\d+)</Pages>")
+_WORDS_RE = re.compile(rb"<Words>(\d+)</Words>")
+
+
+@dataclass
+class DocumentEstimate:
+    pages: Optional[int] = None  # Trang PDF / DOCX, slide PPTX
+    cells: Optional[int] = None  # XLSX: tổng số ô của các sheet có <dimension>
+    words: Optional[int] = None
+    uncompressed_bytes: Optional[int] = None  # File zip (OOXML)
+    images: int = 0  # Ảnh nhúng đủ lớn để OCR (DOCX/PPTX, khi bật OCR_EMBEDDED_IMAGES)
+    # PDF: mọi trang mà bước phân loại sẽ kiểm tra đều không có text layer -> chắc chắn OCR
+    text_free: bool = False
+
+
+class DocumentRejected(Exception):
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+
+def _reject(status_code: int, reason: str, detail: str) -> None:
+    PREPARSE_REJECTED_TOTAL.labels(reason=reason).inc()
+    raise DocumentRejected(status_code, reason, detail)
+
+
+def check_zip(infos: List[zipfile.ZipInfo]) -> int:
+    """Tổng dung lượng giải nén khai báo trong central directory; raise nếu quá lớn hoặc giống zip bomb.
+
+    ``zipfile`` không đọc quá ``file_size`` khai báo, nên kiểm tra trên header là đủ.
+    """
+    uncompressed = sum(info.file_size for info in infos)
+    compressed = sum(info.compress_size for info in infos)
+    if uncompressed > MAX_UNCOMPRESSED_BYTES:
+        _reject(413, "uncompressed", f"Dung lượng giải nén vượt quá giới hạn {settings.max_uncompressed_mb}MB")
+    ratio = uncompressed / max(1, compressed)
+    if uncompressed > RATIO_MIN_UNCOMPRESSED_BYTES and ratio > settings.max_compression_ratio:
+        _reject(422, "zip_ratio", f"Tỉ lệ nén bất thường ({ratio:.0f}x), nghi ngờ zip bomb")
+    return uncompressed
+
+
+def _column_number(letters: str) -> int:
+    number = 0
+    for char in letters:
+        number = number * 26 + ord(char) - ord("A") + 1
+    return number
+
+
+def _range_cells(ref: str) -> Optional[int]:
+    """``"A1:C10"`` -> 30, ``"A1"`` -> 1; ``None`` nếu không đọc được."""
+    corners = [_CELL_RE.match(part) for part in ref.upper().split(":")]
+    if not corners or len(corners) > 2 or not all(corners):
+        return None
+    first, last = corners[0], corners[-1]
+    rows = int(last.group(2)) - int(first.group(2)) + 1
+    cols = _column_number(last.group(1)) - _column_number(first.group(1)) + 1
+    return max(1, rows) * max(1, cols)
+
+
+def _xlsx_cells(zf: zipfile.ZipFile) -> Optional[int]:
+    total = None
+    for name in zf.namelist():
+        if not _SHEET_RE.match(name):
+            continue
+        with zf.open(name) as f:
+            match = _DIMENSION_RE.search(f.read(DIMENSION_HEAD_BYTES))
+        cells = _range_cells(match.group(1).decode("ascii", "replace")) if match else None
+        if cells is not None:
+            total = (total or 0) + cells
+    return total
+
+
+def _read_small(zf: zipfile.ZipFile, name: str) -> bytes:
+    try:
+        info = zf.getinfo(name)
+    except KeyError:
+        return b""
+    return zf.read(info) if info.file_size <= APP_PROPS_MAX_BYTES else b""
+
+
+def _estimate_ooxml(content: bytes, file_ext: str) -> DocumentEstimate:
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        estimate = DocumentEstimate(uncompressed_bytes=check_zip(zf.infolist()))
+        if file_ext == "xlsx":
+            estimate.cells = _xlsx_cells(zf)
+            if estimate.cells and estimate.cells > settings.max_xlsx_cells:
+                _reject(413, "cells", f"Workbook có khoảng {estimate.cells:,} ô, vượt quá giới hạn {settings.max_xlsx_cells:,}")
+        elif file_ext == "docx":
+            # app.xml do trình soạn thảo ghi lúc lưu: có thể thiếu hoặc cũ, chỉ dùng để ước lượng
+            props = _read_small(zf, "docProps/app.xml")
+            pages, words = _PAGES_RE.search(props), _WORDS_RE.search(props)
+            estimate.pages = int(pages.group(1)) if pages else None
+            estimate.words = int(words.group(1)) if words else None
+        elif file_ext == "pptx":
+            estimate.pages = sum(1 for name in zf.namelist() if _SLIDE_RE.match(name))
+        if settings.ocr_embedded_images and file_ext in _MEDIA_PREFIXES:
+            min_bytes = settings.ocr_embedded_min_kb * 1024
+            estimate.images = sum(
+                1 for info in zf.infolist()
+                if info.filename.startswith(_MEDIA_PREFIXES[file_ext]) and info.file_size >= min_bytes
+            )
+    if file_ext in ("docx", "pptx") and estimate.pages and estimate.pages > settings.max_office_pages:
+        _reject(413, "pages", f"Tài liệu có {estimate.pages} trang/slide, vượt quá giới hạn {settings.max_office_pages}")
+    return estimate
+
+
+def _estimate_pdf(content: bytes, pages: Optional[List[int]], first_pages: Optional[int]) -> DocumentEstimate:
+    # Import lazy: pdf_utils kéo theo fitz/pymupdf4llm
+    from app.utils.pdf_utils import open_pdf
+
+    with open_pdf(io.BytesIO(content)) as doc:
+        page_count = doc.page_count
+        selected = select_pages(page_count, pages, first_pages)
+        if len(selected) > settings.max_page_limit:
+            _reject(
+                413, "pages",
+                f"Page limit exceeded ({len(selected)} > {settings.max_page_limit}), "
+                f"hãy giới hạn bằng tham số pages/first_pages"
+            )
+        # Xét các trang sẽ được trích xuất (pages/first_pages), không phải trang đầu file: bìa scan
+        # không làm cả request thành OCR. Dừng ngay ở trang đầu tiên có text
+        inspect = selected[:settings.max_inspect_pages]
+        text_free = bool(inspect) and not any(doc[i].get_text("text").strip() for i in inspect)
+    return DocumentEstimate(pages=page_count, text_free=text_free)
+
+
+def estimate_document(content: bytes, file_ext: str, pages: Optional[List[int]] = None,
+                      first_pages: Optional[int] = None) -> DocumentEstimate:
+    """Ước lượng chi phí của file đã sniff; raise ``DocumentRejected`` (413/422) nếu không nên parse."""
+    try:
+        if file_ext == "pdf":
+            return _estimate_pdf(content, pages, first_pages)
+        if file_ext in ("docx", "xlsx", "pptx"):
+            return _estimate_ooxml(content, file_ext)
+    except DocumentRejected:
+        raise
+    except Exception as e:
+        # fitz / zipfile không mở được: file hỏng, parser cũng sẽ fail
+        _reject(422, "corrupt", f"File {file_ext} bị hỏng hoặc không đọc được: {e}")
+    return DocumentEstimate()
@@ -1,21 +1,27 @@
 import os
 import uuid
-from typing import Tuple
+from typing import Optional, Tuple
 
 import aiofiles
 
 from app.config import settings
 
 
-async def save_upload_to_temp(filename: str, content: bytes) -> Tuple[str, str]:
+async def save_upload_to_temp(
+    filename: str, content: bytes, file_ext: Optional[str] = None, directory: Optional[str] = None
+) -> Tuple[str, str]:
     """Save an uploaded file content to temporary upload directory.
 
+    ``file_ext`` (đã nhận diện theo nội dung) được ưu tiên hơn đuôi của ``filename``;
+    ``directory`` là scratch dir của request (mặc định ``settings.upload_dir``).
     Returns a tuple of (file_id, saved_path).
     """
-    file_ext = filename.split(".")[-1].lower() if "." in filename else ""
+    if file_ext is None:
+        file_ext = filename.split(".")[-1].lower() if "." in filename else ""
     file_id = str(uuid.uuid4())
-    os.makedirs(settings.upload_dir, exist_ok=True)
-    temp_path = os.path.join(settings.upload_dir, f"{file_id}.{file_ext}" if file_ext else file_id)
+    directory = directory or settings.upload_dir
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f"{file_id}.{file_ext}" if file_ext else file_id)
     async with aiofiles.open(temp_path, "wb") as f:
         await f.write(content)
     return file_id, temp_path
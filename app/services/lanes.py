@@ -0,0 +1,138 @@
+"""Lane HEAVY/LIGHT: giới hạn số file parse đồng thời.
+
+- ``LocalLane``: ``asyncio.Semaphore`` trong process (chạy 1 worker / dev).
+- ``SharedLane``: slot lưu trong SQLite dùng chung, giới hạn đúng trên toàn bộ worker
+  process (``python -m app.serve``). Slot của process đã chết được thu hồi tự động.
+"""
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.config import settings
+from app.services.shared_state import get_store
+from app.utils.resources import pid_alive
+
+
+class LaneBusyError(Exception):
+    """Lane đã hết slot và request không chờ (fail-fast -> 429)."""
+
+    def __init__(self, lane: "LocalLane"):
+        super().__init__(f"{lane.name} Lane quá tải ({lane.limit} request)")
+        self.lane = lane
+
+
+class LocalLane:
+    # Poll khi chờ slot (batch / có chừa slot): bắt đầu nhanh, giãn dần tới mức tối đa
+    POLL_MIN_SECONDS = 0.02
+    POLL_MAX_SECONDS = 0.25
+
+    def __init__(self, key: str, name: str, limit: int):
+        self.key = key
+        self.name = name
+        self.limit = limit
+        self._sem = asyncio.Semaphore(limit)
+
+    def in_use(self) -> int:
+        return self.limit - self._sem._value
+
+    async def count_in_use(self) -> int:
+        """``in_use`` an toàn để gọi từ event loop."""
+        return self.in_use()
+
+    async def try_acquire(self, reserve: int = 0) -> Optional[str]:
+        """Lấy slot nếu sau đó vẫn còn ít nhất ``reserve`` slot trống."""
+        if self._sem._value <= reserve:
+            return None
+        # Không await thứ gì khác giữa kiểm tra và acquire() -> không bị chặn
+        await self._sem.acquire()
+        return self.key
+
+    async def acquire(self, reserve: int = 0) -> str:
+        if not reserve:
+            await self._sem.acquire()
+            return self.key
+        delay = self.POLL_MIN_SECONDS
+        while (token := await self.try_acquire(reserve)) is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.POLL_MAX_SECONDS)
+        return token
+
+    async def release(self, token: str) -> None:
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self, wait: bool = False, reserve: int = 0) -> AsyncIterator[None]:
+        """Giữ 1 slot trong khối ``async with``; ``wait=False`` raise ``LaneBusyError`` nếu hết slot.
+
+        ``reserve``: số slot luôn chừa lại cho request khác (batch chừa chỗ cho interactive).
+        """
+        token = await (self.acquire(reserve) if wait else self.try_acquire(reserve))
+        if token is None:
+            raise LaneBusyError(self)
+        try:
+            yield
+        finally:
+            await self.release(token)
+
+
+class SharedLane(LocalLane):
+    def __init__(self, key: str, name: str, limit: int):
+        super().__init__(key, name, limit)
+        self.store = get_store()
+
+    def in_use(self) -> int:
+        row = self.store.connection().execute(
+            "SELECT COUNT(*) FROM lane_slots WHERE lane = ?", (self.key,)
+        ).fetchone()
+        return row[0]
+
+    async def count_in_use(self) -> int:
+        # Query SQLite (có thể chờ lock) -> chạy trong thread
+        return await asyncio.to_thread(self.in_use)
+
+    def _try_acquire_sync(self, reserve: int = 0) -> Optional[str]:
+        with self.store.transaction() as conn:
+            pids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT pid FROM lane_slots WHERE lane = ?", (self.key,)
+            )]
+            dead = [pid for pid in pids if pid != os.getpid() and not pid_alive(pid)]
+            if dead:
+                conn.executemany("DELETE FROM lane_slots WHERE pid = ?", [(pid,) for pid in dead])
+
+            in_use = conn.execute("SELECT COUNT(*) FROM lane_slots WHERE lane = ?", (self.key,)).fetchone()[0]
+            if in_use >= self.limit - reserve:
+                return None
+
+            token = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO lane_slots (token, lane, pid, acquired_at) VALUES (?, ?, ?, ?)",
+                (token, self.key, os.getpid(), time.time()),
+            )
+            return token
+
+    async def try_acquire(self, reserve: int = 0) -> Optional[str]:
+        return await asyncio.to_thread(self._try_acquire_sync, reserve)
+
+    async def acquire(self, reserve: int = 0) -> str:
+        delay = self.POLL_MIN_SECONDS
+        while (token := await self.try_acquire(reserve)) is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.POLL_MAX_SECONDS)
+        return token
+
+    def _release_sync(self, token: str) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM lane_slots WHERE token = ?", (token,))
+
+    async def release(self, token: str) -> None:
+        # SQLite có thể chờ lock (busy_timeout) -> chạy trong thread, không chặn event loop.
+        # shield: task bị cancel khi đang chờ thì thread vẫn xoá slot
+        await asyncio.shield(asyncio.to_thread(self._release_sync, token))
+
+
+def create_lane(key: str, name: str, limit: int) -> LocalLane:
+    lane_cls = SharedLane if settings.shared_state else LocalLane
+    return lane_cls(key, name, limit)
@@ -0,0 +1,47 @@
+"""Cache text OCR theo từng trang (file SQLite riêng trên disk, LRU theo dung lượng).
+
+Key = hash chính xác (blake2b) của pixel trang đã render + kích thước ảnh + ngôn ngữ OCR +
+config Tesseract + version pipeline tiền xử lý. Trang lặp lại giữa các tài liệu (mẫu biểu,
+trang bìa, phụ lục...) hoặc tài liệu upload lại với metadata khác không phải OCR lại.
+Hash chính xác thay vì perceptual hash: hai trang gần giống nhau vẫn có thể khác chữ.
+"""
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+from app.config import settings
+from app.services.shared_state import LRUCache, SharedStateStore
+from app.utils.ocr_image import OCR_PIPELINE_VERSION
+
+_store: Optional[SharedStateStore] = None
+
+
+def _get_store() -> SharedStateStore:
+    global _store
+    if _store is None:
+        # File riêng (không có bảng lane/rate-limit), dung lượng lớn không làm chậm state.db
+        _store = SharedStateStore(settings.ocr_cache_path, schema="")
+    return _store
+
+
+class OcrPageCache(LRUCache):
+    def __init__(self, max_bytes: int):
+        super().__init__("ocr_page_cache", max_bytes, _get_store)
+
+    @staticmethod
+    def page_key(image: np.ndarray, lang: str, config: str) -> str:
+        pixels = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(pixels.data, digest_size=32)
+        digest.update(f"{pixels.shape}:{pixels.dtype}".encode())
+        return f"v{OCR_PIPELINE_VERSION}:{lang}:{config}:{digest.hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        data = super().get(key)
+        return data.decode("utf-8") if data is not None else None
+
+    def put(self, key: str, value: str) -> None:
+        super().put(key, value.encode("utf-8"))
+
+
+ocr_cache = OcrPageCache(settings.ocr_cache_max_mb * 1024 * 1024)
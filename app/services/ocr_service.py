@@ -0,0 +1,255 @@
+"""OCR dùng chung cho PDF scan và ảnh nhúng trong DOCX/PPTX.
+
+``ocr_image``: cache theo pixel -> phân tích bảng kẻ ô -> Tesseract cho cả ảnh hoặc từng vùng
+(vùng chạy song song trên pool riêng). ``PDFParser`` gọi cho từng trang đã render và xoay;
+``EmbeddedImageOCR`` gọi cho ảnh nhúng của tài liệu Office trên pool riêng của job (số thread
+bằng số CPU token scheduler cấp), song song với trích xuất text. Ảnh trùng nội dung chỉ OCR 1 lần;
+kết quả được chèn vào Markdown tại vị trí ảnh qua placeholder (``image_placeholder``).
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+from app.config import settings
+from app.services.ocr_cache import ocr_cache
+from app.utils.deadline import time_left
+from app.utils.logger import setup_logger
+from app.utils.metrics import (
+    EMBEDDED_IMAGES_TOTAL, OCR_CACHE_SAVED_BYTES, OCR_CACHE_TOTAL, OCR_TABLES_TOTAL, timed_stage
+)
+from app.utils.ocr_image import OCR_PADDING, enhance_for_ocr
+from app.utils.ocr_layout import Region, analyze_page, assign_words, table_to_markdown
+from app.utils.ocr_osd import recognition_langs
+from app.utils.resources import available_cpus, worker_count
+
+logger = setup_logger(__name__)
+
+if os.path.exists("/usr/bin/tesseract"):
+    pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
+
+# =========================
+# CONFIG CONSTANTS
+# =========================
+# --oem 3: Default engine
+# --psm 3: Auto segmentation (Tốt cho bảng có Header)
+# preserve_interword_spaces=1: Giữ khoảng cách cột
+# tessedit_char_whitelist: KHÔNG NÊN DÙNG nếu file có cả Tiếng Việt và Số hỗn hợp
+TESSERACT_CONFIG_CMD = r'--oem 3 --psm 3 -c preserve_interword_spaces=1'
+# Bảng (đã xoá đường kẻ): --psm 6 coi vùng là 1 khối text đều, từ được xếp vào ô theo bbox
+TESSERACT_TABLE_CONFIG_CMD = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
+# Text OCR đã cache phụ thuộc cả việc có phân tích bảng hay không
+OCR_CACHE_CONFIG = TESSERACT_CONFIG_CMD + (" +table-layout" if settings.ocr_table_layout else "")
+
+TESSERACT_CONFIG_MAX_WORKER = settings.tesseract_config_max_worker
+
+# Ảnh nhúng: nhỏ hơn ngưỡng (byte / cạnh ngắn) là icon, logo, bullet -> bỏ qua;
+# ảnh quá lớn (ảnh chụp) được thu nhỏ trước khi OCR
+EMBEDDED_MIN_BYTES = settings.ocr_embedded_min_kb * 1024
+EMBEDDED_MIN_SIDE = 64
+EMBEDDED_MAX_SIDE = 4000
+
+_PLACEHOLDER_RE = re.compile("\x00img:([^\x00]+)\x00")
+
+# Pool riêng cho OCR từng vùng của trang có bảng: worker trang chờ kết quả vùng nên không
+# được submit vào chính pool của trang (tránh deadlock). Không lớn hơn số CPU của process
+_region_executor: Optional[ThreadPoolExecutor] = None
+_region_executor_lock = threading.Lock()
+
+
+def _region_pool() -> ThreadPoolExecutor:
+    global _region_executor
+    with _region_executor_lock:
+        if _region_executor is None:
+            _region_executor = ThreadPoolExecutor(
+                max_workers=min(TESSERACT_CONFIG_MAX_WORKER, max(1, available_cpus() // worker_count())),
+                thread_name_prefix="ocr-region"
+            )
+        return _region_executor
+
+
+def ocr_region(region: Region, lang: str, deadline: Optional[float] = None, stage: str = "pdf") -> str:
+    """OCR 1 vùng của ảnh: bảng -> bảng Markdown, dải text -> text."""
+    remaining = time_left(deadline)
+    if remaining is not None and remaining <= 0:
+        raise RuntimeError("Tesseract process timeout")
+    processed_img = enhance_for_ocr(region.image)
+
+    if region.kind == "table":
+        with timed_stage(f"{stage}.ocr_tesseract_table"):
+            data = pytesseract.image_to_data(
+                processed_img,
+                lang=lang,
+                config=TESSERACT_TABLE_CONFIG_CMD,
+                output_type=pytesseract.Output.DICT,
+                timeout=remaining or 0
+            )
+        OCR_TABLES_TOTAL.inc()
+        return table_to_markdown(assign_words(data, region.rows, region.cols, OCR_PADDING))
+
+    with timed_stage(f"{stage}.ocr_tesseract_region"):
+        text = pytesseract.image_to_string(
+            processed_img,
+            lang=lang,
+            config=TESSERACT_CONFIG_CMD,
+            timeout=remaining or 0
+        )
+    return text.strip()
+
+
+def ocr_regions(regions: List[Region], lang: str, deadline: Optional[float] = None, stage: str = "pdf") -> str:
+    """OCR song song các vùng trên pool riêng, ghép lại theo thứ tự đọc."""
+    futures = [_region_pool().submit(ocr_region, region, lang, deadline, stage) for region in regions]
+    try:
+        parts = [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return "\n\n".join(part for part in parts if part)
+
+
+def ocr_image(image: np.ndarray, lang: str, deadline: Optional[float] = None, stage: str = "pdf") -> str:
+    """OCR 1 ảnh xám đã đúng chiều (có cache); raise ``RuntimeError`` khi Tesseract timeout."""
+    # Ảnh đã OCR trước đó (cùng pixel, lang, config): bỏ qua tiền xử lý và Tesseract
+    cache_key = None
+    if ocr_cache.enabled:
+        cache_key = ocr_cache.page_key(image, lang, OCR_CACHE_CONFIG)
+        cached = ocr_cache.get(cache_key)
+        OCR_CACHE_TOTAL.labels(result="hit" if cached is not None else "miss").inc()
+        if cached is not None:
+            OCR_CACHE_SAVED_BYTES.inc(image.nbytes)
+            return cached
+
+    # Ảnh có bảng kẻ ô: OCR song song từng vùng (dải text / bảng) thay vì cả ảnh
+    regions = []
+    if settings.ocr_table_layout:
+        with timed_stage(f"{stage}.ocr_layout"):
+            regions = analyze_page(image)
+
+    if regions:
+        text = ocr_regions(regions, lang, deadline, stage)
+    else:
+        # Xử lý ảnh trước khi đưa vào Tesseract (ghi vào buffer riêng của worker, xem app.utils.ocr_image)
+        # KHÔNG DÙNG MinFilter / Resize / Upscale / Brightness reduction
+        processed_img = enhance_for_ocr(image)
+
+        # Debug: Có thể lưu ảnh ra disk để kiểm tra xem ảnh sau xử lý trông thế nào
+        # cv2.imwrite("debug_ocr.png", processed_img)
+
+        remaining = time_left(deadline)
+        with timed_stage(f"{stage}.ocr_tesseract_page"):
+            text = pytesseract.image_to_string(
+                processed_img,
+                lang=lang, # Đảm bảo settings.ocr_lang bao gồm 'vie' hoặc 'eng'
+                config=TESSERACT_CONFIG_CMD,
+                timeout=remaining or 0
+            )
+    text = text.strip()
+    if cache_key is not None:
+        ocr_cache.put(cache_key, text)
+    return text
+
+
+# =========================
+# ẢNH NHÚNG (DOCX / PPTX)
+# =========================
+def image_placeholder(key: str) -> str:
+    """Đánh dấu vị trí ảnh trong Markdown, thay bằng text OCR sau khi OCR xong (``fill_placeholders``)."""
+    return f"\x00img:{key}\x00"
+
+
+def fill_placeholders(text: str, replacements: Dict[str, str]) -> str:
+    """Thay placeholder bằng text tương ứng; ảnh không có text bị bỏ."""
+    return _PLACEHOLDER_RE.sub(lambda match: replacements.get(match.group(1), ""), text)
+
+
+def format_image_text(name: str, text: str) -> str:
+    return f"*[Ảnh: {name}]*\n\n{text}" if text else ""
+
+
+def _decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Ảnh xám đủ lớn để có text; ``None`` nếu không decode được (EMF/WMF, SVG...) hoặc quá nhỏ."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None or min(image.shape[:2]) < EMBEDDED_MIN_SIDE:
+        return None
+    longest = max(image.shape[:2])
+    if longest > EMBEDDED_MAX_SIDE:
+        scale = EMBEDDED_MAX_SIDE / longest
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+class EmbeddedImageOCR:
+    """OCR ảnh nhúng trên pool riêng của job, song song với phần trích xuất text của parser.
+
+    ``submit`` trả về key theo hash nội dung ngay (ảnh trùng chỉ OCR 1 lần), ``results`` chờ và trả
+    ``{key: text}``. Dùng như context manager để pool luôn được đóng.
+    """
+
+    def __init__(self, workers: Optional[int] = None, deadline: Optional[float] = None, stage: str = "docx"):
+        workers = max(1, min(workers or TESSERACT_CONFIG_MAX_WORKER, TESSERACT_CONFIG_MAX_WORKER))
+        self.deadline = deadline
+        self.stage = stage
+        self.lang = "+".join(recognition_langs())
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-embedded")
+        self._futures: Dict[str, Future] = {}
+
+    def __enter__(self) -> "EmbeddedImageOCR":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Huỷ ảnh chưa OCR và chờ ảnh đang OCR xong (Tesseract có timeout theo deadline)."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, data: bytes) -> Optional[str]:
+        """Đưa ảnh vào hàng OCR; ``None`` nếu ảnh nhỏ hơn ngưỡng (không OCR)."""
+        if len(data) < EMBEDDED_MIN_BYTES:
+            EMBEDDED_IMAGES_TOTAL.labels(result="small").inc()
+            return None
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if key in self._futures:
+            EMBEDDED_IMAGES_TOTAL.labels(result="duplicate").inc()
+        else:
+            self._futures[key] = self._executor.submit(self._ocr, data)
+        return key
+
+    def _ocr(self, data: bytes) -> str:
+        remaining = time_left(self.deadline)
+        if remaining is not None and remaining <= 0:
+            EMBEDDED_IMAGES_TOTAL.labels(result="timeout").inc()
+            return ""
+        image = _decode_image(data)
+        if image is None:
+            EMBEDDED_IMAGES_TOTAL.labels(result="skipped").inc()
+            return ""
+        try:
+            text = ocr_image(image, self.lang, self.deadline, self.stage)
+        except RuntimeError as e:
+            EMBEDDED_IMAGES_TOTAL.labels(result="timeout" if "timeout" in str(e).lower() else "error").inc()
+            logger.warning(f"⚠️ OCR ảnh nhúng lỗi: {e}")
+            return ""
+        except Exception as e:
+            EMBEDDED_IMAGES_TOTAL.labels(result="error").inc()
+            logger.warning(f"⚠️ OCR ảnh nhúng lỗi: {e}")
+            return ""
+        EMBEDDED_IMAGES_TOTAL.labels(result="ocr").inc()
+        return text
+
+    def results(self) -> Dict[str, str]:
+        return {key: future.result() for key, future in self._futures.items()}
+
+    def fill(self, parts: List[str], images: Dict[str, Tuple[str, str]]) -> List[str]:
+        """Chờ OCR xong, thay placeholder ``id`` trong ``parts`` bằng text của ảnh ``images[id] = (key, tên)``."""
+        texts = self.results()
+        replacements = {pid: format_image_text(name, texts.get(key, "")) for pid, (key, name) in images.items()}
+        return [fill_placeholders(part, replacements) for part in parts]
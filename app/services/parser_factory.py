@@ -1,28 +1,80 @@
-from app.parsers.json_parser import JsonParser
-from app.parsers.md_parser import MdParser
-from app.parsers.pdf_parser import PDFParser
-from app.parsers.doc_parser import DocParser
-from app.parsers.ppt_parser import PPTParser
-from app.parsers.xlsx_parser import XLSXParser
-from app.parsers.txt_parser import TxtParser
+import importlib
+import threading
+from typing import Dict, Iterable, List
+
+from app.parsers.base_parser import BaseParser
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# ext -> "module:Class". Module parser chỉ được import khi extension đó được dùng lần đầu,
+# tránh việc mỗi worker phải load fitz/pymupdf4llm/pandas/docx/pptx ngay khi khởi động.
+PARSER_REGISTRY: Dict[str, str] = {
+    "pdf": "app.parsers.pdf_parser:PDFParser",
+    "doc": "app.parsers.doc_parser:DocParser",
+    "docx": "app.parsers.doc_parser:DocParser",
+    "pptx": "app.parsers.ppt_parser:PPTParser",
+    "xlsx": "app.parsers.xlsx_parser:XLSXParser",
+    "txt": "app.parsers.txt_parser:TxtParser",
+    "json": "app.parsers.json_parser:JsonParser",
+    "md": "app.parsers.md_parser:MdParser",
+}
+
+# Các module phụ trợ nặng cần load kèm khi warm-up một extension
+WARMUP_EXTRA_MODULES: Dict[str, List[str]] = {
+    "pdf": ["app.utils.pdf_utils"],
+}
 
 
 class ParserFactory:
-    """Factory Pattern to choose parser based on file extension."""
+    """Factory Pattern to choose parser based on file extension (lazy loaded)."""
+
+    _instances: Dict[str, BaseParser] = {}
+    _lock = threading.Lock()
 
     @staticmethod
-    def get_parser(ext: str):
-        mapping = {
-            "pdf": PDFParser(),
-            "doc": DocParser(),
-            "docx": DocParser(),
-            "pptx": PPTParser(),
-            "xlsx": XLSXParser(),
-            "txt": TxtParser(),
-            "json": JsonParser(),
-            "md": MdParser()
-        }
-        parser = mapping.get(ext.lower())
-        if not parser:
-            raise ValueError(f"Unsupported file type: {ext}")
+    def supported_extensions() -> List[str]:
+        return list(PARSER_REGISTRY.keys())
+
+    @classmethod
+    def _load(cls, target: str) -> BaseParser:
+        parser = cls._instances.get(target)
+        if parser is not None:
+            return parser
+
+        with cls._lock:
+            parser = cls._instances.get(target)
+            if parser is None:
+                module_name, class_name = target.split(":")
+                module = importlib.import_module(module_name)
+                parser = getattr(module, class_name)()
+                cls._instances[target] = parser
+                logger.debug("📦 Đã load parser %s", target)
         return parser
+
+    @classmethod
+    def get_parser(cls, ext: str) -> BaseParser:
+        target = PARSER_REGISTRY.get(ext.lower())
+        if not target:
+            raise ValueError(f"Unsupported file type: {ext}")
+        return cls._load(target)
+
+    @classmethod
+    def warm_up(cls, extensions: Iterable[str]) -> List[str]:
+        """Preload parser (và dependency nặng) cho các extension chỉ định.
+
+        Trả về danh sách extension đã warm-up thành công.
+        """
+        loaded = []
+        for ext in extensions:
+            ext = ext.lower()
+            if ext == "*":
+                return cls.warm_up(cls.supported_extensions())
+            try:
+                cls.get_parser(ext)
+                for module_name in WARMUP_EXTRA_MODULES.get(ext, []):
+                    importlib.import_module(module_name)
+                loaded.append(ext)
+            except Exception as e:
+                logger.warning("⚠️ Warm-up parser '%s' thất bại: %s", ext, e)
+        return loaded
@@ -0,0 +1,34 @@
+"""Memo Markdown theo từng phần (ZIP member) của DOCX/XLSX giữa các lần upload.
+
+Revision mới của cùng tài liệu thường chỉ sửa một sheet / phần thân văn bản; các member
+không đổi giữ nguyên CRC32 và kích thước trong ZIP directory. Key = version app + loại phần
++ (tên, CRC, size) của các member mà phần đó phụ thuộc (đọc từ central directory). Key sheet XLSX
+còn gồm digest các shared string sheet dùng, được memo theo CRC nên chỉ tính lại khi sheet hoặc
+sharedStrings.xml đổi (xem ``XLSXParser``).
+"""
+import json
+import zipfile
+from typing import Any, Optional
+
+from app.config import settings
+from app.services.shared_state import LRUCache
+
+
+class PartCache(LRUCache):
+    def __init__(self, max_bytes: int):
+        super().__init__("part_cache", max_bytes)
+
+    @staticmethod
+    def make_key(kind: str, *members: zipfile.ZipInfo, extra: str = "") -> str:
+        parts = ":".join(f"{info.filename}/{info.CRC:08x}/{info.file_size}" for info in members)
+        return f"{settings.version}:{kind}:{parts}:{extra}"
+
+    def get_json(self, key: str) -> Optional[Any]:
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key: str, value: Any) -> None:
+        self.put(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+part_cache = PartCache(settings.part_cache_max_mb * 1024 * 1024)
@@ -0,0 +1,175 @@
+"""Profiling parse theo yêu cầu (cProfile trên thread chạy parser).
+
+Bật cho 1 request bằng header ``X-Profile: 1`` kèm ``X-Admin-Token`` đúng ``ADMIN_TOKEN``, hoặc
+lấy mẫu ngẫu nhiên ``PROFILE_SAMPLE_RATE`` request. Profile (định dạng pstats) được lưu theo id
+do server sinh (request id + hậu tố ngẫu nhiên, client không chọn được) trong ``PROFILE_DIR``
+(dùng chung giữa các worker, giữ ``PROFILE_MAX_STORED`` file mới nhất): ``GET /admin/profiles/{id}``
+trả top-N hàm nóng, ``.../download`` trả file gốc để vẽ flamegraph (snakeviz, flameprof, gprof2dot). Tắt (mặc định) thì mỗi request chỉ tốn 1 phép
+so sánh.
+
+Chỉ thread chạy parser được đo: OCR trên worker thread / shard trên process con hiện dưới dạng
+thời gian chờ future.
+"""
+import cProfile
+import hmac
+import json
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Mapping, Optional
+
+from app.config import settings
+from app.utils.logger import request_id_var, setup_logger
+from app.utils.metrics import PROFILES_TOTAL
+
+logger = setup_logger(__name__)
+
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+ENABLED = bool(settings.admin_token) or settings.profile_sample_rate > 0
+PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,160}$")
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+@dataclass
+class ProfileRequest:
+    id: str
+    saved: bool = False  # ``profiled`` đã lưu profile (cache hit / lỗi trước khi parse thì không)
+
+    def child(self, suffix: str) -> "ProfileRequest":
+        return ProfileRequest(f"{self.id}-{suffix}")
+
+
+def is_admin(headers: Mapping[str, str]) -> bool:
+    """Header ``X-Admin-Token`` khớp ``ADMIN_TOKEN`` (rỗng = không ai là admin)."""
+    token = headers.get(ADMIN_TOKEN_HEADER)
+    return bool(settings.admin_token) and token is not None and hmac.compare_digest(token, settings.admin_token)
+
+
+def profile_request_for(headers: Mapping[str, str]) -> Optional[ProfileRequest]:
+    """Profile cần ghi cho request này (id = request id + hậu tố ngẫu nhiên), ngược lại ``None``."""
+    if not ENABLED:
+        return None
+    if headers.get(PROFILE_HEADER, "").lower() in ("1", "true") and is_admin(headers):
+        trigger = "header"
+    elif settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate:
+        trigger = "sample"
+    else:
+        return None
+    PROFILES_TOTAL.labels(trigger=trigger).inc()
+    # Request id do client đặt được (X-Request-ID): thêm hậu tố để 2 request không ghi đè profile của nhau
+    return ProfileRequest(f"{_UNSAFE_CHARS_RE.sub('_', request_id_var.get())[:128]}-{uuid.uuid4().hex[:8]}")
+
+
+def _short_path(file_name: str) -> str:
+    """Bỏ prefix site-packages / thư mục gốc cho dễ đọc."""
+    parts = Path(file_name).parts
+    return "/".join(parts[-3:]) if len(parts) > 3 else file_name
+
+
+class ProfileStore:
+    def __init__(self, directory: str, max_stored: int):
+        self.directory = Path(directory)
+        self.max_stored = max_stored
+
+    def _path(self, profile_id: str, suffix: str) -> Optional[Path]:
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        return self.directory / f"{profile_id}{suffix}"
+
+    def save(self, profile_id: str, profile: cProfile.Profile, meta: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(self._path(profile_id, ".prof")))
+        self._path(profile_id, ".json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        self._prune()
+
+    def _prune(self) -> None:
+        """Giữ ``max_stored`` profile mới nhất."""
+        try:
+            files = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime, reverse=True)
+        except OSError:
+            return
+        for path in files[self.max_stored:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+    def stats_path(self, profile_id: str) -> Optional[Path]:
+        path = self._path(profile_id, ".prof")
+        return path if path is not None and path.is_file() else None
+
+    def meta(self, profile_id: str) -> dict:
+        path = self._path(profile_id, ".json")
+        try:
+            return json.loads(path.read_text(encoding="utf-8")) if path is not None else {}
+        except (OSError, ValueError):
+            return {}
+
+    def list(self) -> List[dict]:
+        if not self.directory.is_dir():
+            return []
+        files = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime, reverse=True)
+        return [{"id": path.stem, **self.meta(path.stem)} for path in files]
+
+    def summary(self, profile_id: str, top: int) -> Optional[dict]:
+        """Top-N hàm theo thời gian tự thân (own) và tích luỹ (cumulative)."""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        stats = pstats.Stats(str(path))
+        rows = [
+            {
+                "function": f"{_short_path(file_name)}:{line}({func})",
+                "calls": calls,
+                "own_seconds": round(own, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            }
+            for (file_name, line, func), (_, calls, own, cumulative, _) in stats.stats.items()
+        ]
+        return {
+            "id": profile_id,
+            **self.meta(profile_id),
+            "total_seconds": round(stats.total_tt, 6),
+            "top_own": sorted(rows, key=lambda row: row["own_seconds"], reverse=True)[:top],
+            "top_cumulative": sorted(rows, key=lambda row: row["cumulative_seconds"], reverse=True)[:top],
+        }
+
+
+profile_store = ProfileStore(settings.profile_dir, settings.profile_max_stored)
+
+
+@contextmanager
+def profiled(profile_request: Optional[ProfileRequest], meta: dict) -> Iterator[None]:
+    """Đo CPU profile của block (thread hiện tại) và lưu theo ``profile_request.id``; ``None`` = không đo."""
+    if profile_request is None:
+        yield
+        return
+    profile_id = profile_request.id
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Đã có profiler khác đang chạy trong process (vd. Python 3.12+ chỉ cho 1 profiler)
+        logger.warning(f"⚠️ Không bật được profiler cho {profile_id}: {e}")
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.disable()
+        meta = {**meta, "seconds": round(time.perf_counter() - started_at, 3), "created_at": time.time()}
+        try:
+            profile_store.save(profile_id, profile, meta)
+            profile_request.saved = True
+            logger.info(f"🔬 Đã lưu profile {profile_id} ({meta['seconds']}s)")
+        except OSError as e:
+            logger.warning(f"⚠️ Không lưu được profile {profile_id}: {e}")
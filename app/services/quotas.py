@@ -0,0 +1,85 @@
+"""Quota theo chi phí cho từng client (định danh từ ``app.utils.client_identity``).
+
+Rate limit theo request không phân biệt 1 file txt với 1 PDF scan 300 trang, nên quota được
+tính bằng đơn vị chi phí: số trang OCR (trừ theo số trang ước lượng khi job thực sự bắt đầu parse,
+request bị 429 vì server bận không mất quota) và CPU-giây (thời gian parse x CPU token được cấp,
+trừ sau khi job xong). Bộ đếm dùng chung storage với rate limiter (chia sẻ giữa các worker khi
+bật shared state).
+"""
+import math
+import time
+from typing import Optional
+
+from limits import RateLimitItem
+
+from app.config import settings
+from app.services.rate_limiter import parse_limit, rate_limiter
+from app.utils.logger import setup_logger
+from app.utils.metrics import CLIENT_COST_TOTAL, QUOTA_REJECTED_TOTAL
+
+logger = setup_logger(__name__)
+
+OCR_PAGES = "ocr_pages"
+CPU_SECONDS = "cpu_seconds"
+
+QUOTAS = {
+    resource: parse_limit(value)
+    for resource, value in ((OCR_PAGES, settings.client_quota_ocr_pages),
+                            (CPU_SECONDS, settings.client_quota_cpu_seconds))
+    if value
+}
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, resource: str, limit: RateLimitItem, retry_after: int):
+        super().__init__(f"Hết quota {resource} ({limit})")
+        self.resource = resource
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def enabled() -> bool:
+    return bool(QUOTAS)
+
+
+def _retry_after(item: RateLimitItem, client: str, resource: str) -> int:
+    reset_time = rate_limiter.get_window_stats(item, "quota", resource, client).reset_time
+    return max(1, math.ceil(reset_time - time.time()))
+
+
+def _reject(resource: str, client: str) -> None:
+    item = QUOTAS[resource]
+    QUOTA_REJECTED_TOTAL.labels(resource=resource).inc()
+    logger.warning("⚠️ Client %s hết quota %s (%s)", client, resource, item)
+    raise QuotaExceeded(resource, item, _retry_after(item, client, resource))
+
+
+def check(client: str, ocr_pages: int = 0) -> None:
+    """Trước khi xếp hàng: kiểm tra (không trừ) còn đủ trang OCR và CPU-giây; raise ``QuotaExceeded`` nếu hết.
+
+    Blocking khi bật shared state (SQLite) -> gọi qua thread.
+    """
+    item = QUOTAS.get(CPU_SECONDS)
+    if item is not None and not rate_limiter.test(item, "quota", CPU_SECONDS, client):
+        _reject(CPU_SECONDS, client)
+    item = QUOTAS.get(OCR_PAGES)
+    if item is not None and ocr_pages > 0 and not rate_limiter.test(item, "quota", OCR_PAGES, client, cost=ocr_pages):
+        _reject(OCR_PAGES, client)
+
+
+def consume_ocr_pages(client: str, ocr_pages: int) -> None:
+    """Khi job đã được cấp slot + tài nguyên và bắt đầu parse: trừ quota trang OCR (gọi trong thread parse)."""
+    item = QUOTAS.get(OCR_PAGES)
+    if item is not None and ocr_pages > 0:
+        rate_limiter.hit(item, "quota", OCR_PAGES, client, cost=ocr_pages)
+
+
+def charge(client: str, tier: str, cpu_seconds: float, ocr_pages: Optional[int] = None) -> None:
+    """Sau khi parse: ghi chi phí thực tế (metric) và trừ CPU-giây vào quota của client."""
+    CLIENT_COST_TOTAL.labels(resource=CPU_SECONDS, tier=tier).inc(cpu_seconds)
+    if ocr_pages:
+        CLIENT_COST_TOTAL.labels(resource=OCR_PAGES, tier=tier).inc(ocr_pages)
+    item = QUOTAS.get(CPU_SECONDS)
+    if item is not None and cpu_seconds > 0:
+        # Vượt quota giữa chừng vẫn trừ đủ: job sau của client bị từ chối tới cửa sổ kế tiếp
+        rate_limiter.hit(item, "quota", CPU_SECONDS, client, cost=max(1, math.ceil(cpu_seconds)))
@@ -0,0 +1,26 @@
+from limits import RateLimitItem, parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.config import settings
+
+
+def _storage_uri() -> str:
+    if settings.shared_state:
+        # Import để đăng ký scheme "sqlite" với thư viện limits
+        import app.services.shared_state  # noqa: F401
+
+        return f"sqlite://{settings.shared_state_path}"
+    return "memory://"
+
+
+# Bộ đếm fixed window theo (route, IP); dùng chung giữa các worker khi bật shared state
+rate_limiter = FixedWindowRateLimiter(storage_from_string(_storage_uri()))
+
+# Storage SQLite là I/O blocking -> middleware gọi qua thread
+RATE_LIMIT_BLOCKING = settings.shared_state
+
+
+def parse_limit(value: str) -> RateLimitItem:
+    """``"50/minute"`` -> RateLimitItem."""
+    return parse(value)
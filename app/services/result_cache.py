@@ -0,0 +1,34 @@
+"""Cache kết quả parse (dùng chung giữa các worker qua SQLite).
+
+Key = sha256(nội dung file) + loại file + các tuỳ chọn parse + version app, nên cùng một
+file upload lại (từ bất kỳ worker nào) không phải parse lại. Giới hạn theo tổng dung lượng,
+xoá bản ít được dùng gần đây nhất (LRU) khi vượt ngưỡng.
+"""
+import hashlib
+import json
+from typing import Optional
+
+from app.config import settings
+from app.services.shared_state import LRUCache
+
+
+class ResultCache(LRUCache):
+    def __init__(self, max_bytes: int):
+        super().__init__("result_cache", max_bytes)
+
+    @staticmethod
+    def make_key(content: bytes, file_ext: str, options: Optional[dict] = None) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        options_str = json.dumps(options or {}, sort_keys=True, default=str)
+        return f"{settings.version}:{file_ext}:{digest}:{options_str}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Best-effort: lỗi SQLite chỉ log warning và coi như cache miss."""
+        data = super().get(key)
+        return data.decode("utf-8") if data is not None else None
+
+    def put(self, key: str, value: str) -> None:
+        super().put(key, value.encode("utf-8"))
+
+
+result_cache = ResultCache(settings.result_cache_max_mb * 1024 * 1024)
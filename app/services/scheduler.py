@@ -0,0 +1,303 @@
+"""Scheduler tài nguyên: ngân sách CPU token và RAM đặt chỗ cho mỗi job parse.
+
+Lane HEAVY/LIGHT chỉ đếm số request; mỗi job OCR lại chạy tới ``TESSERACT_CONFIG_MAX_WORKER``
+thread, nên vài job cùng lúc trên container 2 CPU có thể sinh hàng chục process Tesseract.
+Scheduler cấp cho mỗi job số CPU token và lượng RAM theo chi phí ước lượng (loại file, số
+trang, có OCR hay không); job chỉ chạy khi ngân sách còn đủ, và parser OCR chỉ dùng đúng
+số thread bằng số token được cấp.
+
+Ngân sách CPU hiệu dụng điều chỉnh theo AIMD từ service time đo được: thời gian xử lý mỗi
+đơn vị (trang / MB) tăng quá ``SLOWDOWN_RATIO`` lần so với mức nền khi đang chạy chồng nhau
+thì giảm nhân, ngược lại tăng cộng dần tới số CPU thật.
+
+Hàng chờ là weighted fair queuing theo client: mỗi job mang virtual finish time
+``max(V, finish cuối của client) + chi phí / trọng số`` (chi phí = CPU-giây ước lượng), job có
+finish nhỏ nhất được cấp trước, nên một client đẩy hàng trăm job không chặn client khác.
+Job interactive (request đơn) luôn đứng trước job batch; batch chỉ dùng phần còn dư.
+
+Mỗi process có ngân sách riêng (tài nguyên container chia đều cho ``WORKERS``).
+"""
+import asyncio
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.cost_estimator import DocumentEstimate
+from app.utils.logger import setup_logger
+from app.utils.metrics import (
+    SCHEDULER_CPU_IN_USE,
+    SCHEDULER_CPU_LIMIT,
+    SCHEDULER_MEMORY_IN_USE,
+    SCHEDULER_WAITING,
+)
+from app.utils.resources import available_cpus, available_memory, worker_count
+
+logger = setup_logger(__name__)
+
+MB = 1024 * 1024
+
+# RAM nền của 1 job và hệ số nhân theo kích thước file (file nén như xlsx/docx nở ra nhiều khi parse)
+BASE_MEMORY = 32 * MB
+MEMORY_FACTORS = {
+    "xlsx": 30, "xls": 30, "docx": 15, "doc": 15, "pptx": 10, "ppt": 10,
+    "pdf": 8, "json": 8, "txt": 4, "md": 4,
+}
+# Mỗi thread OCR: process Tesseract (model vie+eng best) + buffer trang đã render
+OCR_WORKER_MEMORY = 160 * MB
+# Process LibreOffice convert .doc
+LIBREOFFICE_MEMORY = 256 * MB
+# DataFrame pandas: RAM mỗi ô (object + index) khi đã biết số ô XLSX từ <dimension>
+CELL_MEMORY = 200
+# Service time (giây / đơn vị) giả định khi chưa đo được, chỉ dùng để xếp hàng fair-share
+DEFAULT_SECONDS_PER_UNIT = {"ocr": 2.0, "pdf": 0.05, "office": 0.5, "text": 0.05}
+
+
+class ResourceBusyError(Exception):
+    """Không đủ tài nguyên trong thời gian chờ cho phép (-> 429)."""
+
+
+@dataclass
+class JobCost:
+    kind: str  # "ocr" | "pdf" | "office" | "text"
+    units: float  # Số trang (PDF) hoặc MB (loại khác): đơn vị để chuẩn hoá service time
+    cpu: int
+    memory: int
+
+
+@dataclass
+class Grant:
+    cost: JobCost
+    # Job bắt đầu khi đã có job khác giữ CPU: chỉ mẫu này mới nói lên tranh chấp tài nguyên
+    contended: bool
+    started_at: float = field(default_factory=time.monotonic)
+    released: bool = False
+
+
+@dataclass
+class _Waiter:
+    # Thứ tự cấp: (tier, finish, seq) nhỏ nhất trước; tier 0 = interactive, 1 = batch
+    tier: int
+    start: float
+    finish: float
+    seq: int
+    cost: JobCost
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    grant: Optional[Grant] = None
+
+    @property
+    def order(self) -> Tuple[int, float, int]:
+        return self.tier, self.finish, self.seq
+
+
+class ResourceScheduler:
+    EWMA_ALPHA = 0.3
+    # Mức nền (service time tốt nhất) tăng dần theo thời gian để thích nghi với tải thật
+    BASELINE_DRIFT = 0.02
+    SLOWDOWN_RATIO = 2.0
+    DECREASE_FACTOR = 0.75
+
+    def __init__(self, cpu_tokens: int, memory_bytes: int, max_ocr_workers: int):
+        self.cpu_capacity = max(1, cpu_tokens)
+        self.memory_capacity = max(BASE_MEMORY, memory_bytes)
+        self.max_ocr_workers = max(1, max_ocr_workers)
+        self.cpu_limit = float(self.cpu_capacity)
+        self.cpu_in_use = 0
+        self.memory_in_use = 0
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._ewma: Dict[str, float] = {}
+        self._baseline: Dict[str, float] = {}
+        # Virtual time của WFQ và finish time cuối cùng của từng client
+        self._vtime = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    # ---------- Ước lượng chi phí ----------
+    def estimate(self, file_ext: str, file_size: int, pages: Optional[int] = None, is_scan: bool = False,
+                 doc: Optional[DocumentEstimate] = None) -> JobCost:
+        """Chi phí job từ loại file, kích thước, số trang và metadata (``cost_estimator``) nếu có."""
+        memory = BASE_MEMORY + file_size * MEMORY_FACTORS.get(file_ext, 8)
+        if doc is not None and doc.cells:
+            memory = max(memory, BASE_MEMORY + doc.cells * CELL_MEMORY)
+        if file_ext == "pdf":
+            pages = max(1, pages or 1)
+            if is_scan:
+                # Số thread OCR của job = số token được cấp, theo ngân sách hiệu dụng hiện tại
+                cpu = min(self.max_ocr_workers, pages, max(1, int(self.cpu_limit)))
+                return JobCost("ocr", pages, cpu, memory + cpu * OCR_WORKER_MEMORY)
+            return JobCost("pdf", pages, 1, memory)
+        if file_ext == "doc":
+            memory += LIBREOFFICE_MEMORY
+        if doc is not None and doc.images:
+            # OCR ảnh nhúng DOCX/PPTX: mỗi ảnh tính như 1 trang OCR
+            cpu = min(self.max_ocr_workers, doc.images, max(1, int(self.cpu_limit)))
+            return JobCost("ocr", doc.images, cpu, memory + cpu * OCR_WORKER_MEMORY)
+        kind = "text" if file_ext in ("txt", "md", "json") else "office"
+        # OOXML: công việc parse tỉ lệ với XML giải nén chứ không phải kích thước file nén
+        size = doc.uncompressed_bytes if doc is not None and doc.uncompressed_bytes else file_size
+        return JobCost(kind, max(size / MB, 0.01), 1, memory)
+
+    def work(self, cost: JobCost) -> float:
+        """Chi phí ước lượng của job theo CPU-giây, theo service time đo được của loại job."""
+        per_unit = self._ewma.get(cost.kind, DEFAULT_SECONDS_PER_UNIT.get(cost.kind, 0.5))
+        return cost.units * per_unit * cost.cpu
+
+    # ---------- Cấp / trả tài nguyên ----------
+    def _fits(self, cost: JobCost) -> bool:
+        # Job lớn hơn cả ngân sách vẫn được chạy khi không còn job nào khác
+        cpu_ok = self.cpu_in_use == 0 or self.cpu_in_use + cost.cpu <= self.cpu_limit
+        memory_ok = self.memory_in_use == 0 or self.memory_in_use + cost.memory <= self.memory_capacity
+        return cpu_ok and memory_ok
+
+    def _take(self, cost: JobCost) -> Grant:
+        grant = Grant(cost, contended=self.cpu_in_use > 0)
+        self.cpu_in_use += cost.cpu
+        self.memory_in_use += cost.memory
+        return grant
+
+    def _tag(self, cost: JobCost, client: str, weight: float) -> Tuple[float, float]:
+        """(start, finish) virtual time của job mới, chưa ghi nhận cho client (gọi khi giữ ``_lock``)."""
+        start = max(self._vtime, self._last_finish.get(client, 0.0))
+        return start, start + self.work(cost) / weight
+
+    def _record_finish(self, client: str, finish: float) -> None:
+        """Ghi finish của client khi job được cấp hoặc vào hàng chờ: job bị từ chối không bị tính."""
+        self._last_finish[client] = finish
+        if len(self._last_finish) > 1024:
+            # Client đã rảnh (finish <= V) không còn ảnh hưởng tới thứ tự
+            self._last_finish = {c: f for c, f in self._last_finish.items() if f > self._vtime}
+
+    def _dispatch(self) -> None:
+        """Cấp tài nguyên cho các job đang chờ theo thứ tự WFQ (gọi khi giữ ``_lock``)."""
+        # Job đứng đầu chưa vừa thì các job sau cũng chờ, job lớn không bị bỏ đói
+        while self._waiters:
+            head = min(self._waiters, key=lambda waiter: waiter.order)
+            if not self._fits(head.cost):
+                break
+            self._waiters.remove(head)
+            self._vtime = max(self._vtime, head.start)
+            head.grant = self._take(head.cost)
+            head.loop.call_soon_threadsafe(_resolve, head.future)
+
+    async def acquire(self, cost: JobCost, timeout: Optional[float] = None,
+                      client: str = "", weight: float = 1.0, interactive: bool = True) -> Grant:
+        """Chờ tới lượt (WFQ theo ``client``) và đủ CPU token + RAM cho ``cost``.
+
+        Raise ``ResourceBusyError`` nếu quá ``timeout``.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            start, finish = self._tag(cost, client, weight)
+            entry = _Waiter(0 if interactive else 1, start, finish, next(self._seq), cost, None, loop)
+            ahead = self._waiters and min(waiter.order for waiter in self._waiters) < entry.order
+            if not ahead and self._fits(cost):
+                self._vtime = max(self._vtime, start)
+                self._record_finish(client, finish)
+                return self._take(cost)
+            if timeout is not None and timeout <= 0:
+                raise ResourceBusyError()
+            previous_finish = self._last_finish.get(client)
+            self._record_finish(client, finish)
+            entry.future = loop.create_future()
+            self._waiters.append(entry)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.future), timeout)
+        except BaseException as e:
+            with self._lock:
+                waiting = entry in self._waiters
+                if waiting:
+                    self._waiters.remove(entry)
+                    # Job không chạy: trả lại finish cũ của client (nếu client chưa xếp job nào sau nó)
+                    if self._last_finish.get(client) == finish:
+                        if previous_finish is None:
+                            self._last_finish.pop(client, None)
+                        else:
+                            self._last_finish[client] = previous_finish
+                    # Job vừa rời có thể là đầu hàng chưa vừa: các job nhỏ phía sau được cấp ngay
+                    self._dispatch()
+            # Đã được cấp đúng lúc bị huỷ/timeout -> trả lại ngay
+            if not waiting and entry.grant is not None:
+                self.release(entry.grant, observe=False)
+            if isinstance(e, asyncio.TimeoutError):
+                raise ResourceBusyError() from None
+            raise
+        return entry.grant
+
+    def release(self, grant: Grant, observe: bool = True) -> None:
+        """Trả tài nguyên (an toàn từ mọi thread, gọi nhiều lần không sao) và ghi service time."""
+        with self._lock:
+            if grant.released:
+                return
+            grant.released = True
+            self.cpu_in_use -= grant.cost.cpu
+            self.memory_in_use -= grant.cost.memory
+            if observe:
+                self._observe(grant, time.monotonic() - grant.started_at)
+            self._dispatch()
+
+    # ---------- AIMD theo service time ----------
+    def _observe(self, grant: Grant, seconds: float) -> None:
+        kind = grant.cost.kind
+        per_unit = seconds / max(grant.cost.units, 0.01)
+        ewma = self._ewma.get(kind)
+        ewma = per_unit if ewma is None else self.EWMA_ALPHA * per_unit + (1 - self.EWMA_ALPHA) * ewma
+        self._ewma[kind] = ewma
+        baseline = self._baseline.get(kind, ewma) * (1 + self.BASELINE_DRIFT)
+        baseline = self._baseline[kind] = min(baseline, ewma)
+
+        if grant.contended and ewma > baseline * self.SLOWDOWN_RATIO:
+            new_limit = max(1.0, self.cpu_limit * self.DECREASE_FACTOR)
+            if math.floor(new_limit) < math.floor(self.cpu_limit):
+                logger.warning(
+                    "🐢 Service time %s tăng %.1fx so với nền, giảm ngân sách CPU %.1f -> %.1f",
+                    kind, ewma / baseline, self.cpu_limit, new_limit
+                )
+            self.cpu_limit = new_limit
+        else:
+            self.cpu_limit = min(float(self.cpu_capacity), self.cpu_limit + 1.0 / self.cpu_limit)
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def lane_limits() -> Tuple[int, int]:
+    """Số request đồng thời mặc định của lane (HEAVY, LIGHT) theo CPU/RAM của cả container.
+
+    Lane chỉ giới hạn độ dài hàng chờ; tài nguyên thật do scheduler cấp, nên HEAVY chỉ cần đủ để
+    mọi CPU có job OCR và không vượt số job OCR mà RAM chứa được. HEAVY tối thiểu 2 để batch
+    luôn chừa được 1 slot cho request interactive.
+    """
+    cpus = available_cpus()
+    ocr_threads = min(settings.tesseract_config_max_worker, cpus)
+    ocr_job_memory = BASE_MEMORY + ocr_threads * OCR_WORKER_MEMORY
+    memory = available_memory() * settings.scheduler_memory_fraction
+    heavy = max(2, min(cpus, int(memory // ocr_job_memory)))
+    light = max(4, cpus * 4)
+    return heavy, light
+
+
+def _budget() -> Tuple[int, int]:
+    """(CPU token, RAM bytes) của process này: cấu hình hoặc đo theo cgroup, chia cho số worker."""
+    cpu_tokens = settings.scheduler_cpu_tokens or max(1, available_cpus() // worker_count())
+    memory = settings.scheduler_memory_mb * MB or int(
+        available_memory() * settings.scheduler_memory_fraction / worker_count()
+    )
+    return cpu_tokens, memory
+
+
+scheduler = ResourceScheduler(*_budget(), max_ocr_workers=settings.tesseract_config_max_worker)
+SCHEDULER_CPU_LIMIT.set_function(lambda: scheduler.cpu_limit)
+SCHEDULER_CPU_IN_USE.set_function(lambda: scheduler.cpu_in_use)
+SCHEDULER_MEMORY_IN_USE.set_function(lambda: scheduler.memory_in_use)
+SCHEDULER_WAITING.set_function(scheduler.waiting)
@@ -0,0 +1,164 @@
+"""Quản lý scratch space (file tạm) cho các request.
+
+Mỗi request cần file trên disk nhận một thư mục riêng ``<upload_dir>/req-<uuid>/`` (file upload,
+output/profile của LibreOffice...) và xoá cả thư mục khi xong. Parse bị timeout vẫn chạy tiếp
+trong thread: thư mục được giữ tới khi thread xong rồi mới xoá (xem ``conversion_service``).
+
+Thư mục mồ côi (process bị kill, crash) được sweeper dọn theo tuổi lúc khởi động và định kỳ,
+kể cả ``lo_profile_*`` cũ trong thư mục tạm của hệ thống. Vượt quota hoặc disk sắp đầy thì
+request mới bị từ chối (503) thay vì làm đầy ``/tmp``.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from app.config import settings
+from app.utils.logger import setup_logger
+from app.utils.metrics import SCRATCH_SWEPT_TOTAL, SCRATCH_USAGE_BYTES
+
+logger = setup_logger(__name__)
+
+REQUEST_DIR_PREFIX = "req-"
+# Profile LibreOffice do phiên bản cũ tạo thẳng trong thư mục tạm hệ thống
+LEGACY_PATTERNS = [os.path.join(tempfile.gettempdir(), "lo_profile_*")]
+
+
+class ScratchQuotaExceeded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _path_size(path: Path) -> int:
+    if path.is_file() or path.is_symlink():
+        try:
+            return path.lstat().st_size
+        except OSError:
+            return 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ScratchManager:
+    # Dung lượng đang dùng được tính lại bằng cách quét các thư mục req-*, tối đa 1 lần / USAGE_TTL giây
+    USAGE_TTL = 5.0
+
+    def __init__(self, root: str, quota_bytes: int = 0, min_free_bytes: int = 0, orphan_max_age: float = 7200):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.orphan_max_age = orphan_max_age
+        self._lock = threading.Lock()
+        self._usage = 0
+        self._usage_at = 0.0
+
+    def _request_dirs(self) -> List[Path]:
+        """Chỉ các mục do scratch tạo: ``upload_dir`` có thể là thư mục dùng chung với thứ khác."""
+        return list(self.root.glob(f"{REQUEST_DIR_PREFIX}*")) if self.root.exists() else []
+
+    def usage_bytes(self, refresh: bool = False) -> int:
+        with self._lock:
+            if refresh or time.monotonic() - self._usage_at > self.USAGE_TTL:
+                self._usage = sum(_path_size(path) for path in self._request_dirs())
+                self._usage_at = time.monotonic()
+            return self._usage
+
+    def check_quota(self, incoming_bytes: int = 0) -> None:
+        """Raise ``ScratchQuotaExceeded`` nếu ghi thêm ``incoming_bytes`` sẽ vượt quota / disk sắp đầy.
+
+        Blocking (có thể quét root): gọi qua ``asyncio.to_thread`` từ code async.
+        """
+        if self.quota_bytes and self.usage_bytes() + incoming_bytes > self.quota_bytes:
+            raise ScratchQuotaExceeded(
+                f"Scratch space vượt quota {self.quota_bytes // (1024 * 1024)}MB"
+            )
+        if self.min_free_bytes:
+            self.root.mkdir(parents=True, exist_ok=True)
+            if shutil.disk_usage(self.root).free - incoming_bytes < self.min_free_bytes:
+                raise ScratchQuotaExceeded("Dung lượng trống của scratch space quá thấp")
+
+    def create(self) -> Path:
+        """Tạo thư mục scratch cho 1 request; người gọi phải ``release`` khi xong."""
+        path = self.root / f"{REQUEST_DIR_PREFIX}{uuid.uuid4().hex}"
+        path.mkdir(parents=True)
+        return path
+
+    def release(self, path: Optional[Path]) -> None:
+        if path is None:
+            return
+        _remove(path)
+        logger.debug("🧹 Đã xoá scratch dir: %s", path)
+
+    @contextmanager
+    def request_dir(self) -> Iterator[Path]:
+        path = self.create()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def _candidates(self) -> List[Path]:
+        paths = self._request_dirs()
+        for pattern in LEGACY_PATTERNS:
+            paths.extend(Path(pattern).parent.glob(Path(pattern).name))
+        return paths
+
+    def sweep(self, max_age: Optional[float] = None) -> int:
+        """Xoá thư mục/file scratch không thay đổi trong ``max_age`` giây; trả về số mục đã xoá."""
+        max_age = self.orphan_max_age if max_age is None else max_age
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in self._candidates():
+            try:
+                if path.lstat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            _remove(path)
+            removed += 1
+        if removed:
+            SCRATCH_SWEPT_TOTAL.inc(removed)
+            logger.warning("🧹 Sweeper đã xoá %s mục scratch mồ côi (> %.0f phút)", removed, max_age / 60)
+        self.usage_bytes(refresh=True)
+        return removed
+
+    async def run_sweeper(self, interval: float) -> None:
+        """Background task (lifespan): sweep định kỳ tới khi bị cancel."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.warning("⚠️ Sweeper lỗi: %s", e)
+
+
+scratch = ScratchManager(
+    settings.upload_dir,
+    quota_bytes=settings.scratch_quota_mb * 1024 * 1024,
+    min_free_bytes=settings.scratch_min_free_mb * 1024 * 1024,
+    orphan_max_age=settings.scratch_orphan_minutes * 60,
+)
+SCRATCH_USAGE_BYTES.set_function(scratch.usage_bytes)
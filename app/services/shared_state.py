@@ -0,0 +1,268 @@
+"""Trạng thái dùng chung giữa các worker process (SQLite ở chế độ WAL, không cần service ngoài).
+
+Dùng cho: slot của lane HEAVY/LIGHT, bộ đếm rate-limit (thư viện limits) và các cache LRU
+(kết quả parse, text OCR theo trang).
+Mỗi thread giữ một connection riêng; mọi thay đổi cần tính nguyên tử chạy trong
+``BEGIN IMMEDIATE`` nên nhiều process cùng ghi vẫn đúng.
+"""
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from limits.storage import Storage
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lane_slots (
+    token TEXT PRIMARY KEY,
+    lane TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lane_slots_lane ON lane_slots (lane);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_LRU_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {name} (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_{name}_accessed ON {name} (accessed_at);
+CREATE TABLE IF NOT EXISTS {name}_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO {name}_meta (id, total_bytes) SELECT 0, COALESCE(SUM(size), 0) FROM {name};
+"""
+
+
+class SharedStateStore:
+    """File SQLite dùng chung, connection theo từng thread."""
+
+    def __init__(self, path: str, schema: str = _SCHEMA):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Sau fork, connection của process cha không được dùng lại
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(self.schema)
+                self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transaction ghi độc quyền (``BEGIN IMMEDIATE``) giữa mọi process."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def reset_lane_slots(self) -> None:
+        """Xoá slot cũ (gọi bởi process master trước khi spawn worker)."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM lane_slots")
+
+
+_store: Optional[SharedStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> SharedStateStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedStateStore(settings.shared_state_path)
+    return _store
+
+
+class LRUCache:
+    """Cache key -> bytes trong một bảng SQLite, giới hạn tổng dung lượng, xoá entry ít dùng nhất.
+
+    Tổng dung lượng được cộng dồn trong bảng ``<name>_meta`` (cùng transaction với ghi/xoá)
+    nên không phải ``SUM()`` cả bảng sau mỗi lần ghi. Mọi lỗi SQLite/IO chỉ log warning:
+    cache là best-effort.
+    """
+
+    # Khi vượt giới hạn, xoá tới mức này để không phải dọn sau mỗi lần ghi
+    EVICT_TARGET_RATIO = 0.9
+    EVICT_BATCH = 256
+
+    def __init__(self, name: str, max_bytes: int, store_factory: Callable[[], SharedStateStore] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._store_factory = store_factory or get_store
+        self._table_ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _store(self) -> SharedStateStore:
+        store = self._store_factory()
+        if not self._table_ready:
+            store.connection().executescript(_LRU_SCHEMA.format(name=self.name))
+            self._table_ready = True
+        return store
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            store = self._store()
+            row = store.connection().execute(f"SELECT value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with store.transaction() as conn:
+                conn.execute(f"UPDATE {self.name} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("⚠️ Không đọc được cache %s: %s", self.name, e)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        try:
+            with self._store().transaction() as conn:
+                old = conn.execute(f"SELECT size FROM {self.name} WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, data, len(data), time.time()),
+                )
+                total = self._add_total(conn, len(data) - (old[0] if old else 0))
+                if total > self.max_bytes:
+                    self._evict(conn, total)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("⚠️ Không ghi được cache %s: %s", self.name, e)
+
+    def total_bytes(self) -> int:
+        try:
+            row = self._store().connection().execute(
+                f"SELECT total_bytes FROM {self.name}_meta WHERE id = 0"
+            ).fetchone()
+            return row[0] if row else 0
+        except (sqlite3.Error, OSError):
+            return 0
+
+    def _add_total(self, conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute(f"UPDATE {self.name}_meta SET total_bytes = total_bytes + ? WHERE id = 0", (delta,))
+        return conn.execute(f"SELECT total_bytes FROM {self.name}_meta WHERE id = 0").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, total: int) -> None:
+        target = int(self.max_bytes * self.EVICT_TARGET_RATIO)
+        evicted = 0
+        while total > target:
+            rows = conn.execute(
+                f"SELECT key, size FROM {self.name} ORDER BY accessed_at LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                batch.append((key,))
+                total -= size
+            conn.executemany(f"DELETE FROM {self.name} WHERE key = ?", batch)
+            evicted += len(batch)
+        conn.execute(f"UPDATE {self.name}_meta SET total_bytes = ? WHERE id = 0", (max(0, total),))
+        logger.debug("🧹 Cache %s: xoá %s entry (LRU)", self.name, evicted)
+
+
+class SQLiteStorage(Storage):
+    """Storage cho thư viện ``limits`` (fixed window): ``sqlite:///path/to/state.db``.
+
+    Đăng ký scheme ``sqlite`` qua ``STORAGE_SCHEME`` nên dùng được trực tiếp với
+    ``storage_from_string("sqlite:///...")``.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        path = urllib.parse.urlparse(uri).path if uri else ""
+        self.store = SharedStateStore(path) if path and path != settings.shared_state_path else get_store()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT count, expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                # Cửa sổ mới: dọn luôn các key đã hết hạn để bảng không phình
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+                count = amount
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?)",
+                    (key, count, now + expiry),
+                )
+            else:
+                count = row[0] + amount
+                conn.execute("UPDATE rate_limits SET count = ? WHERE key = ?", (count, key))
+        return count
+
+    def get(self, key: str) -> int:
+        row = self.store.connection().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self.store.connection().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self.store.connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self.store.transaction() as conn:
+            return conn.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
@@ -0,0 +1,168 @@
+"""Chia nội dung Markdown thành chunk có cấu trúc (cho RAG) ngay trong lúc parser trích xuất.
+
+Parser gọi ``add_section`` cho từng đơn vị nó đã biết (trang PDF, slide, sheet, đoạn/bảng
+Word) kèm vị trí; mỗi section được tách thành block (heading / paragraph / table / list).
+``build(content)`` định vị các block trong nội dung cuối cùng trả cho client, gộp các block
+liền nhau cùng loại, cùng vị trí và cùng heading path tới giới hạn token, và trả về chunk
+kèm offset ký tự trong ``extracted_content``.
+
+Số token được ước lượng theo số ký tự (``CHARS_PER_TOKEN``), không phụ thuộc tokenizer.
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models import Chunk
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_LIST_ITEM_RE = re.compile(r"^\s*([-*+•]|\d+[.)])\s")
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def classify_block(text: str) -> str:
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) == 1 and _HEADING_RE.match(lines[0].strip()):
+        return "heading"
+    if all(line.lstrip().startswith("|") for line in lines):
+        return "table"
+    if all(_LIST_ITEM_RE.match(line) for line in lines):
+        return "list"
+    return "paragraph"
+
+
+@dataclass
+class _Block:
+    text: str
+    element_type: str
+    location: Dict[str, object] = field(default_factory=dict)
+
+
+class ChunkBuilder:
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max(1, max_tokens)
+        self._blocks: List[_Block] = []
+
+    def add_section(self, text: str, **location) -> None:
+        """Thêm nội dung của 1 đơn vị (``page=``, ``slide=``, ``sheet=``) theo đúng thứ tự trong output."""
+        for raw in _BLOCK_SPLIT_RE.split(text):
+            raw = raw.strip()
+            if not raw:
+                continue
+            lines = raw.splitlines()
+            # Heading dính liền đoạn văn bên dưới -> tách riêng
+            if len(lines) > 1 and _HEADING_RE.match(lines[0].strip()):
+                self._blocks.append(_Block(lines[0].strip(), "heading", location))
+                raw = "\n".join(lines[1:]).strip()
+                if not raw:
+                    continue
+            self._blocks.append(_Block(raw, classify_block(raw), location))
+
+    def build(self, content: str) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        headings: List[Tuple[int, str]] = []
+        current: Optional[dict] = None
+        cursor = 0
+
+        def flush():
+            nonlocal current
+            if current is not None:
+                start, end = current["start"], current["end"]
+                chunks.append(Chunk(
+                    index=len(chunks),
+                    text=content[start:end],
+                    element_type=current["element_type"],
+                    heading_path=current["heading_path"],
+                    char_start=start,
+                    char_end=end,
+                    **current["location"],
+                ))
+            current = None
+
+        for block in self._blocks:
+            start = content.find(block.text, cursor)
+            if start < 0:
+                # Nội dung đã bị chuẩn hoá khác đi sau khi parser thêm section
+                logger.debug("⚠️ Không định vị được block trong output: %r", block.text[:60])
+                continue
+            end = start + len(block.text)
+            cursor = end
+
+            if block.element_type == "heading":
+                flush()
+                match = _HEADING_RE.match(block.text)
+                level = len(match.group(1))
+                title = match.group(2).strip().strip("*_").strip()
+                headings = [(lvl, text) for lvl, text in headings if lvl < level] + [(level, title)]
+                continue
+
+            for piece_start, piece_end in self._split(content, start, end):
+                if (
+                    current is not None
+                    and current["element_type"] == block.element_type
+                    and current["location"] == block.location
+                    and estimate_tokens(content[current["start"]:piece_end]) <= self.max_tokens
+                ):
+                    current["end"] = piece_end
+                    continue
+                flush()
+                current = {
+                    "start": piece_start,
+                    "end": piece_end,
+                    "element_type": block.element_type,
+                    "location": block.location,
+                    "heading_path": [text for _, text in headings],
+                }
+        flush()
+        return chunks
+
+    def _split(self, content: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Cắt block vượt giới hạn theo dòng (dòng quá dài thì theo khoảng trắng)."""
+        if estimate_tokens(content[start:end]) <= self.max_tokens:
+            return [(start, end)]
+
+        max_chars = self.max_tokens * CHARS_PER_TOKEN
+        pieces: List[Tuple[int, int]] = []
+        piece_start = start
+        position = start
+        while position < end:
+            line_end = content.find("\n", position, end)
+            line_end = end if line_end < 0 else line_end + 1
+            if line_end - piece_start > max_chars and position > piece_start:
+                pieces.append((piece_start, position))
+                piece_start = position
+            while line_end - piece_start > max_chars:
+                cut = content.rfind(" ", piece_start + 1, piece_start + max_chars)
+                cut = piece_start + max_chars if cut <= piece_start else cut + 1
+                pieces.append((piece_start, cut))
+                piece_start = cut
+            position = line_end
+        if piece_start < end:
+            pieces.append((piece_start, end))
+        # Bỏ khoảng trắng ở hai đầu mỗi mảnh để offset trỏ đúng vào nội dung
+        trimmed = []
+        for piece_start, piece_end in pieces:
+            text = content[piece_start:piece_end]
+            left = len(text) - len(text.lstrip())
+            right = len(text.rstrip())
+            if right > left:
+                trimmed.append((piece_start + left, piece_start + right))
+        return trimmed
+
+
+def builder_from_config(config: Optional[dict]) -> Optional[ChunkBuilder]:
+    """``ChunkBuilder`` nếu request yêu cầu ``output_format=chunks``, ngược lại ``None``."""
+    config = config or {}
+    if config.get("output_format") != "chunks":
+        return None
+    return ChunkBuilder(config.get("chunk_max_tokens") or settings.chunk_max_tokens)
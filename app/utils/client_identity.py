@@ -0,0 +1,77 @@
+"""Định danh client cho rate limit, quota theo chi phí và fair-share scheduling.
+
+Sau gateway mọi client dùng chung vài IP, nên định danh được chọn theo thứ tự:
+
+- ``X-API-Key`` có trong ``CLIENT_API_KEYS``: ``key:<tên>`` (key lạ bị bỏ qua, không thì mỗi key
+  ngẫu nhiên là 1 client mới để né rate limit / quota);
+- ``X-Client-Id`` do gateway đặt: ``id:<giá trị>``, chỉ khi kết nối tới từ
+  ``CLIENT_ID_TRUSTED_PROXIES`` (client gọi thẳng không mạo danh được client khác);
+- IP kết nối: ``ip:<địa chỉ>``.
+
+``RateLimitMiddleware`` xác định client và đặt vào ContextVar cho tầng service.
+"""
+import ipaddress
+import re
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+
+API_KEY_HEADER = b"x-api-key"
+CLIENT_ID_HEADER = b"x-client-id"
+MAX_CLIENT_ID_LENGTH = 64
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9_.:@-]")
+
+client_id_var: ContextVar[str] = ContextVar("client_id", default="ip:127.0.0.1")
+
+
+def _parse_mapping(value: str) -> Dict[str, str]:
+    """``"a=b, c=d"`` -> ``{"a": "b", "c": "d"}``."""
+    mapping = {}
+    for part in (value or "").split(","):
+        key, sep, val = part.strip().partition("=")
+        if sep and key.strip():
+            mapping[key.strip()] = val.strip()
+    return mapping
+
+
+API_KEYS = _parse_mapping(settings.client_api_keys)
+CLIENT_WEIGHTS = {client: float(weight) for client, weight in _parse_mapping(settings.client_weights).items()}
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(part.strip(), strict=False)
+    for part in settings.client_id_trusted_proxies.split(",") if part.strip()
+]
+
+
+def _is_trusted_proxy(client_addr: Optional[str]) -> bool:
+    if not TRUSTED_PROXIES or not client_addr:
+        return False
+    try:
+        address = ipaddress.ip_address(client_addr)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def identify(headers: Iterable[Tuple[bytes, bytes]], client_addr: Optional[str]) -> str:
+    api_key = client_id = None
+    for key, value in headers:
+        if key == API_KEY_HEADER:
+            api_key = value.decode("latin-1").strip()
+        elif key == CLIENT_ID_HEADER:
+            client_id = value.decode("latin-1").strip()
+
+    if api_key and api_key in API_KEYS:
+        return f"key:{API_KEYS[api_key]}"
+    if client_id and _is_trusted_proxy(client_addr):
+        return f"id:{_UNSAFE_CHARS_RE.sub('_', client_id)[:MAX_CLIENT_ID_LENGTH]}"
+    return f"ip:{client_addr or '127.0.0.1'}"
+
+
+def get_client_id() -> str:
+    return client_id_var.get()
+
+
+def client_weight(client_id: str) -> float:
+    """Trọng số fair-share (``CLIENT_WEIGHTS``, mặc định 1)."""
+    return max(0.01, CLIENT_WEIGHTS.get(client_id, 1.0))
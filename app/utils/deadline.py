@@ -0,0 +1,28 @@
+"""Deadline của request (``time.monotonic()``), đặt bởi ``TimeoutMiddleware``.
+
+Deadline đi theo ContextVar tới tầng service và được truyền tiếp cho parser qua
+``config["deadline"]`` để parser biết còn bao nhiêu thời gian.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def get_deadline() -> Optional[float]:
+    return deadline_var.get()
+
+
+def time_left(deadline: Optional[float] = None) -> Optional[float]:
+    """Số giây còn lại tới ``deadline`` (mặc định lấy từ context); None nếu không có deadline."""
+    if deadline is None:
+        deadline = deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def is_expired(deadline: Optional[float] = None) -> bool:
+    remaining = time_left(deadline)
+    return remaining is not None and remaining <= 0
@@ -0,0 +1,107 @@
+import io
+import zipfile
+from typing import Optional
+
+# Số byte đầu file dùng để nhận diện định dạng
+SNIFF_HEAD_SIZE = 8 * 1024
+
+PDF_MAGIC = b"%PDF-"
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+ZIP_MAGIC = b"PK\x03\x04"
+# PDF thật có header ở offset 0, cùng lắm sau BOM / vài byte whitespace
+PDF_LEADING_BYTES = b"\xef\xbb\xbf \t\r\n\x00"
+PDF_MAX_LEADING = 16
+
+# Tên stream trong OLE compound file (UTF-16LE) để phân biệt Word / Excel / PowerPoint cũ
+OLE_WORD_STREAM = "WordDocument".encode("utf-16-le")
+OLE_OTHER_STREAMS = (
+    "Workbook".encode("utf-16-le"),
+    "PowerPoint Document".encode("utf-16-le"),
+)
+
+# Thư mục đặc trưng trong OOXML zip -> extension
+OOXML_PREFIXES = (
+    ("word/", "docx"),
+    ("ppt/", "pptx"),
+    ("xl/", "xlsx"),
+)
+
+TEXT_EXTENSIONS = {"txt", "json", "md"}
+
+
+def _extension_of(filename: Optional[str]) -> str:
+    if filename and "." in filename:
+        return filename.rsplit(".", 1)[-1].lower()
+    return ""
+
+
+def _sniff_zip(content: bytes) -> Optional[str]:
+    """Đọc central directory của zip và nhận diện docx/pptx/xlsx."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            names = zf.namelist()
+    except zipfile.BadZipFile:
+        return None
+
+    for prefix, ext in OOXML_PREFIXES:
+        if any(name.startswith(prefix) for name in names):
+            return ext
+    return None
+
+
+def _is_pdf_header(head: bytes) -> bool:
+    stripped = head[:PDF_MAX_LEADING + len(PDF_MAGIC)].lstrip(PDF_LEADING_BYTES)
+    return stripped.startswith(PDF_MAGIC)
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if not head:
+        return False
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # Cho phép ký tự UTF-8 bị cắt ở cuối đoạn head
+        if e.start >= len(head) - 3:
+            return True
+    # Fallback latin-1 như TxtParser: chấp nhận nếu phần lớn là ký tự in được
+    printable = sum(1 for b in head if b >= 0x20 or b in (0x09, 0x0A, 0x0D))
+    return printable / len(head) > 0.95
+
+
+def sniff_file_type(content: bytes, filename: Optional[str] = None) -> Optional[str]:
+    """Nhận diện loại file theo nội dung (magic bytes), không tin vào đuôi file.
+
+    Trả về extension của parser phù hợp ("pdf", "doc", "docx", "pptx", "xlsx",
+    "txt", "json", "md") hoặc None nếu nội dung không được hỗ trợ.
+    """
+    head = content[:SNIFF_HEAD_SIZE]
+    claimed_ext = _extension_of(filename)
+
+    # File rỗng không có gì để nhận diện: theo đuôi file như trước (txt/md rỗng -> nội dung rỗng)
+    if not content:
+        return claimed_ext or None
+
+    # Container (OLE/zip) được kiểm tra trước: zip có thể chứa file PDF không nén bên trong
+
+    if head.startswith(OLE_MAGIC):
+        if OLE_WORD_STREAM in content:
+            return "doc"
+        if any(stream in content for stream in OLE_OTHER_STREAMS):
+            return None
+        # Không đọc được directory entry -> chỉ tin đuôi .doc
+        return "doc" if claimed_ext == "doc" else None
+
+    if head.startswith(ZIP_MAGIC):
+        return _sniff_zip(content)
+
+    # PDF: chỉ chấp nhận header ở đầu file (sau BOM / whitespace ngắn), không phải text nhắc tới "%PDF-"
+    if _is_pdf_header(head):
+        return "pdf"
+
+    if _looks_like_text(head):
+        return claimed_ext if claimed_ext in TEXT_EXTENSIONS else "txt"
+
+    return None
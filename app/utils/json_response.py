@@ -0,0 +1,27 @@
+"""Serialize JSON bằng orjson cho response lớn (``extracted_content`` có thể hàng chục MB).
+
+Endpoint trả thẳng ``FastJSONResponse(model)``: FastAPI không validate/``jsonable_encoder`` lại
+kết quả, model chỉ được serialize 1 lần thành bytes.
+"""
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if isinstance(content, BaseModel):
+        content = content.model_dump()
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,74 +1,249 @@
-import os
-import sys
-import logging
-from logging.handlers import RotatingFileHandler
-from typing import Optional
-
-
-class InfoFilter(logging.Filter):
-    """Chỉ cho phép log level INFO"""
-    def filter(self, record: logging.LogRecord) -> bool:
-        return record.levelno == logging.INFO
-
-
-def setup_logger(name: Optional[str] = None) -> logging.Logger:
-    """
-    Setup logger dùng chung cho toàn app
-
-    - Console: INFO+
-    - info.log: chỉ INFO
-    - error.log: ERROR+
-    """
-
-    logger_name = name or __name__
-    logger = logging.getLogger(logger_name)
-
-    # Tránh add handler nhiều lần
-    if logger.handlers:
-        return logger
-
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-
-    logger.setLevel(logging.DEBUG)
-
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(filename)s:%(lineno)d",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-
-    # ===== Console handler =====
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-
-    # ===== ERROR file handler =====
-    error_handler = RotatingFileHandler(
-        filename=os.path.join(log_dir, "error.log"),
-        maxBytes=1000000,
-        backupCount=5,
-        encoding="utf-8",
-    )
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(formatter)
-
-    # ===== INFO file handler =====
-    info_handler = RotatingFileHandler(
-        filename=os.path.join(log_dir, "info.log"),
-        maxBytes=1000000,
-        backupCount=5,
-        encoding="utf-8",
-    )
-    info_handler.setLevel(logging.INFO)
-    info_handler.addFilter(InfoFilter())
-    info_handler.setFormatter(formatter)
-
-    # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(error_handler)
-    logger.addHandler(info_handler)
-
-    # Không propagate lên root (tránh log trùng)
-    logger.propagate = False
-
-    return logger
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.resources import pid_alive, worker_count
+
+# Request id của request hiện tại, được gắn vào mọi log record (middleware set giá trị)
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+class InfoFilter(logging.Filter):
+    """Chỉ cho phép log level INFO"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno == logging.INFO
+
+
+class RequestContextFilter(logging.Filter):
+    """Gắn request_id vào record ngay tại thread gọi log (trước khi vào queue)."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """Giới hạn số log DEBUG theo từng vị trí gọi (file:line) mỗi giây.
+
+    Các log theo từng shape/slide/sheet/trang OCR chỉ giữ ``max_per_second`` bản ghi mỗi
+    giây cho mỗi call site, phần còn lại bị bỏ (có đếm để báo lại).
+    """
+    def __init__(self, max_per_second: int):
+        super().__init__()
+        self.max_per_second = max_per_second
+        self._windows: Dict[Tuple[str, int], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.max_per_second <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = int(time.monotonic())
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] != now:
+                dropped = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = f"{record.msg} (bỏ qua {dropped} log tương tự)"
+                return True
+            if window[1] < self.max_per_second:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Structured log 1 dòng JSON, phục vụ ELK."""
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "file": f"{record.filename}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler không bao giờ block thread gọi log: queue đầy thì bỏ record."""
+    dropped = 0
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Ghép msg + args nhưng giữ traceback ở ``exc_text`` (không trộn vào message).
+
+        ``QueueHandler.prepare`` mặc định format traceback vào ``msg`` và xoá ``exc_text``: log JSON
+        mất trường ``exc_info``. Sink text vẫn in traceback sau message từ ``exc_text``.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def _level(name: str, default: int) -> int:
+    return getattr(logging, str(name).upper(), default)
+
+
+_WORKER_LOG_RE = re.compile(r"^(?:info|error)\.(\d+)\.log(?:\.\d+)?$")
+
+
+def _prune_worker_logs(log_dir: str) -> None:
+    """Xoá file log riêng (kể cả bản rollover) của các worker đã chết, tránh tích tụ qua các lần restart."""
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return
+    for name in names:
+        match = _WORKER_LOG_RE.match(name)
+        if match and not pid_alive(int(match.group(1))):
+            try:
+                os.remove(os.path.join(log_dir, name))
+            except OSError:
+                pass
+
+
+def _build_sink_handlers(log_dir: str) -> List[logging.Handler]:
+    if settings.log_format.lower() == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(filename)s:%(lineno)d",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+
+    # Nhiều worker (app.serve): mỗi process ghi file riêng, RotatingFileHandler không an toàn khi
+    # nhiều process cùng rollover 1 file
+    suffix = f".{os.getpid()}" if worker_count() > 1 else ""
+    if suffix:
+        _prune_worker_logs(log_dir)
+
+    # ===== Console handler =====
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(_level(settings.log_console_level, logging.INFO))
+    console_handler.setFormatter(formatter)
+
+    # ===== ERROR file handler =====
+    error_handler = RotatingFileHandler(
+        filename=os.path.join(log_dir, f"error{suffix}.log"),
+        maxBytes=1000000,
+        backupCount=5,
+        encoding="utf-8",
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter)
+
+    # ===== INFO file handler =====
+    info_handler = RotatingFileHandler(
+        filename=os.path.join(log_dir, f"info{suffix}.log"),
+        maxBytes=1000000,
+        backupCount=5,
+        encoding="utf-8",
+    )
+    info_handler.setLevel(logging.INFO)
+    info_handler.addFilter(InfoFilter())
+    info_handler.setFormatter(formatter)
+
+    return [console_handler, error_handler, info_handler]
+
+
+def _get_queue_handler() -> QueueHandler:
+    """Tạo (một lần) queue dùng chung và background writer duy nhất cho toàn process."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        return _queue_handler
+
+    with _setup_lock:
+        if _queue_handler is None:
+            log_dir = "logs"
+            os.makedirs(log_dir, exist_ok=True)
+
+            sinks = _build_sink_handlers(log_dir)
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+
+            handler = NonBlockingQueueHandler(log_queue)
+            # Record dưới level thấp nhất của các sink không cần đi vào queue
+            handler.setLevel(min(h.level for h in sinks))
+            handler.addFilter(RequestContextFilter())
+
+            # Ghi stdout/file (kể cả rollover) chỉ diễn ra trong thread của listener
+            _listener = QueueListener(log_queue, *sinks, respect_handler_level=True)
+            _listener.start()
+            atexit.register(stop_logging)
+            _queue_handler = handler
+    return _queue_handler
+
+
+def stop_logging() -> None:
+    """Flush các log còn trong queue và dừng background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logger(name: Optional[str] = None) -> logging.Logger:
+    """
+    Setup logger dùng chung cho toàn app
+
+    Mọi logger ghi vào một queue chung, một background thread (QueueListener) ghi ra:
+    - Console: LOG_CONSOLE_LEVEL (mặc định INFO)
+    - info.log: chỉ INFO
+    - error.log: ERROR+
+    (nhiều worker: info.<pid>.log / error.<pid>.log cho từng process)
+    LOG_FORMAT=json để ghi structured log kèm request_id.
+    """
+
+    logger_name = name or __name__
+    logger = logging.getLogger(logger_name)
+
+    # Tránh add handler nhiều lần
+    if logger.handlers:
+        return logger
+
+    handler = _get_queue_handler()
+
+    # Level của logger = level thấp nhất mà sink chấp nhận: logger.debug(...) trả về ngay
+    # khi không có sink nào ghi DEBUG, không tốn chi phí format/enqueue
+    logger.setLevel(handler.level)
+    logger.addFilter(DebugRateLimitFilter(settings.log_debug_max_per_second))
+    logger.addHandler(handler)
+
+    # Không propagate lên root (tránh log trùng)
+    logger.propagate = False
+
+    return logger
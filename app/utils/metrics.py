@@ -0,0 +1,298 @@
+"""Metrics tối giản theo định dạng Prometheus text exposition (không cần prometheus_client).
+
+- ``Counter``, ``Gauge``, ``Histogram`` hỗ trợ label, thread-safe (parser chạy trong thread pool)
+- ``timed`` / ``timed_stage``: context manager đo thời gian cho từng stage của parser
+- ``render_latest()``: xuất toàn bộ metrics cho endpoint ``/metrics``
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket mặc định (giây) cho các stage từ vài ms đến vài phút
+DEFAULT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000)
+RATE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _ValueChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """Giá trị được tính tại thời điểm scrape (vd: số slot semaphore đang dùng)."""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._upper_bounds = list(buckets) + [math.inf]
+        self._counts = [0] * len(self._upper_bounds)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            for i, bound in enumerate(self._upper_bounds):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def snapshot(self) -> Tuple[List[Tuple[float, int]], float, int]:
+        with self._lock:
+            cumulative = []
+            total = 0
+            for bound, count in zip(self._upper_bounds, self._counts):
+                total += count
+                cumulative.append((bound, total))
+            return cumulative, self._sum, total
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_TIME_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            buckets, total_sum, count = child.snapshot()
+            for bound, cumulative in buckets:
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric đã tồn tại: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+# =========================
+# METRICS CỦA SERVICE
+# =========================
+UPLOAD_READ_SECONDS = Histogram(
+    "parser_upload_read_seconds", "Thời gian đọc nội dung UploadFile")
+TEMP_WRITE_SECONDS = Histogram(
+    "parser_temp_write_seconds", "Thời gian ghi file tạm")
+PARSE_SOURCE_TOTAL = Counter(
+    "parser_parse_source_total", "Số file parse từ RAM (memory) hoặc qua file tạm (disk)", ["source"])
+OCR_CLASSIFICATION_SECONDS = Histogram(
+    "parser_ocr_classification_seconds", "Thời gian phân loại PDF native/scan")
+ESTIMATE_SECONDS = Histogram(
+    "parser_estimate_seconds", "Thời gian ước lượng chi phí tài liệu từ metadata trước khi parse")
+QUEUE_WAIT_SECONDS = Histogram(
+    "parser_queue_wait_seconds", "Thời gian chờ slot lane và thread của executor", ["lane"])
+PARSE_SECONDS = Histogram(
+    "parser_parse_seconds", "Thời gian parse theo parser và lane", ["parser", "lane"])
+STAGE_SECONDS = Histogram(
+    "parser_stage_seconds", "Thời gian các stage con bên trong parser", ["stage"])
+OCR_PAGES_PER_SECOND = Histogram(
+    "parser_ocr_pages_per_second", "Tốc độ OCR (trang/giây) cho mỗi tài liệu", buckets=RATE_BUCKETS)
+LIBREOFFICE_SECONDS = Histogram(
+    "parser_libreoffice_conversion_seconds", "Thời gian convert .doc -> .docx bằng LibreOffice")
+OUTPUT_CHARS = Histogram(
+    "parser_output_size_chars", "Kích thước nội dung Markdown trả về (số ký tự)", ["parser"], buckets=SIZE_BUCKETS)
+REQUESTS_TOTAL = Counter(
+    "parser_requests_total", "Số request convert theo parser, lane và status code", ["parser", "lane", "status"])
+LANE_IN_USE = Gauge(
+    "parser_lane_in_use", "Số slot đang được dùng trong lane (toàn bộ worker nếu bật shared state)", ["lane"])
+LANE_LIMIT = Gauge(
+    "parser_lane_limit", "Số slot tối đa của lane", ["lane"])
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "parser_executor_queue_depth", "Số job đang chờ thread trong executor")
+SCHEDULER_CPU_LIMIT = Gauge(
+    "parser_scheduler_cpu_limit", "Ngân sách CPU token hiệu dụng của process (điều chỉnh AIMD)")
+SCHEDULER_CPU_IN_USE = Gauge(
+    "parser_scheduler_cpu_in_use", "Số CPU token đang cấp cho các job")
+SCHEDULER_MEMORY_IN_USE = Gauge(
+    "parser_scheduler_memory_in_use_bytes", "RAM đang đặt chỗ cho các job")
+SCHEDULER_WAITING = Gauge(
+    "parser_scheduler_waiting", "Số job đang chờ CPU token / RAM")
+SCRATCH_USAGE_BYTES = Gauge(
+    "parser_scratch_usage_bytes", "Dung lượng scratch space (file tạm) đang dùng")
+SCRATCH_SWEPT_TOTAL = Counter(
+    "parser_scratch_swept_total", "Số thư mục/file tạm mồ côi đã bị sweeper xoá")
+PARTIAL_RESULTS_TOTAL = Counter(
+    "parser_partial_results_total", "Số response trả kết quả một phần do hết time budget", ["parser"])
+RESULT_CACHE_TOTAL = Counter(
+    "parser_result_cache_total", "Số lần tra cache kết quả parse", ["result"])
+OCR_CACHE_TOTAL = Counter(
+    "parser_ocr_cache_total", "Số lần tra cache text OCR theo trang", ["result"])
+OCR_CACHE_SAVED_BYTES = Counter(
+    "parser_ocr_cache_saved_bytes_total", "Tổng số byte pixel trang không phải đưa vào Tesseract nhờ cache")
+OCR_OSD_TOTAL = Counter(
+    "parser_ocr_osd_total", "Số lần chạy OSD (xoay trang / script) theo kết quả", ["result"])
+OCR_TABLES_TOTAL = Counter(
+    "parser_ocr_tables_total", "Số bảng kẻ ô được phát hiện và dựng lại khi OCR trang scan")
+EMBEDDED_IMAGES_TOTAL = Counter(
+    "parser_embedded_images_total", "Số ảnh nhúng DOCX/PPTX theo kết quả OCR (ocr / duplicate / small / skipped ...)", ["result"])
+PART_CACHE_TOTAL = Counter(
+    "parser_part_cache_total", "Số lần tra cache Markdown theo phần (sheet / thân tài liệu)", ["parser", "result"])
+CLIENT_COST_TOTAL = Counter(
+    "parser_client_cost_total", "Chi phí parse đã tiêu theo loại (ocr_pages / cpu_seconds) và tier", ["resource", "tier"])
+PREPARSE_REJECTED_TOTAL = Counter(
+    "parser_preparse_rejected_total", "Số file bị từ chối sớm theo ước lượng chi phí", ["reason"])
+PROFILES_TOTAL = Counter(
+    "parser_profiles_total", "Số request được profile theo cách kích hoạt (header / sample)", ["trigger"])
+QUOTA_REJECTED_TOTAL = Counter(
+    "parser_quota_rejected_total", "Số request bị từ chối do client hết quota chi phí", ["resource"])
+
+
+@contextmanager
+def timed(histogram, **labels) -> Iterator[None]:
+    """Đo thời gian block và ghi vào ``histogram`` (với label nếu có)."""
+    target = histogram.labels(**labels) if labels else histogram
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        target.observe(time.perf_counter() - start)
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Timing context dùng chung cho các stage con của parser, vd ``timed_stage("pdf.native")``."""
+    with timed(STAGE_SECONDS, stage=stage):
+        yield
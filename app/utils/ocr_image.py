@@ -0,0 +1,73 @@
+"""Tiền xử lý ảnh cho OCR trên buffer dùng lại theo từng worker thread.
+
+Pixmap của PyMuPDF được đọc trực tiếp qua ``samples_mv`` (memoryview, không copy), sau đó
+padding/làm sắc nét/tăng tương phản được ghi vào các mảng NumPy cấp phát sẵn cho mỗi
+worker thread. Bộ nhớ cho mỗi request vì vậy tỉ lệ với số worker, không phải số trang.
+"""
+import threading
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# Tăng khi đổi tiền xử lý ảnh / cách render: text OCR đã cache theo trang không còn dùng được
+OCR_PIPELINE_VERSION = 1
+
+# Lề trắng (px) thêm quanh trang trước khi OCR
+OCR_PADDING = 30
+
+# Tương đương ImageEnhance.Sharpness(2.0): 2 * ảnh gốc - ảnh làm mờ (kernel SMOOTH của PIL)
+_SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+SHARPEN_KERNEL = -_SMOOTH_KERNEL
+SHARPEN_KERNEL[1, 1] += 2.0
+
+CONTRAST_FACTOR = 1.2
+
+_thread_buffers = threading.local()
+
+
+def get_worker_buffer(name: str, shape: Tuple[int, int]) -> np.ndarray:
+    """Trả về view uint8 ``shape`` từ buffer riêng của thread hiện tại (chỉ cấp phát lại khi cần lớn hơn)."""
+    buffers = getattr(_thread_buffers, "buffers", None)
+    if buffers is None:
+        buffers = _thread_buffers.buffers = {}
+
+    size = shape[0] * shape[1]
+    buffer = buffers.get(name)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype=np.uint8)
+        buffers[name] = buffer
+    return buffer[:size].reshape(shape)
+
+
+def pixmap_to_array(pix) -> np.ndarray:
+    """View NumPy (h, w) trên bộ nhớ của Pixmap xám, không copy. Pixmap phải còn sống khi dùng view."""
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    return samples.reshape(pix.height, pix.stride)[:, : pix.width * pix.n]
+
+
+def enhance_for_ocr(gray: np.ndarray) -> np.ndarray:
+    """Padding trắng + làm sắc nét + tăng tương phản nhẹ, ghi vào buffer của worker.
+
+    Kết quả là view trên buffer của thread hiện tại: hợp lệ tới lần gọi tiếp theo trong
+    cùng thread (đủ cho ``pytesseract`` dùng ngay).
+    """
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_RGB2GRAY)
+
+    height, width = gray.shape[0] + 2 * OCR_PADDING, gray.shape[1] + 2 * OCR_PADDING
+    padded = get_worker_buffer("padded", (height, width))
+    enhanced = get_worker_buffer("enhanced", (height, width))
+
+    # 1. Thêm lề trắng (Padding) - copy duy nhất từ pixmap vào buffer của worker
+    cv2.copyMakeBorder(gray, OCR_PADDING, OCR_PADDING, OCR_PADDING, OCR_PADDING,
+                       cv2.BORDER_CONSTANT, dst=padded, value=255)
+
+    # 2. LÀM SẮC NÉT: giúp biên dạng số rõ ràng mà không gây dính nét
+    cv2.filter2D(padded, -1, SHARPEN_KERNEL, dst=enhanced, borderType=cv2.BORDER_REPLICATE)
+
+    # 3. Tăng tương phản nhẹ quanh mức xám trung bình (lọc nền), in-place
+    mean = int(cv2.mean(enhanced)[0] + 0.5)
+    cv2.addWeighted(enhanced, CONTRAST_FACTOR, enhanced, 0, (1 - CONTRAST_FACTOR) * mean, dst=enhanced)
+
+    return enhanced
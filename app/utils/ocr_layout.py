@@ -0,0 +1,160 @@
+"""Phân tích layout trang scan trước khi OCR: tìm bảng kẻ ô bằng phát hiện đường kẻ (OpenCV).
+
+Trang có bảng được chia thành các vùng theo thứ tự đọc (trên xuống dưới): dải text (OCR
+``--psm 3`` như cả trang trước đây) và bảng. Mỗi bảng được OCR 1 lần ``--psm 6`` trên ảnh đã
+xoá đường kẻ; từng từ (bbox do Tesseract trả về) được xếp vào ô theo lưới đường kẻ rồi dựng
+lại thành bảng Markdown. Không gọi Tesseract cho từng ô: mỗi lần gọi là 1 process và phải nạp
+lại model ngôn ngữ. Trang không có bảng trả về ``[]`` (OCR cả trang như cũ).
+"""
+import bisect
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import cv2
+import numpy as np
+
+# Đoạn thẳng ngắn nhất (px, ở zoom render OCR) được coi là đường kẻ
+MIN_LINE_PX = 25
+# Đường kẻ phải phủ tối thiểu tỉ lệ này của bề rộng/chiều cao bảng để thành ranh giới hàng/cột
+LINE_COVERAGE = 0.3
+# Hàng/cột hẹp hơn thế này là 2 nét của cùng 1 đường kẻ (kẻ đôi, nét dày)
+MIN_CELL_PX = 12
+MIN_TABLE_WIDTH_RATIO = 0.15
+# Dải text có ít pixel mực hơn tỉ lệ này coi là trống, không gọi Tesseract
+MIN_INK_RATIO = 0.001
+
+
+@dataclass
+class Region:
+    kind: str  # "text" | "table"
+    top: int
+    left: int
+    image: np.ndarray
+    # Ranh giới hàng/cột của bảng, toạ độ trong ``image``
+    rows: Sequence[int] = ()
+    cols: Sequence[int] = ()
+
+
+def _line_masks(binary: np.ndarray):
+    height, width = binary.shape
+    horizontal = cv2.morphologyEx(
+        binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(MIN_LINE_PX, width // 30), 1))
+    )
+    vertical = cv2.morphologyEx(
+        binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(MIN_LINE_PX, height // 50)))
+    )
+    return horizontal, vertical
+
+
+def _boundaries(profile: np.ndarray, length: int) -> List[int]:
+    """Ranh giới hàng/cột từ số pixel đường kẻ theo 1 trục, luôn gồm 2 mép của bảng."""
+    positions = np.flatnonzero(profile >= length * LINE_COVERAGE)
+    centers = []
+    if positions.size:
+        runs = np.split(positions, np.flatnonzero(np.diff(positions) > 1) + 1)
+        centers = [int(run.mean()) for run in runs]
+
+    bounds = [0]
+    for position in centers + [len(profile)]:
+        if position - bounds[-1] >= MIN_CELL_PX:
+            bounds.append(position)
+        elif position == len(profile):
+            bounds[-1] = position  # đường kẻ sát mép dưới/phải: lấy mép
+    return bounds
+
+
+def analyze_page(gray: np.ndarray) -> List[Region]:
+    """Các vùng cần OCR theo thứ tự đọc; ``[]`` nếu trang không có bảng."""
+    gray = np.ascontiguousarray(gray)
+    page_height, page_width = gray.shape
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    horizontal, vertical = _line_masks(binary)
+    grid = cv2.dilate(cv2.bitwise_or(horizontal, vertical), np.ones((3, 3), np.uint8))
+
+    contours, _ = cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    tables = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < page_width * MIN_TABLE_WIDTH_RATIO or h < 2 * MIN_CELL_PX:
+            continue
+        rows = _boundaries((horizontal[y:y + h, x:x + w] > 0).sum(axis=1), w)
+        cols = _boundaries((vertical[y:y + h, x:x + w] > 0).sum(axis=0), h)
+        # Khung chữ nhật đơn (ô ghi chú, viền trang) không phải bảng: cần ít nhất 2 cột
+        if len(rows) >= 2 and len(cols) >= 3:
+            tables.append((x, y, w, h, rows, cols))
+    if not tables:
+        return []
+
+    # Xoá đường kẻ khỏi ảnh đưa vào Tesseract; vùng text thì xoá luôn các bảng
+    cleaned = gray.copy()
+    cleaned[grid > 0] = 255
+    text_canvas = cleaned.copy()
+    ink = binary.copy()
+    ink[grid > 0] = 0
+    for x, y, w, h, _, _ in tables:
+        text_canvas[y:y + h, x:x + w] = 255
+        ink[y:y + h, x:x + w] = 0
+
+    def text_region(top: int, bottom: int) -> List[Region]:
+        if bottom - top < MIN_CELL_PX:
+            return []
+        if cv2.countNonZero(ink[top:bottom]) < (bottom - top) * page_width * MIN_INK_RATIO:
+            return []
+        return [Region("text", top, 0, text_canvas[top:bottom])]
+
+    # Chia trang theo trục dọc: dải giữa các bảng là text; trong khoảng của bảng, phần ngoài
+    # bảng (text bên cạnh) được OCR sau bảng
+    tables.sort(key=lambda t: (t[1], t[0]))
+    regions: List[Region] = []
+    cursor = 0
+    index = 0
+    while index < len(tables):
+        band_top = tables[index][1]
+        band_bottom = band_top + tables[index][3]
+        group = [tables[index]]
+        index += 1
+        while index < len(tables) and tables[index][1] < band_bottom:
+            group.append(tables[index])
+            band_bottom = max(band_bottom, tables[index][1] + tables[index][3])
+            index += 1
+
+        regions.extend(text_region(cursor, band_top))
+        for x, y, w, h, rows, cols in sorted(group, key=lambda t: t[0]):
+            regions.append(Region("table", y, x, cleaned[y:y + h, x:x + w], rows, cols))
+        regions.extend(text_region(band_top, band_bottom))
+        cursor = band_bottom
+    regions.extend(text_region(cursor, page_height))
+    return regions
+
+
+def assign_words(data: dict, rows: Sequence[int], cols: Sequence[int], offset: int = 0) -> List[List[str]]:
+    """Xếp từ trong kết quả ``image_to_data`` (dict) vào ô theo tâm bbox.
+
+    ``offset``: lề đã thêm quanh ảnh trước OCR (toạ độ Tesseract lệch so với ``rows``/``cols``).
+    """
+    cells = [[[] for _ in range(len(cols) - 1)] for _ in range(len(rows) - 1)]
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        if not word:
+            continue
+        cx = data["left"][i] + data["width"][i] / 2 - offset
+        cy = data["top"][i] + data["height"][i] / 2 - offset
+        row = bisect.bisect_right(rows, cy) - 1
+        col = bisect.bisect_right(cols, cx) - 1
+        if 0 <= row < len(rows) - 1 and 0 <= col < len(cols) - 1:
+            line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            cells[row][col].append((line, data["left"][i], word))
+    return [[" ".join(word for _, _, word in sorted(cell)) for cell in row] for row in cells]
+
+
+def table_to_markdown(rows: List[List[str]]) -> str:
+    """Bảng Markdown, hàng đầu là header; bỏ các hàng trống hoàn toàn."""
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    def line(cells: List[str]) -> str:
+        return "| " + " | ".join(cell.replace("|", "\\|") for cell in cells) + " |"
+
+    header, *body = rows
+    return "\n".join([line(header), "|" + "|".join("---" for _ in header) + "|"] + [line(row) for row in body])
@@ -0,0 +1,131 @@
+"""Pre-pass OSD (orientation & script detection) cho PDF scan.
+
+Trước đây ``ocr_lang = "vie+eng+osd"`` được dùng nguyên cho mọi trang. Giờ OSD (``--psm 0``)
+chỉ chạy trên vài trang mẫu của tài liệu để quyết định 1 lần: góc xoay áp dụng cho mọi trang
+và tập ngôn ngữ nhận dạng nhỏ nhất theo script của các trang mẫu (``osd`` không bao giờ nằm
+trong tập nhận dạng). Các trang mẫu không thống nhất về góc xoay thì từng trang tự chạy OSD.
+
+Kết quả OSD mỗi trang được cache trong ``ocr_cache`` theo hash pixel trang như text OCR.
+"""
+import json
+from dataclasses import dataclass
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import pytesseract
+
+from app.config import settings
+from app.services.ocr_cache import ocr_cache
+from app.utils.logger import setup_logger
+from app.utils.metrics import OCR_OSD_TOTAL
+
+logger = setup_logger(__name__)
+
+OSD_CONFIG_CMD = "--psm 0"
+# Script do OSD trả về của các ngôn ngữ Tesseract thường dùng; ngôn ngữ không có ở đây luôn được giữ
+LANG_SCRIPTS = {
+    "vie": "Latin", "eng": "Latin", "fra": "Latin", "deu": "Latin", "spa": "Latin",
+    "chi_sim": "Han", "chi_tra": "Han", "jpn": "Japanese", "kor": "Hangul",
+    "rus": "Cyrillic", "tha": "Thai", "ara": "Arabic", "khm": "Khmer", "lao": "Lao",
+}
+# Script do OSD đoán với độ tin cậy thấp hơn ngưỡng này không được dùng để bỏ ngôn ngữ
+MIN_SCRIPT_CONFIDENCE = 1.0
+
+_ROTATE_CODES = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+
+@dataclass
+class PageOSD:
+    rotate: int  # Số độ cần xoay theo chiều kim đồng hồ để trang đứng thẳng
+    orientation_conf: float
+    script: str
+    script_conf: float
+
+
+@dataclass
+class OcrPlan:
+    lang: str
+    rotate: int = 0
+    # Trang mẫu không cùng góc xoay: mỗi trang tự chạy OSD
+    per_page_osd: bool = False
+
+
+def recognition_langs(lang: str = None) -> List[str]:
+    """Các ngôn ngữ nhận dạng trong ``ocr_lang`` (bỏ ``osd``)."""
+    langs = [part for part in (lang or settings.ocr_lang).split("+") if part and part != "osd"]
+    return langs or ["eng"]
+
+
+def default_plan() -> OcrPlan:
+    return OcrPlan(lang="+".join(recognition_langs()))
+
+
+def rotate_image(image: np.ndarray, rotate: int) -> np.ndarray:
+    code = _ROTATE_CODES.get(rotate % 360)
+    return image if code is None else cv2.rotate(image, code)
+
+
+def detect_osd(image: np.ndarray) -> Optional[PageOSD]:
+    """OSD 1 trang (có cache); ``None`` nếu Tesseract không đủ ký tự để đoán (trang trống, ảnh)."""
+    cache_key = ocr_cache.page_key(image, "osd", OSD_CONFIG_CMD) if ocr_cache.enabled else None
+    if cache_key is not None:
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            OCR_OSD_TOTAL.labels(result="cached").inc()
+            return PageOSD(**json.loads(cached)) if cached else None
+
+    try:
+        data = pytesseract.image_to_osd(image, config=OSD_CONFIG_CMD, output_type=pytesseract.Output.DICT)
+        osd = PageOSD(
+            rotate=int(data.get("rotate", 0)) % 360,
+            orientation_conf=float(data.get("orientation_conf", 0.0)),
+            script=str(data.get("script", "")),
+            script_conf=float(data.get("script_conf", 0.0)),
+        )
+        OCR_OSD_TOTAL.labels(result="detected").inc()
+    except pytesseract.TesseractError as e:
+        # "Too few characters": trang trống / chỉ có hình, không phải lỗi
+        logger.debug(f"⚪ OSD bỏ qua trang: {e}")
+        OCR_OSD_TOTAL.labels(result="undetected").inc()
+        osd = None
+
+    if cache_key is not None:
+        ocr_cache.put(cache_key, json.dumps(osd.__dict__) if osd is not None else "")
+    return osd
+
+
+def page_rotation(osd: Optional[PageOSD]) -> int:
+    if osd is None or osd.orientation_conf < settings.ocr_osd_min_confidence:
+        return 0
+    return osd.rotate
+
+
+def plan_from_samples(samples: List[Optional[PageOSD]]) -> OcrPlan:
+    """Quyết định góc xoay + tập ngôn ngữ cho cả tài liệu từ kết quả OSD của các trang mẫu."""
+    langs = recognition_langs()
+    detected = [osd for osd in samples if osd is not None]
+    if not detected:
+        return OcrPlan(lang="+".join(langs))
+
+    rotations = {page_rotation(osd) for osd in detected}
+    scripts = {osd.script for osd in detected if osd.script_conf >= MIN_SCRIPT_CONFIDENCE}
+    # Các trang mẫu khác script (tài liệu đa ngôn ngữ): giữ nguyên mọi ngôn ngữ
+    if len(scripts) == 1:
+        script = scripts.pop()
+        narrowed = [lang for lang in langs if LANG_SCRIPTS.get(lang, script) == script]
+        langs = narrowed or langs
+
+    if len(rotations) > 1:
+        return OcrPlan(lang="+".join(langs), per_page_osd=True)
+    return OcrPlan(lang="+".join(langs), rotate=rotations.pop())
+
+
+def sample_indices(indices: List[int], count: int) -> List[int]:
+    """Tối đa ``count`` trang trải đều trong ``indices`` (luôn gồm trang đầu)."""
+    if count <= 0 or not indices:
+        return []
+    if len(indices) <= count:
+        return list(indices)
+    step = len(indices) / count
+    return [indices[int(i * step)] for i in range(count)]
@@ -0,0 +1,39 @@
+"""Chọn trang theo tham số request: ``pages="1-3,7"`` và/hoặc ``first_pages=N`` (1-based)."""
+from typing import List, Optional
+
+# Chặn spec kiểu "1-999999999" tạo list khổng lồ
+MAX_PAGE_NUMBER = 100_000
+
+
+def parse_page_ranges(spec: str) -> List[int]:
+    """``"1-3,7"`` -> ``[1, 2, 3, 7]`` (sắp xếp, không trùng). Raise ``ValueError`` nếu sai cú pháp."""
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        try:
+            start = int(start_str)
+            end = int(end_str) if sep else start
+        except ValueError:
+            raise ValueError(f"Khoảng trang không hợp lệ: '{part}'")
+        if start < 1 or end < start or end > MAX_PAGE_NUMBER:
+            raise ValueError(f"Khoảng trang không hợp lệ: '{part}'")
+        pages.update(range(start, end + 1))
+
+    if not pages:
+        raise ValueError("Danh sách trang rỗng")
+    return sorted(pages)
+
+
+def select_pages(total_pages: int, pages: Optional[List[int]] = None,
+                 first_pages: Optional[int] = None) -> List[int]:
+    """Các trang (0-based, tăng dần) cần trích xuất; trang ngoài tài liệu bị bỏ qua.
+
+    Có cả hai tham số thì lấy ``first_pages`` trang đầu trong danh sách ``pages``.
+    """
+    selected = [p - 1 for p in pages if p <= total_pages] if pages else list(range(total_pages))
+    if first_pages is not None:
+        selected = selected[:first_pages]
+    return selected
@@ -0,0 +1,36 @@
+"""Nguồn dữ liệu cho parser: đường dẫn file tạm hoặc ``BytesIO`` (file nhỏ, parse trong RAM).
+
+File upload nhỏ hơn ``settings.in_memory_parse_max_kb`` không được ghi ra disk; các parser
+đọc nguồn qua helper ở đây nên dùng chung được cho cả hai trường hợp.
+"""
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Union
+
+ParseSource = Union[str, Path, BytesIO]
+
+
+def is_in_memory(source: ParseSource) -> bool:
+    return isinstance(source, BytesIO)
+
+
+def source_name(source: ParseSource, config: Optional[dict] = None) -> str:
+    """Tên hiển thị trong log: tên file tạm, hoặc tên file upload khi parse trong RAM."""
+    if is_in_memory(source):
+        return (config or {}).get("file_name") or "<memory>"
+    return Path(source).name
+
+
+def read_bytes(source: ParseSource) -> bytes:
+    if is_in_memory(source):
+        return source.getvalue()
+    return Path(source).read_bytes()
+
+
+def as_file(source: ParseSource) -> Union[str, BytesIO]:
+    """Đường dẫn, hoặc BytesIO đã seek về đầu: dùng cho thư viện nhận path/file-like
+    (``zipfile``, ``pandas``, ``python-docx``, ``python-pptx``)."""
+    if is_in_memory(source):
+        source.seek(0)
+        return source
+    return str(source)
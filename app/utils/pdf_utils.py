@@ -1,8 +1,8 @@
-from pathlib import Path
-from typing import Any, BinaryIO, Dict, Union
+from typing import Any, Dict, Optional, Sequence
 import fitz
 from pymupdf4llm.helpers import check_ocr
 from app.config import settings
+from app.utils.parse_source import ParseSource, is_in_memory
 
 MAX_INSPECT_PAGES = settings.max_inspect_pages
 TEXT_FLAGS = (
@@ -13,8 +13,16 @@ TEXT_FLAGS = (
     | fitz.TEXT_MEDIABOX_CLIP
 )
 
+def open_pdf(source: ParseSource) -> fitz.Document:
+    """Mở PDF từ đường dẫn hoặc từ BytesIO (file nhỏ parse trong RAM)."""
+    if is_in_memory(source):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
 def decide_should_ocr_file(
-    pdf_path: Union[str, Path, BinaryIO],
+    pdf_path: ParseSource,
+    page_indices: Optional[Sequence[int]] = None,
     *,
     min_ocr_page_ratio: float = 0.3,
     min_ocr_page_count: int = 1,
@@ -22,6 +30,9 @@ def decide_should_ocr_file(
 ) -> Dict[str, Any]:
     """
     Fast, production-ready OCR decision for entire PDF.
+
+    ``page_indices`` (0-based): chỉ xét các trang sẽ được trích xuất (pages/first_pages của request),
+    mặc định là các trang đầu file. Tối đa MAX_INSPECT_PAGES trang.
     """
 
     def decide_should_ocr_page(d: Dict[str, Any]) -> bool:
@@ -58,32 +69,36 @@ def decide_should_ocr_file(
     scan_pages: list[int] = []
     unreadable_pages: list[int] = []
 
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        total_pages += 1
-        inspected_pages += 1
+    with open_pdf(pdf_path) as doc:
+        page_count = doc.page_count
+        if page_indices is None:
+            inspect = range(min(page_count, MAX_INSPECT_PAGES))
+        else:
+            inspect = [index for index in page_indices if 0 <= index < page_count][:MAX_INSPECT_PAGES]
 
-        if inspected_pages > MAX_INSPECT_PAGES:
-            break
+        for index in inspect:
+            page = doc[index]
+            total_pages += 1
+            inspected_pages += 1
 
-        raw = check_ocr.should_ocr_page(page, dpi=dpi)
+            raw = check_ocr.should_ocr_page(page, dpi=dpi)
 
-        if raw.get("has_text") or raw.get("has_ocr_text"):
-            textpage = page.get_textpage(flags=TEXT_FLAGS)
-            raw["blocks"] = textpage.extractDICT().get("blocks", [])
-        else:
-            raw["blocks"] = []
+            if raw.get("has_text") or raw.get("has_ocr_text"):
+                textpage = page.get_textpage(flags=TEXT_FLAGS)
+                raw["blocks"] = textpage.extractDICT().get("blocks", [])
+            else:
+                raw["blocks"] = []
 
-        should_ocr = decide_should_ocr_page(raw)
+            should_ocr = decide_should_ocr_page(raw)
 
-        if should_ocr:
-            ocr_pages.append(page.number)
+            if should_ocr:
+                ocr_pages.append(page.number)
 
-        if raw.get("image_covers_page"):
-            scan_pages.append(page.number)
+            if raw.get("image_covers_page"):
+                scan_pages.append(page.number)
 
-        if raw.get("has_ocr_text") and not raw.get("readable_text"):
-            unreadable_pages.append(page.number)
+            if raw.get("has_ocr_text") and not raw.get("readable_text"):
+                unreadable_pages.append(page.number)
 
     if total_pages == 0:
         return {
@@ -109,6 +124,7 @@ def decide_should_ocr_file(
     return {
         "should_ocr_file": should_ocr_file,
         "total_pages": total_pages,
+        "page_count": page_count,
         "inspected_pages": inspected,
         "ocr_pages": ocr_pages,
         "scan_pages": scan_pages,
@@ -0,0 +1,83 @@
+"""Tài nguyên thực sự dùng được của process: CPU và RAM theo giới hạn cgroup (v2/v1) của container."""
+import math
+import os
+from typing import Optional
+
+# cgroup v1 ghi "không giới hạn" bằng một số rất lớn
+_CGROUP_V1_UNLIMITED = 1 << 60
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> int:
+    """Số CPU dùng được: affinity của process, giới hạn bởi CPU quota của cgroup (v2/v1)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            max_str, period_str = f.read().split()
+            if max_str != "max":
+                quota = int(max_str) / int(period_str)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f_quota, \
+                    open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f_period:
+                quota_us, period_us = int(f_quota.read()), int(f_period.read())
+                if quota_us > 0:
+                    quota = quota_us / period_us
+        except (OSError, ValueError):
+            pass
+
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def available_memory() -> int:
+    """RAM (bytes) dùng được: memory limit của cgroup nếu có, không vượt quá RAM của máy."""
+    total = None
+    meminfo = _read("/proc/meminfo") or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            total = int(line.split()[1]) * 1024
+            break
+
+    limit = None
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value != "max":
+            try:
+                limit = int(value)
+            except ValueError:
+                continue
+            if limit >= _CGROUP_V1_UNLIMITED:
+                limit = None
+            break
+
+    candidates = [value for value in (total, limit) if value]
+    return min(candidates) if candidates else 2 * 1024 ** 3
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_count() -> int:
+    """Số worker uvicorn chia nhau tài nguyên (``WORKERS`` do ``app.serve`` đặt)."""
+    return max(1, int(os.environ.get("WORKERS") or 1))
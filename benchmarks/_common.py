@@ -0,0 +1,95 @@
+"""Tiện ích dùng chung cho benchmark: percentile, metadata môi trường, ghi kết quả JSON."""
+import json
+import math
+import os
+import platform
+import sys
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+
+# Package ảnh hưởng trực tiếp tới hiệu năng parse, ghi lại để so sánh giữa các lần chạy
+TRACKED_PACKAGES = (
+    "pymupdf", "pymupdf4llm", "pandas", "numpy", "openpyxl", "python-docx",
+    "python-pptx", "lxml", "pytesseract", "opencv-python-headless", "fastapi", "starlette",
+)
+
+
+# Corpus gửi lặp lại cùng bytes: bật cache thì chỉ lượt đầu parse, các lượt sau đo cache hit
+CACHE_SIZE_ENV = ("RESULT_CACHE_MAX_MB", "PART_CACHE_MAX_MB", "OCR_CACHE_MAX_MB")
+
+
+def configure_caches(enabled: bool) -> None:
+    """Tắt result/part/OCR cache (mặc định của benchmark); phải gọi trước khi import ``app.config``."""
+    if not enabled:
+        for name in CACHE_SIZE_ENV:
+            os.environ[name] = "0"
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower, upper = math.floor(k), math.ceil(k)
+    if lower == upper:
+        return ordered[int(k)]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def latency_summary(latencies: Iterable[float]) -> Dict[str, Optional[float]]:
+    values = list(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(max(values) if values else None),
+    }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+def environment() -> Dict:
+    from app.config import settings
+
+    versions = {}
+    for name in TRACKED_PACKAGES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "packages": versions,
+        "settings": {
+            key: getattr(settings, key)
+            for key in (
+                "max_concurrent_parser_heavy", "max_concurrent_parser_light",
+                "tesseract_config_max_worker", "tesseract_config_batch_size",
+                "ocr_lang", "max_page_limit", "timeout",
+            )
+        },
+    }
+
+
+def write_results(kind: str, payload: Dict, output: Optional[str] = None) -> Path:
+    """Ghi kết quả ra JSON (mặc định benchmarks/results/<kind>-<timestamp>.json)."""
+    if output:
+        path = Path(output)
+    else:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+    return path
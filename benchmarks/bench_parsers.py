@@ -0,0 +1,120 @@
+"""Benchmark từng parser trên corpus tổng hợp: throughput, latency percentile, peak RSS.
+
+    python -m benchmarks.bench_parsers --iterations 5
+    python -m benchmarks.bench_parsers --only native_pdf --only xlsx --output results/parsers.json
+
+Mỗi file được đo trong một process riêng (spawn) để peak RSS không bị cộng dồn giữa các parser.
+Part/OCR cache bị tắt để các lượt đo không thành cache hit (``--with-caches`` để giữ).
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks._common import configure_caches, environment, latency_summary, write_results
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, load_or_generate
+
+
+def _measure_file(item: Dict, iterations: int, result_queue) -> None:
+    """Chạy trong process con: load parser, chạy 1 lượt warm-up rồi ``iterations`` lượt đo."""
+    try:
+        from app.services.parser_factory import ParserFactory
+
+        parser = ParserFactory.get_parser(item["ext"])
+        config: Dict = {}
+        classification_s = None
+        if item["ext"] == "pdf":
+            from app.utils.pdf_utils import decide_should_ocr_file
+
+            started = time.perf_counter()
+            config["is_pdf_scan"] = decide_should_ocr_file(item["path"])["should_ocr_file"]
+            classification_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first = parser.parse(item["path"], dict(config))
+        first_call_s = time.perf_counter() - started
+
+        latencies: List[float] = []
+        output_chars = len(first.content or "")
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = parser.parse(item["path"], dict(config))
+            latencies.append(time.perf_counter() - started)
+            output_chars = len(result.content or "")
+
+        total = sum(latencies)
+        result_queue.put({
+            "name": item["name"],
+            "kind": item["kind"],
+            "parser": type(parser).__name__,
+            "size_bytes": item["size"],
+            "is_success": bool(first.is_success),
+            "config": config,
+            "ocr_classification_ms": round(classification_s * 1000, 2) if classification_s else None,
+            "first_call_ms": round(first_call_s * 1000, 2),
+            "latency": latency_summary(latencies),
+            "throughput_files_per_s": round(len(latencies) / total, 3) if total else None,
+            "throughput_mb_per_s": round(item["size"] * len(latencies) / total / 1024 / 1024, 3) if total else None,
+            "output_chars": output_chars,
+            # ru_maxrss trên Linux tính bằng KB
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        })
+    except Exception as e:
+        result_queue.put({"name": item["name"], "kind": item["kind"], "error": repr(e)})
+
+
+def run(corpus: List[Dict], iterations: int) -> List[Dict]:
+    ctx = mp.get_context("spawn")
+    results = []
+    for item in corpus:
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=_measure_file, args=(item, iterations, result_queue))
+        proc.start()
+        result = result_queue.get()
+        proc.join()
+        results.append(result)
+
+        if "error" in result:
+            print(f"❌ {item['name']}: {result['error']}")
+        else:
+            lat = result["latency"]
+            print(f"{result['name']:<28} {result['parser']:<12} p50={lat['p50_ms']:>9}ms "
+                  f"p95={lat['p95_ms']:>9}ms  {result['throughput_mb_per_s']:>7} MB/s  "
+                  f"RSS={result['peak_rss_mb']} MB")
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS_DIR))
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--only", action="append", help="Chỉ chạy các kind chỉ định (native_pdf, xlsx, ...)")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/)")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Giữ result/part/OCR cache (mặc định tắt để đo parse thật)")
+    args = parser.parse_args()
+    configure_caches(args.with_caches)
+
+    corpus = load_or_generate(Path(args.corpus), args.scale, args.seed)
+    if args.only:
+        corpus = [item for item in corpus if item["kind"] in args.only]
+
+    results = run(corpus, args.iterations)
+    path = write_results("parsers", {
+        "kind": "parsers",
+        "environment": environment(),
+        "params": {"iterations": args.iterations, "scale": args.scale, "seed": args.seed,
+                   "caches": args.with_caches},
+        "results": results,
+    }, args.output)
+    print(f"\n💾 Đã ghi kết quả: {path}")
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
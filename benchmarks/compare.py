@@ -0,0 +1,82 @@
+"""So sánh hai file kết quả benchmark (parsers hoặc load) và báo regression.
+
+    python -m benchmarks.compare benchmarks/results/parsers-old.json benchmarks/results/parsers-new.json
+    python -m benchmarks.compare old.json new.json --metric p95_ms --max-regression 0.15
+
+Exit code 1 nếu có chỉ số latency tăng (hoặc throughput giảm) vượt ngưỡng.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def _rows(payload: Dict, metric: str) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """Trả về {tên: (latency metric, throughput)} cho cả 2 loại kết quả."""
+    if payload.get("kind") == "load":
+        results = payload["results"]
+        rows = {"overall": (results["latency_ok"].get(metric), results.get("success_rps"))}
+        for kind, stats in results["per_kind"].items():
+            rows[kind] = (stats["latency_ok"].get(metric), None)
+        return rows
+
+    return {
+        item["name"]: (item["latency"].get(metric), item.get("throughput_mb_per_s"))
+        for item in payload["results"]
+        if "error" not in item
+    }
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return new / old - 1
+
+
+def compare(old: Dict, new: Dict, metric: str, max_regression: float) -> List[str]:
+    old_rows, new_rows = _rows(old, metric), _rows(new, metric)
+    regressions = []
+    print(f"{'name':<28} {metric + ' old':>14} {metric + ' new':>14} {'Δ':>8}   {'thrpt Δ':>8}")
+    for name, (new_latency, new_throughput) in new_rows.items():
+        old_latency, old_throughput = old_rows.get(name, (None, None))
+        latency_change = _change(old_latency, new_latency)
+        throughput_change = _change(old_throughput, new_throughput)
+
+        fmt = lambda v: f"{v:+.1%}" if v is not None else "-"
+        print(f"{name:<28} {str(old_latency):>14} {str(new_latency):>14} {fmt(latency_change):>8}   "
+              f"{fmt(throughput_change):>8}")
+
+        if latency_change is not None and latency_change > max_regression:
+            regressions.append(f"{name}: {metric} {old_latency} -> {new_latency} ({latency_change:+.1%})")
+        if throughput_change is not None and throughput_change < -max_regression:
+            regressions.append(f"{name}: throughput {old_throughput} -> {new_throughput} ({throughput_change:+.1%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--metric", default="p50_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    old = json.loads(Path(args.old).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    if old.get("kind") != new.get("kind"):
+        print(f"❌ Không cùng loại kết quả: {old.get('kind')} vs {new.get('kind')}")
+        return 2
+
+    regressions = compare(old, new, args.metric, args.max_regression)
+    if regressions:
+        print("\n❌ Regression:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n✅ Không có regression vượt ngưỡng")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
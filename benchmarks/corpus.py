@@ -0,0 +1,194 @@
+"""Sinh corpus tổng hợp (offline, deterministic) cho benchmark parser.
+
+    python -m benchmarks.corpus --out benchmarks/.corpus --scale 1.0
+
+Corpus gồm: PDF native, PDF "scan" (trang được raster hoá thành ảnh), DOCX lớn có bảng,
+XLSX nhiều sheet, PPTX, JSON và TXT lớn. ``--scale`` nhân số trang/dòng để tạo bộ lớn hơn.
+"""
+import argparse
+import io
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+DEFAULT_CORPUS_DIR = Path(__file__).resolve().parent / ".corpus"
+
+WORDS = (
+    "hợp đồng báo cáo doanh thu quý năm tài chính công ty khách hàng dịch vụ sản phẩm "
+    "thanh toán hoá đơn ngân hàng chi nhánh phòng ban nhân sự kế hoạch dự án triển khai "
+    "revenue invoice contract customer service report quarter budget forecast delivery "
+    "số lượng đơn giá thành tiền ghi chú ngày tháng địa chỉ điện thoại email"
+).split()
+
+
+def _sentence(rng: random.Random, min_words: int = 8, max_words: int = 20) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int = 4) -> str:
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def make_native_pdf(path: Path, rng: random.Random, pages: int) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        text = f"Chương {page_no + 1}\n\n" + "\n\n".join(_paragraph(rng) for _ in range(6))
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=10, fontname="helv")
+    doc.save(path)
+    doc.close()
+
+
+def make_scanned_pdf(path: Path, rng: random.Random, pages: int, dpi: int = 150) -> None:
+    """Tạo PDF native rồi raster hoá từng trang thành ảnh -> không còn text layer."""
+    import fitz
+
+    source = fitz.open()
+    for page_no in range(pages):
+        page = source.new_page()
+        text = f"Trang {page_no + 1}\n\n" + "\n\n".join(_paragraph(rng) for _ in range(5))
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=11, fontname="helv")
+
+    scanned = fitz.open()
+    for page in source:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        new_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+    scanned.save(path, deflate=True)
+    scanned.close()
+    source.close()
+
+
+def make_docx(path: Path, rng: random.Random, sections: int) -> None:
+    from docx import Document
+
+    doc = Document()
+    for section in range(sections):
+        doc.add_heading(f"Mục {section + 1}", level=1)
+        for _ in range(5):
+            doc.add_paragraph(_paragraph(rng))
+        doc.add_heading(f"Bảng {section + 1}", level=2)
+        table = doc.add_table(rows=12, cols=5)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"Cột {c + 1}" if r == 0 else f"{rng.choice(WORDS)} {rng.randint(1, 10_000)}"
+    doc.save(path)
+
+
+def make_xlsx(path: Path, rng: random.Random, sheets: int, rows: int) -> None:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for sheet_no in range(sheets):
+        ws = wb.create_sheet(f"Sheet{sheet_no + 1}")
+        ws.append(["Mã", "Tên", "Số lượng", "Đơn giá", "Ghi chú"])
+        for row in range(rows):
+            ws.append([
+                f"SP{row:05d}", rng.choice(WORDS), rng.randint(1, 500),
+                round(rng.uniform(1_000, 1_000_000), 2), _sentence(rng, 3, 8),
+            ])
+    wb.save(path)
+
+
+def make_pptx(path: Path, rng: random.Random, slides: int) -> None:
+    from pptx import Presentation
+
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for slide_no in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {slide_no + 1}: {rng.choice(WORDS)}"
+        slide.placeholders[1].text = "\n".join(_sentence(rng) for _ in range(5))
+    prs.save(path)
+
+
+def make_json(path: Path, rng: random.Random, records: int) -> None:
+    data = {
+        "records": [
+            {
+                "id": i,
+                "name": rng.choice(WORDS),
+                "amount": rng.randint(1, 1_000_000),
+                "tags": [rng.choice(WORDS) for _ in range(3)],
+                "detail": {"note": _sentence(rng), "active": rng.random() > 0.5},
+            }
+            for i in range(records)
+        ]
+    }
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def make_txt(path: Path, rng: random.Random, paragraphs: int) -> None:
+    buffer = io.StringIO()
+    for _ in range(paragraphs):
+        buffer.write(_paragraph(rng, 6))
+        buffer.write("\n\n")
+    path.write_text(buffer.getvalue(), encoding="utf-8")
+
+
+def generate_corpus(out_dir: Path = DEFAULT_CORPUS_DIR, scale: float = 1.0, seed: int = 42) -> List[Dict]:
+    """Sinh corpus và trả về manifest [{name, path, kind, ext, size}]."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def n(value: int) -> int:
+        return max(1, int(value * scale))
+
+    specs = [
+        ("native_pdf_40p.pdf", "native_pdf", lambda p, r: make_native_pdf(p, r, n(40))),
+        ("scanned_pdf_8p.pdf", "scanned_pdf", lambda p, r: make_scanned_pdf(p, r, n(8))),
+        ("large_docx_tables.docx", "docx", lambda p, r: make_docx(p, r, n(40))),
+        ("many_sheets.xlsx", "xlsx", lambda p, r: make_xlsx(p, r, n(20), n(300))),
+        ("deck.pptx", "pptx", lambda p, r: make_pptx(p, r, n(40))),
+        ("big.json", "json", lambda p, r: make_json(p, r, n(5_000))),
+        ("big.txt", "txt", lambda p, r: make_txt(p, r, n(3_000))),
+    ]
+
+    manifest = []
+    for file_name, kind, builder in specs:
+        path = out_dir / file_name
+        # Mỗi file có seed riêng -> thêm/bớt file không làm đổi nội dung file khác
+        builder(path, random.Random(f"{seed}:{file_name}"))
+        manifest.append({
+            "name": file_name,
+            "path": str(path),
+            "kind": kind,
+            "ext": path.suffix.lstrip("."),
+            "size": path.stat().st_size,
+        })
+
+    payload = {"scale": scale, "seed": seed, "files": manifest}
+    (out_dir / "manifest.json").write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    return manifest
+
+
+def load_or_generate(out_dir: Path = DEFAULT_CORPUS_DIR, scale: float = 1.0, seed: int = 42) -> List[Dict]:
+    manifest_path = out_dir / "manifest.json"
+    if manifest_path.exists():
+        payload = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if not isinstance(payload, dict):
+            payload = {}
+        manifest = payload.get("files", [])
+        # Chỉ dùng lại corpus cũ nếu cùng tham số sinh
+        same_params = payload.get("scale") == scale and payload.get("seed") == seed
+        if same_params and all(Path(item["path"]).exists() for item in manifest):
+            return manifest
+    return generate_corpus(out_dir, scale, seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=str(DEFAULT_CORPUS_DIR))
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for item in generate_corpus(Path(args.out), args.scale, args.seed):
+        print(f"{item['size'] / 1024:10.1f} KB  {item['name']}")
+
+
+if __name__ == "__main__":
+    main()
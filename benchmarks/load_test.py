@@ -0,0 +1,146 @@
+"""Load test in-process cho ``/sdlc/convert-document`` với traffic hỗn hợp.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 200
+    python -m benchmarks.load_test --duration 60 --mix native_pdf=5,scanned_pdf=1,docx=3,xlsx=2,txt=5
+
+App được gọi trực tiếp qua ``httpx.ASGITransport`` (không qua mạng) nên kết quả phản ánh
+middleware, lane HEAVY/LIGHT (429 khi quá tải) và parser. Result/part/OCR cache bị tắt (mỗi loại
+file luôn gửi cùng bytes, bật cache thì chỉ đo cache hit); ``--with-caches`` để đo cả cache.
+Cần ``pip install httpx``.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks._common import configure_caches, environment, latency_summary, write_results
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, load_or_generate
+
+DEFAULT_MIX = "native_pdf=4,scanned_pdf=1,docx=3,xlsx=2,pptx=2,json=2,txt=4"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_load(corpus: List[Dict], mix: Dict[str, float], concurrency: int,
+                   total_requests: int, duration: float, seed: int) -> Dict:
+    import httpx
+
+    from app.main import app
+
+    files = {item["kind"]: (item["name"], Path(item["path"]).read_bytes()) for item in corpus}
+    kinds = [kind for kind in mix if kind in files]
+    if not kinds:
+        raise ValueError("Mix không khớp với loại file nào trong corpus")
+    weights = [mix[kind] for kind in kinds]
+    rng = random.Random(seed)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_kind():
+        nonlocal issued
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        if deadline is None and issued >= total_requests:
+            return None
+        issued += 1
+        return rng.choices(kinds, weights)[0]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def worker():
+            while (kind := next_kind()) is not None:
+                name, content = files[kind]
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/sdlc/convert-document", files={"file": (name, content)})
+                    status = response.status_code
+                except Exception:
+                    status = "error"
+                elapsed = time.perf_counter() - started
+                statuses[kind][status] += 1
+                if status == 200:
+                    latencies[kind].append(elapsed)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_time = time.perf_counter() - started_at
+
+    all_ok = [v for values in latencies.values() for v in values]
+    total_status = Counter()
+    for counter in statuses.values():
+        total_status.update(counter)
+
+    return {
+        "wall_time_s": round(wall_time, 3),
+        "requests": issued,
+        "throughput_rps": round(issued / wall_time, 3) if wall_time else None,
+        "success_rps": round(len(all_ok) / wall_time, 3) if wall_time else None,
+        "status": {str(k): v for k, v in total_status.items()},
+        "latency_ok": latency_summary(all_ok),
+        "per_kind": {
+            kind: {
+                "status": {str(k): v for k, v in statuses[kind].items()},
+                "latency_ok": latency_summary(latencies[kind]),
+            }
+            for kind in kinds
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS_DIR))
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="kind=weight,... ")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Tổng số request (bỏ qua nếu có --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Chạy trong N giây")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/)")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Giữ result/part/OCR cache (mặc định tắt để đo parse thật)")
+    args = parser.parse_args()
+    configure_caches(args.with_caches)
+
+    corpus = load_or_generate(Path(args.corpus), args.scale, args.seed)
+    mix = parse_mix(args.mix)
+    result = asyncio.run(run_load(corpus, mix, args.concurrency, args.requests, args.duration, args.seed))
+
+    print(f"requests={result['requests']} wall={result['wall_time_s']}s "
+          f"rps={result['throughput_rps']} ok_rps={result['success_rps']} status={result['status']}")
+    for kind, stats in result["per_kind"].items():
+        lat = stats["latency_ok"]
+        print(f"  {kind:<12} p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms status={stats['status']}")
+
+    path = write_results("load", {
+        "kind": "load",
+        "environment": environment(),
+        "params": {
+            "mix": mix, "concurrency": args.concurrency, "requests": args.requests,
+            "duration": args.duration, "scale": args.scale, "seed": args.seed,
+            "caches": args.with_caches,
+        },
+        "results": result,
+    }, args.output)
+    print(f"\n💾 Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
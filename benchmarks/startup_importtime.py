@@ -0,0 +1,136 @@
+"""Benchmark thời gian khởi động (cold start) của service.
+
+Chạy mỗi kịch bản trong một process Python mới với ``-X importtime`` để đo:
+- Thời gian import ``app.main`` (worker uvicorn khi vừa start)
+- Thời gian warm-up từng parser (import lần đầu các dependency nặng)
+- Peak RSS của process sau khi import
+
+Ví dụ:
+    python benchmarks/startup_importtime.py --top 15
+    python benchmarks/startup_importtime.py --output startup.json --baseline old.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Script chạy trong process con: thực hiện import rồi in peak RSS (KB) ra stdout
+_CHILD_SNIPPET = """
+import resource, sys
+{body}
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+SCENARIOS: Dict[str, str] = {
+    "app.main": "import app.main",
+}
+for _ext in ("pdf", "docx", "pptx", "xlsx", "txt", "json", "md"):
+    SCENARIOS[f"warmup:{_ext}"] = (
+        "import app.main\n"
+        "from app.services.parser_factory import ParserFactory\n"
+        f"ParserFactory.warm_up(['{_ext}'])"
+    )
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parse output của ``-X importtime`` thành list {module, self_us, cumulative_us}."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+            rows.append({
+                "module": module.strip(),
+                "depth": (len(module) - len(module.lstrip())) // 2,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+            })
+        except ValueError:
+            continue
+    return rows
+
+
+def run_scenario(name: str, body: str) -> Dict:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_SNIPPET.format(body=body)],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario '{name}' failed:\n{proc.stderr[-2000:]}")
+
+    rows = parse_importtime(proc.stderr)
+    # Tổng thời gian = tổng cumulative của các module top-level (depth 0)
+    total_us = sum(r["cumulative_us"] for r in rows if r["depth"] == 0)
+    peak_rss_kb = int(proc.stdout.strip().splitlines()[-1])
+    return {
+        "name": name,
+        "total_import_ms": round(total_us / 1000, 2),
+        "peak_rss_mb": round(peak_rss_kb / 1024, 2),
+        "module_count": len(rows),
+        "top_modules": sorted(rows, key=lambda r: r["self_us"], reverse=True),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        old = baseline.get(name)
+        if not old or not old.get("total_import_ms"):
+            continue
+        ratio = current["total_import_ms"] / old["total_import_ms"] - 1
+        if ratio > max_regression:
+            regressions.append(
+                f"{name}: {old['total_import_ms']}ms -> {current['total_import_ms']}ms (+{ratio:.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="Số module chậm nhất cần hiển thị")
+    parser.add_argument("--scenario", action="append", help="Chỉ chạy các kịch bản chỉ định")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File JSON kết quả cũ để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Ngưỡng regression cho phép (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    names = args.scenario or list(SCENARIOS)
+    results = {}
+    for name in names:
+        result = run_scenario(name, SCENARIOS[name])
+        result["top_modules"] = result["top_modules"][: args.top]
+        results[name] = result
+
+        print(f"\n== {name}: {result['total_import_ms']} ms, peak RSS {result['peak_rss_mb']} MB, "
+              f"{result['module_count']} modules")
+        for row in result["top_modules"]:
+            print(f"  {row['self_us'] / 1000:9.2f} ms  {row['cumulative_us'] / 1000:9.2f} ms  {row['module']}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n💾 Đã ghi kết quả: {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("\n❌ Startup regression:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\n✅ Không có regression so với baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())